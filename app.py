@@ -1,232 +1,661 @@
+import contextvars
 import os
-from flask import Flask, request, jsonify, send_from_directory, render_template
+import threading
+from concurrent.futures import ThreadPoolExecutor
+import click
+from flask import Flask, request, jsonify, render_template, Response, stream_with_context, url_for, g
 from werkzeug.utils import secure_filename
-import importlib
 from config import Config
-from langchain.chains import ConversationalRetrievalChain, LLMChain
-from langchain.memory import ConversationBufferMemory
-from langchain.prompts import PromptTemplate
-from langchain.prompts import ChatPromptTemplate
-from langchain.schema.runnable import RunnablePassthrough
-from langchain.schema.output_parser import StrOutputParser
-from langchain_community.vectorstores import FAISS
-from langchain_community.embeddings import HuggingFaceEmbeddings
-from langchain.text_splitter import CharacterTextSplitter
-from langchain.schema import Document
-import PyPDF2
-import re
+from lazy import Lazy
+from sources.fanout import fetch_all
+from sources.cache import SourceCache, CachedSourceHandler, normalize_query
+from sources.registry import SourceRegistry
+from knowledge_base import default_knowledge_base, assign_document_ids, chunk_id, source_document
+from embedding_service import default_embedding_service
+from llm_cache import ResponseCache, CachedChatModel, SemanticCache, SemanticCachedRunnable
+from sessions import SessionRegistry, new_session_id, valid_session_id
+from jobs import JobManager, QueueFullError, DONE, FAILED, CANCELLED
+from chunking import Chunker
+from context_packing import ContextPacker
+from observability import (registry, stage, MeteredChatModel, cache_collector, install_log_request_ids,
+                           set_request_id, reset_request_id, get_request_id, HTTP_REQUESTS, HTTP_SECONDS)
+from pdf_ingest import PageCache, save_upload, iter_pdf_pages
+from prescription import read_prescription, extract_drug_names, ImageTooLargeError
+from formatting import (parse_summary, format_summary, format_chat_response, format_prescription_analysis,
+                        truncate_words, ChatResponseFormatter)
+from langchain_core.prompts import ChatPromptTemplate
+from langchain_core.runnables import RunnablePassthrough
+from langchain_core.output_parsers import StrOutputParser
+import json
 import logging
+import time
 
 app = Flask(__name__, static_url_path='/static', static_folder='static')
 app.config.from_object(Config)
 
-# Set up logging
-logging.basicConfig(level=logging.INFO)
+# Set up logging, tagging every line with the ID of the request it belongs to
+install_log_request_ids()
+logging.basicConfig(level=logging.INFO, format="%(asctime)s %(levelname)s [%(request_id)s] %(name)s: %(message)s")
 
 # Ensure upload directory exists
 app.config['UPLOAD_FOLDER'] = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'uploads')
 os.makedirs(app.config['UPLOAD_FOLDER'], exist_ok=True)
 
-# Initialize LLM
-if Config.LLM_CHOICE == 'ollama':
-    from langchain_ollama import ChatOllama
-    llm = ChatOllama(model=Config.OLLAMA_MODEL, max_tokens=Config.MAX_TOKENS, temperature=0)
-elif Config.LLM_CHOICE == 'claude':
-    import boto3
-    from langchain_aws import ChatBedrock
-    bedrock_client = boto3.client(service_name='bedrock-runtime', region_name=Config.AWS_REGION)
-    llm = ChatBedrock(
-        model_id=Config.CLAUDE_MODEL_ID, 
-        client=bedrock_client,
-        model_kwargs={"max_tokens_to_sample": Config.MAX_TOKENS}
+# Cache LLM responses: exact prompt matches, plus optional reuse for similar questions
+llm_response_cache = ResponseCache()
+
+def create_llm_client():
+    if Config.LLM_CHOICE == 'ollama':
+        from langchain_ollama import ChatOllama
+        llm = ChatOllama(model=Config.OLLAMA_MODEL, num_predict=Config.MAX_TOKENS, num_ctx=Config.context_window(),
+                         temperature=0)
+    elif Config.LLM_CHOICE == 'claude':
+        import boto3
+        from langchain_aws import ChatBedrock
+        bedrock_client = boto3.client(service_name='bedrock-runtime', region_name=Config.AWS_REGION)
+        llm = ChatBedrock(
+            model_id=Config.CLAUDE_MODEL_ID, 
+            client=bedrock_client,
+            model_kwargs={"max_tokens_to_sample": Config.MAX_TOKENS}
+        )
+    else:
+        raise ValueError(f"Unsupported LLM choice: {Config.LLM_CHOICE}")
+    app.logger.info(f"Initialized {Config.LLM_CHOICE} LLM client")
+    return llm
+
+def build_llm(client=None):
+    """Wrap the configured (or given) chat model with metrics and the response cache."""
+    llm = MeteredChatModel(client if client is not None else create_llm_client())
+    if Config.LLM_CACHE_ENABLED:
+        llm = CachedChatModel(llm, llm_response_cache)
+    return llm
+
+# LLM client and semantic cache are built on first use
+llm = Lazy(build_llm)
+semantic_cache = Lazy(lambda: SemanticCache(default_embedding_service.get()) if Config.SEMANTIC_CACHE_ENABLED else None)
+
+def with_semantic_cache(prompt, model, question_key, docs_key, scope):
+    answer_chain = prompt | model | StrOutputParser()
+    cache = semantic_cache.get()
+    if cache is None:
+        return answer_chain
+    return SemanticCachedRunnable(answer_chain, cache, question_key, docs_key, scope, doc_id=chunk_id, model=model)
+
+def cache_config(use_cache):
+    return None if use_cache else {"configurable": {"cache_bypass": True}}
+
+# Fits retrieved chunks into the model's context window with citation numbers
+context_packer = ContextPacker()
+
+def pack_context(docs, template, question, label):
+    with stage("pack"):
+        return context_packer.pack(docs, template, question, label=label).text
+
+def make_conversation_chain(retriever):
+    chat_prompt = ChatPromptTemplate.from_template(Config.CHAT_RESPONSE_PROMPT)
+    answer_chain = with_semantic_cache(chat_prompt, llm.get(), "question", "docs", "chat")
+    return (
+        RunnablePassthrough.assign(docs=lambda x: retriever.invoke(x["question"]))
+        | RunnablePassthrough.assign(
+            context=lambda x: pack_context(x["docs"], Config.CHAT_RESPONSE_PROMPT, x["question"], "chat"))
+        | answer_chain
     )
-else:
-    raise ValueError(f"Unsupported LLM choice: {Config.LLM_CHOICE}")
 
-# Initialize conversation chain
-conversation_chain = None
+# Per-session knowledge bases and conversation chains
+session_registry = SessionRegistry(chain_factory=make_conversation_chain)
+
+# Background knowledge-base builds
+BUILD_STAGES = ["extracting", "fetching", "embedding", "indexing", "summarizing"]
+job_manager = JobManager()
+
+# Extracted PDF text, keyed by file SHA-256
+pdf_page_cache = PageCache(Config.PDF_CACHE_PATH)
 
-# Pluggable source handlers
-source_handlers = {}
+# OCR text of prescription images, keyed by image SHA-256 and OCR backend
+ocr_cache = PageCache(Config.OCR_CACHE_PATH)
+
+# Pluggable source handlers, imported on first request for each source
+source_cache = Lazy(lambda: SourceCache(Config.SOURCE_CACHE_PATH) if Config.SOURCE_CACHE_ENABLED else None)
+
+def wrap_source_handler(source, handler):
+    cache = source_cache.get()
+    if cache is None:
+        return handler
+    return CachedSourceHandler(
+        handler,
+        source,
+        cache,
+        ttl=Config.SOURCE_CACHE_TTLS.get(source, Config.SOURCE_CACHE_TTL),
+        negative_ttl=Config.SOURCE_CACHE_NEGATIVE_TTL,
+    )
+
+source_handlers = SourceRegistry(wrap=wrap_source_handler)
 
 def load_source_handlers():
     for source in Config.ENABLED_SOURCES:
-        try:
-            module = importlib.import_module(f"sources.{source}_handler")
-            handler_name = ''.join(word.capitalize() for word in source.split('_')) + 'Handler'
-            source_handlers[source] = getattr(module, handler_name)()
-        except ImportError:
-            app.logger.warning(f"Handler for source '{source}' not found.")
-        except AttributeError as e:
-            app.logger.error(f"Error loading handler for source '{source}': {e}")
+        source_handlers.register(source)
 
 load_source_handlers()
 
+def warm_up():
+    """Build everything that is otherwise created on the first request."""
+    Config.init_app()
+    for source in source_handlers.names():
+        source_handlers.get(source)
+    steps = [
+        ("LLM client", llm.get),
+        ("embedding model", lambda: default_embedding_service.get().model),
+        ("vector store", lambda: default_knowledge_base.get().vector_store),
+    ]
+    for name, step in steps:
+        try:
+            step()
+        except Exception as e:
+            app.logger.error(f"Warm-up of {name} failed: {str(e)}")
+    app.logger.info("Warm-up complete")
+
+@app.cli.command("warm-up")
+def warm_up_command():
+    """Load source handlers, the LLM client, embeddings and the vector store."""
+    warm_up()
+
+@app.cli.command("build-batch")
+@click.argument("queries", type=click.File("r"))
+@click.option("--source", "sources", multiple=True, help="Source to search (repeatable); defaults to all enabled sources.")
+@click.option("--output", "-o", type=click.File("w"), default="-", help="JSONL file for the results; defaults to stdout.")
+@click.option("--no-cache", is_flag=True, help="Do not reuse cached LLM responses.")
+def build_batch_command(queries, sources, output, no_cache):
+    """Build knowledge bases for every line of QUERIES: a query, or a JSON object with "query"."""
+    try:
+        items = []
+        for line in queries:
+            line = line.strip()
+            if line:
+                items.append(json.loads(line) if line.startswith("{") else line)
+        items = parse_batch_items(items, list(sources) or None)
+    except ValueError as e:
+        raise click.UsageError(str(e))
+    for record in build_knowledge_base_batch(items, not no_cache):
+        output.write(json.dumps(record) + "\n")
+        output.flush()
+        if record["type"] == "stats":
+            click.echo(f"{record['succeeded']} of {record['queries']} queries built in {record['elapsed']}s "
+                       f"({record['queries_per_second']} queries/s, {record['shared_fetches']} shared fetches)",
+                       err=True)
+
+_setup_lock = threading.Lock()
+_setup_pid = None
+
+def create_app():
+    """Return the app ready to serve from this process.
+
+    For several worker processes, call it in each worker after the fork, e.g.
+    ``gunicorn -w 4 -k gthread --threads 8 'app:create_app()'`` without
+    ``--preload``. Workers share the vector store, session indexes, source cache
+    and (with ``JOB_STORE_PATH`` set) job status on disk; the shared index is
+    memory-mapped, so its vectors sit once in the page cache.
+    """
+    global _setup_pid
+    with _setup_lock:
+        if _setup_pid != os.getpid():
+            _setup_pid = os.getpid()
+            os.makedirs(Config.VECTOR_STORE_PATH, exist_ok=True)
+            session_registry.purge_expired()
+            if Config.WARM_UP_ON_START:
+                threading.Thread(target=warm_up, name="warm-up", daemon=True).start()
+    return app
+
 def allowed_file(filename):
     return '.' in filename and filename.rsplit('.', 1)[1].lower() in Config.ALLOWED_EXTENSIONS
 
-def parse_summary(summary_text):
-    sections = {
-        'Key words': r'Key words:(.*?)(?=\n\d\.)',
-        'Date range': r'Date range:(.*?)(?=\n\d\.)',
-        'Type of articles reviewed': r'Type of articles reviewed:(.*?)(?=\n\d\.)',
-        'Summary': r'Summary:(.*?)(?=\n\d\.)',
-        'Recommended approach': r'Recommended approach:(.*?)(?=\n\d\.)',
-        'Label Information': r'Label Information:(.*?)(?=\n\d\.)',
-        'References': r'References:(.*?)$'
-    }
-    
-    parsed = {}
-    for key, pattern in sections.items():
-        match = re.search(pattern, summary_text, re.DOTALL)
-        if match:
-            content = match.group(1).strip()
-            if key in ['Recommended approach', 'References']:
-                parsed[key] = [item.strip() for item in re.split(r'\s*•\s*', content) if item.strip()]
-            else:
-                parsed[key] = content
-    
-    return parsed
+def sse_event(event, data):
+    return f"event: {event}\ndata: {json.dumps(data)}\n\n"
+
+def sse_response(events):
+    response = Response(stream_with_context(sse_event(event, data) for event, data in events),
+                        mimetype='text/event-stream')
+    response.headers['Cache-Control'] = 'no-cache'
+    response.headers['X-Accel-Buffering'] = 'no'
+    return response
+
+def progress(stage, message):
+    app.logger.info(message)
+    return "progress", {"stage": stage, "message": message}
 
 @app.route('/')
 def home():
     return render_template('index.html')
 
-@app.route('/api/build_kb', methods=['POST'])
-def build_knowledge_base():
-    try:
-        query = request.form.get('query')
-        sources = request.form.getlist('sources')
-        
-        documents = []
-        articles_reviewed = 0
-        
-        # Process PDF if uploaded
-        if 'pdf' in request.files:
-            pdf_file = request.files['pdf']
-            if pdf_file and allowed_file(pdf_file.filename):
-                filename = secure_filename(pdf_file.filename)
-                filepath = os.path.join(app.config['UPLOAD_FOLDER'], filename)
-                
-                # Save the file
-                pdf_file.save(filepath)
-                app.logger.info(f"File saved to {filepath}")
-                
-                # Extract text from PDF
-                try:
-                    with open(filepath, 'rb') as file:
-                        reader = PyPDF2.PdfReader(file)
-                        for i, page in enumerate(reader.pages):
-                            text = page.extract_text()
-                            documents.append(Document(page_content=text, metadata={"source": "pdf", "page": i+1}))
-                    articles_reviewed += 1  # Count the PDF as one article
-                    app.logger.info(f"Processed 1 PDF with {len(reader.pages)} pages")
-                except Exception as e:
-                    app.logger.error(f"Error processing PDF: {str(e)}")
-                    return jsonify(error=f"Error processing PDF: {str(e)}"), 500
-            else:
-                app.logger.warning("Invalid file or file type")
+def index_documents(documents, chunker, chunk_ids, stats):
+    """Split documents and add them to the shared knowledge base in batches as they arrive.
+
+    IDs of the indexed chunks are appended to ``chunk_ids``; ``stats`` collects
+    document and chunk counts.
+    """
+    knowledge_base = default_knowledge_base.get()
+    batch = []
+
+    def flush():
+        if batch:
+            index_stats = knowledge_base.add_documents(batch)
+            chunk_ids.extend(index_stats['ids'])
+            stats['added'] += index_stats['added']
+            stats['skipped'] += index_stats['skipped']
+            batch.clear()
+
+    for doc in documents:
+        with stage("split"):
+            batch.extend(chunker.split_documents(assign_document_ids([doc])))
+        stats['documents'] += 1
+        if len(batch) >= Config.INDEX_BATCH_SIZE:
+            flush()
+    flush()
+
+def save_pdf_uploads(pdf_files):
+    """Save uploaded PDFs so they can be processed after the request has ended."""
+    uploads = []
+    for pdf_file in pdf_files:
+        if not (pdf_file and allowed_file(pdf_file.filename)):
+            app.logger.warning("Invalid file or file type")
+            continue
+        filepath, sha256 = save_upload(pdf_file, app.config['UPLOAD_FOLDER'])
+        app.logger.info(f"File saved to {filepath}")
+        uploads.append({"path": filepath, "sha256": sha256, "filename": secure_filename(pdf_file.filename)})
+    return uploads
+
+def select_handlers(sources):
+    handlers = {}
+    for source in sources:
+        handler = source_handlers.get(source)
+        if handler is not None:
+            handlers[source] = handler
         else:
-            app.logger.info("No PDF file uploaded")
-
-        # Fetch data from selected sources
-        for source in sources:
-            if source in source_handlers:
-                try:
-                    source_docs = source_handlers[source].fetch_data(query)
-                    documents.extend([Document(page_content=doc, metadata={"source": source}) for doc in source_docs])
-                    articles_reviewed += len(source_docs)  # Count articles from each source
-                    app.logger.info(f"Retrieved {len(source_docs)} documents from {source}")
-                except Exception as e:
-                    app.logger.error(f"Error fetching data from {source}: {str(e)}")
-            else:
-                app.logger.warning(f"No handler available for source '{source}'")
-        
-        app.logger.info(f"Total documents retrieved: {len(documents)}")
-        app.logger.info(f"Total articles reviewed: {articles_reviewed}")
+            app.logger.warning(f"No handler available for source '{source}'")
+    return handlers
 
-        if not documents:
-            return jsonify({
-                "message": "No relevant documents found",
-                "summary": "Unable to generate summary due to lack of relevant documents.",
-                "articles_reviewed": 0
-            }), 200
-        
-        # Create vector store
-        text_splitter = CharacterTextSplitter(chunk_size=1000, chunk_overlap=0)
-        split_docs = text_splitter.split_documents(documents)
-        embeddings = HuggingFaceEmbeddings(model_name="all-MiniLM-L6-v2")
-        vector_store = FAISS.from_documents(split_docs, embeddings)
-        vector_store.save_local(Config.VECTOR_STORE_PATH)
-        
-        # Generate summary
-        summary_prompt = ChatPromptTemplate.from_template(Config.GENERATE_SUMMARY_PROMPT)
-        summary_chain = summary_prompt | llm | StrOutputParser()
-        retriever = vector_store.as_retriever()
-        relevant_docs = retriever.invoke(query)
-        summary = summary_chain.invoke({"context": "\n".join([doc.page_content for doc in relevant_docs]), "query": query})
+def fetch_documents(query, handlers):
+    """Fetch ``query`` from ``handlers`` concurrently. Returns ``(documents, partial_sources)``."""
+    source_results = fetch_all(
+        handlers,
+        query,
+        timeout=Config.SOURCE_TIMEOUT,
+        timeouts=Config.SOURCE_TIMEOUTS,
+        deadline=Config.SOURCE_FETCH_DEADLINE,
+    )
+    documents = []
+    partial_sources = []
+    for source, result in source_results.items():
+        if result.ok:
+            documents.extend([source_document(record, source) for record in result.documents])
+            app.logger.info(f"Retrieved {len(result.documents)} documents from {source} in {result.elapsed:.2f}s")
+        else:
+            partial_sources.append(source)
+            app.logger.error(f"Error fetching data from {source} ({result.status}): {result.error}")
+    return documents, partial_sources
+
+def make_summary_chain():
+    summary_prompt = ChatPromptTemplate.from_template(Config.GENERATE_SUMMARY_PROMPT)
+    return with_semantic_cache(summary_prompt, llm.get(), "query", "docs", "summary")
 
+def summary_input(session, query):
+    relevant_docs = session.retriever.invoke(query)
+    context = pack_context(relevant_docs, Config.GENERATE_SUMMARY_PROMPT, query, "summary")
+    return {"context": context, "query": query, "docs": relevant_docs}
+
+def no_documents_result(partial_sources):
+    return {
+        "message": "No relevant documents found",
+        "summary": "Unable to generate summary due to lack of relevant documents.",
+        "articles_reviewed": 0,
+        "partial_sources": partial_sources
+    }
+
+def summary_result(query, summary, session_id, articles_reviewed, partial_sources, chunking):
+    with stage("format"):
         # Truncate summary if it exceeds MAX_TOKENS
-        if len(summary.split()) > Config.MAX_TOKENS:
-            summary = ' '.join(summary.split()[:Config.MAX_TOKENS]) + '...'
-        
-        # Parse the summary
-        parsed_summary = parse_summary(summary)
-        
-        # Parse the summary
+        summary = truncate_words(summary)
+
+        # Parse and format the summary
         parsed_summary = parse_summary(summary)
-        
-        formatted_summary = f"""
-        <h2>Summary</h2>
-        <p><strong>Query:</strong> {query}</p>
-        <p><strong>Key words:</strong> {parsed_summary.get('Key words', 'N/A')}</p>
-        <p><strong>Date range:</strong> {parsed_summary.get('Date range', 'N/A')}</p>
-        <p><strong>Number of articles reviewed:</strong> {articles_reviewed}</p>
-        <p><strong>Type of articles reviewed:</strong> {parsed_summary.get('Type of articles reviewed', 'N/A')}</p>
-        
-        <h3>Response:</h3>
-        <p>Dear Dr.,</p>
-        <p>{parsed_summary.get('Summary', 'N/A')}</p>
-        
-        <h3>Recommended approach:</h3>
-        <ul>
-        {"".join(f"<li>{rec.strip()}</li>" for rec in parsed_summary.get('Recommended approach', []) if rec.strip())}
-        </ul>
-        
-        <h3>Label Information:</h3>
-        <p>{parsed_summary.get('Label Information', 'N/A')}</p>
-        
-        <p><em>The information mentioned above may be outside of the current label indication for Product X in [country] and has been provided following an unsolicited request for information from a treating physician. Company ABC is providing this information as a scientific service further to an unsolicited request and not in a promotional context.</em></p>
-        """
-
-        # Always include the References section, even if it's empty
-        formatted_summary += """
-        <h3>References:</h3>
-        <ol>
-        """
-        if parsed_summary.get('References'):
-            formatted_summary += "".join(f"<li>{ref.strip()}</li>" for ref in parsed_summary['References'] if ref.strip() and ref.strip() != '[N/A]')
-        else:
-            formatted_summary += "<li>No references available</li>"
-        formatted_summary += "</ol>"
-        
-        # Initialize conversation chain
-        global conversation_chain
-        chat_prompt = ChatPromptTemplate.from_template(Config.CHAT_RESPONSE_PROMPT)
-        conversation_chain = RunnablePassthrough.assign(context=lambda x: retriever.invoke(x["question"])) | chat_prompt | llm | StrOutputParser()
-        
-        return jsonify({
-            "message": "Knowledge base built successfully",
-            "summary": formatted_summary,
-            "articles_reviewed": articles_reviewed
-        }), 200
+        formatted_summary = format_summary(query, parsed_summary, articles_reviewed)
+
+    return {
+        "message": "Knowledge base built successfully",
+        "session_id": session_id,
+        "summary": formatted_summary,
+        "articles_reviewed": articles_reviewed,
+        "partial_sources": partial_sources,
+        "chunking": chunking
+    }
+
+def build_knowledge_base_events(query, sources, pdf_uploads, session_id, use_cache=True):
+    """Run the knowledge-base build, yielding ``(event, data)`` pairs as it goes.
+
+    Events are ``progress`` for each stage, ``token`` for streamed summary text,
+    and finally either ``result`` or ``error`` (with an HTTP ``status``).
+    """
+    articles_reviewed = 0
+    chunk_ids = []
+    stats = {"documents": 0, "added": 0, "skipped": 0}
+    chunker = Chunker()
+
+    # Process uploaded PDFs, embedding pages as they are extracted
+    if not pdf_uploads:
+        app.logger.info("No PDF file uploaded")
+    for upload in pdf_uploads:
+        filename = upload["filename"]
+        try:
+            yield progress("extracting", f"Extracting and embedding text from {filename}")
+            pages_before = stats['documents']
+            pages = iter_pdf_pages(upload["path"], upload["sha256"], filename, page_cache=pdf_page_cache)
+            index_documents(pages, chunker, chunk_ids, stats)
+            articles_reviewed += 1  # Count the PDF as one article
+            app.logger.info(f"Processed 1 PDF with {stats['documents'] - pages_before} pages")
+        except Exception as e:
+            app.logger.error(f"Error processing PDF: {str(e)}")
+            yield "error", {"error": f"Error processing PDF: {str(e)}", "status": 500}
+            return
+
+    # Fetch data from selected sources concurrently
+    selected_handlers = select_handlers(sources)
+    if selected_handlers:
+        yield progress("fetching", f"Fetching from {', '.join(selected_handlers)}")
+    documents, partial_sources = fetch_documents(query, selected_handlers)
+    articles_reviewed += len(documents)  # Count articles from each source
+
+    app.logger.info(f"Total documents retrieved: {stats['documents'] + len(documents)}")
+    app.logger.info(f"Total articles reviewed: {articles_reviewed}")
+
+    if not documents and not chunk_ids:
+        yield "result", no_documents_result(partial_sources)
+        return
+
+    # Add new documents to the persistent vector store
+    if documents:
+        yield progress("embedding", f"Embedding {len(documents)} documents")
+        index_documents(documents, chunker, chunk_ids, stats)
+    knowledge_base = default_knowledge_base.get()
+    app.logger.info(f"Knowledge base holds {len(knowledge_base)} chunks ({stats['added']} new, {stats['skipped']} already indexed)")
+    app.logger.info(f"Chunking: {chunker.stats['chunks']} chunks, {chunker.stats['chunks_saved']} saved by dropping "
+                    f"{chunker.stats['exact_duplicates']} exact and {chunker.stats['near_duplicates']} near duplicates")
+
+    chunk_ids = list(dict.fromkeys(chunk_ids))
+    yield progress("indexing", f"Indexing {len(chunk_ids)} chunks for this session")
+    vector_store = knowledge_base.subset(chunk_ids)
+    if vector_store is None:
+        # Every document was empty, so nothing was indexed
+        yield "result", no_documents_result(partial_sources)
+        return
+    session = session_registry.put(session_id, vector_store)
+
+    # Generate summary
+    yield progress("summarizing", "Generating summary")
+    summary = ""
+    for token in make_summary_chain().stream(summary_input(session, query), cache_config(use_cache)):
+        summary += token
+        yield "token", {"text": token}
+
+    yield "result", summary_result(query, summary, session_id, articles_reviewed, partial_sources, chunker.stats)
+
+def string_list(value, name):
+    if value is None:
+        return None
+    if not isinstance(value, list) or not all(isinstance(item, str) for item in value):
+        raise ValueError(f"{name} must be a list of strings")
+    return value
+
+def parse_batch_items(items, default_sources=None, limit=None):
+    """Normalize batch input: query strings or objects with ``query`` and optional ``sources`` and ``session_id``.
+
+    Raises ``ValueError`` for input of the wrong shape.
+    """
+    if not isinstance(items, list) or not items:
+        raise ValueError("No queries provided")
+    if limit and len(items) > limit:
+        raise ValueError(f"Too many queries: at most {limit} per batch")
+    default_sources = string_list(default_sources, "Sources")
+    parsed = []
+    for number, item in enumerate(items, 1):
+        if isinstance(item, str):
+            item = {"query": item}
+        if not isinstance(item, dict):
+            raise ValueError(f"Query {number} must be a string or an object")
+        query = item.get("query")
+        if not isinstance(query, str) or not query.strip():
+            raise ValueError(f"Query {number} is empty")
+        sources = string_list(item.get("sources"), f"Sources of query {number}")
+        session_id = item.get("session_id")
+        if session_id is not None and not isinstance(session_id, str):
+            raise ValueError(f"Session ID of query {number} must be a string")
+        parsed.append({
+            "query": query.strip(),
+            "sources": list(sources or default_sources or Config.ENABLED_SOURCES),
+            "session_id": session_id if valid_session_id(session_id) else new_session_id(),
+        })
+    return parsed
+
+def build_knowledge_base_batch(items, use_cache=True):
+    """Build a knowledge base and summary for each batch item, yielding JSON-ready records.
+
+    Work is shared across the batch: each distinct query is fetched once from
+    every source any item asks for, chunks from all queries are embedded and
+    indexed together ``INDEX_BATCH_SIZE`` at a time, and summaries go through
+    the summary chain's batch API with at most ``BATCH_LLM_CONCURRENCY`` LLM
+    calls in flight. A ``result`` (or ``error``) record is yielded for each item
+    as soon as it is done, then one ``stats`` record for the whole batch.
+    """
+    started = time.perf_counter()
+    timings = {}
+    stats = {"queries": len(items), "succeeded": 0, "failed": 0, "documents": 0, "chunks": 0, "added": 0,
+             "skipped": 0}
+
+    def record(kind, index, **data):
+        stats["succeeded" if kind == "result" else "failed"] += 1
+        return {"type": kind, "index": index, "query": items[index]["query"], **data,
+                "elapsed": round(time.perf_counter() - started, 3)}
+
+    # Fetch each distinct query once, several queries at a time
+    phase = time.perf_counter()
+    groups = {}
+    for item in items:
+        query, sources = groups.get(normalize_query(item["query"]), (item["query"], []))
+        groups[normalize_query(item["query"])] = (query, list(dict.fromkeys(sources + item["sources"])))
+    with ThreadPoolExecutor(max_workers=Config.BATCH_FETCH_CONCURRENCY) as executor:
+        futures = {
+            key: executor.submit(contextvars.copy_context().run, fetch_documents, query, select_handlers(sources))
+            for key, (query, sources) in groups.items()
+        }
+    fetched = {}
+    for key, future in futures.items():
+        try:
+            fetched[key] = future.result()
+        except Exception as e:
+            app.logger.error(f"Error fetching batch query '{groups[key][0]}': {str(e)}")
+            fetched[key] = e
+    stats["fetches"] = len(groups)
+    stats["shared_fetches"] = len(items) - len(groups)
+    timings["fetch"] = time.perf_counter() - phase
+
+    # Split each item's documents, then embed and index the distinct chunks of all items together
+    phase = time.perf_counter()
+    prepared = []  # (item index, chunk IDs, articles reviewed, partial sources, chunking stats)
+    pending = {}
+    for i, item in enumerate(items):
+        result = fetched[normalize_query(item["query"])]
+        if isinstance(result, Exception):
+            yield record("error", i, error=f"Error fetching documents: {str(result)}")
+            continue
+        documents, partial_sources = result
+        documents = [doc for doc in documents if doc.metadata["source"] in item["sources"]]
+        partial_sources = [source for source in partial_sources if source in item["sources"]]
+        if not documents:
+            yield record("result", i, **no_documents_result(partial_sources))
+            continue
+        chunker = Chunker()
+        with stage("split"):
+            chunks = chunker.split_documents(assign_document_ids(documents))
+        ids = []
+        for chunk in chunks:
+            id_ = chunk_id(chunk)
+            ids.append(id_)
+            pending.setdefault(id_, chunk)
+        stats["documents"] += len(documents)
+        prepared.append((i, list(dict.fromkeys(ids)), len(documents), partial_sources, chunker.stats))
+
+    knowledge_base = default_knowledge_base.get()
+    chunks = list(pending.values())
+    stats["chunks"] = len(chunks)
+    for start in range(0, len(chunks), Config.INDEX_BATCH_SIZE):
+        index_stats = knowledge_base.add_documents(chunks[start:start + Config.INDEX_BATCH_SIZE])
+        stats["added"] += index_stats["added"]
+        stats["skipped"] += index_stats["skipped"]
+
+    inputs, ready = [], []
+    for i, ids, articles_reviewed, partial_sources, chunking in prepared:
+        try:
+            vector_store = knowledge_base.subset(ids)
+            if vector_store is None:
+                # Every document was empty, so nothing was indexed
+                yield record("result", i, **no_documents_result(partial_sources))
+                continue
+            session = session_registry.put(items[i]["session_id"], vector_store)
+            inputs.append(summary_input(session, items[i]["query"]))
+            ready.append((i, articles_reviewed, partial_sources, chunking))
+        except Exception as e:
+            app.logger.error(f"Error indexing batch query '{items[i]['query']}': {str(e)}")
+            yield record("error", i, error=f"Error indexing documents: {str(e)}")
+    timings["index"] = time.perf_counter() - phase
+
+    # Summarize with bounded LLM concurrency, reporting each summary as it completes
+    phase = time.perf_counter()
+    if inputs:
+        config = {**(cache_config(use_cache) or {}), "max_concurrency": Config.BATCH_LLM_CONCURRENCY}
+        for position, summary in make_summary_chain().batch_as_completed(inputs, config, return_exceptions=True):
+            i, articles_reviewed, partial_sources, chunking = ready[position]
+            if isinstance(summary, Exception):
+                app.logger.error(f"Error summarizing batch query '{items[i]['query']}': {str(summary)}")
+                yield record("error", i, error=f"Error generating summary: {str(summary)}")
+                continue
+            yield record("result", i, **summary_result(items[i]["query"], summary, items[i]["session_id"],
+                                                      articles_reviewed, partial_sources, chunking))
+    timings["summarize"] = time.perf_counter() - phase
+
+    elapsed = time.perf_counter() - started
+    stats.update({
+        "elapsed": round(elapsed, 3),
+        "queries_per_second": round(len(items) / elapsed, 3) if elapsed else None,
+        "llm_concurrency": Config.BATCH_LLM_CONCURRENCY,
+        "timings": {name: round(seconds, 3) for name, seconds in timings.items()},
+    })
+    app.logger.info(f"Batch of {len(items)} queries done in {elapsed:.2f}s: {stats}")
+    yield {"type": "stats", **stats}
+
+def build_kb_request_args():
+    session_id = request.form.get('session_id') or request.headers.get('X-Session-ID')
+    if not valid_session_id(session_id):
+        session_id = new_session_id()
+    return {
+        "query": request.form.get('query'),
+        "sources": request.form.getlist('sources'),
+        "pdf_uploads": save_pdf_uploads(request.files.getlist('pdf')),
+        "session_id": session_id,
+        "use_cache": not request.form.get('no_cache'),
+    }
+
+@app.route('/api/build_kb', methods=['POST'])
+def build_knowledge_base():
+    try:
+        args = build_kb_request_args()
+        job = job_manager.submit("build_kb", lambda: build_knowledge_base_events(**args), stages=BUILD_STAGES)
+    except QueueFullError as e:
+        return jsonify(error=str(e)), 503
     except Exception as e:
         app.logger.error(f"Error in build_knowledge_base: {str(e)}")
         return jsonify(error=f"An error occurred while building the knowledge base: {str(e)}"), 500
-    
+
+    response = jsonify({
+        "message": "Knowledge base build queued",
+        "job_id": job.id,
+        "session_id": args["session_id"],
+        "status_url": url_for('build_knowledge_base_status', job_id=job.id),
+    })
+    response.headers['Location'] = url_for('build_knowledge_base_status', job_id=job.id)
+    return response, 202
+
+@app.route('/api/build_kb/batch', methods=['POST'])
+def build_knowledge_base_batch_endpoint():
+    body = request.get_json(silent=True)
+    if not isinstance(body, dict):
+        return jsonify(error='Request body must be a JSON object with a "queries" list'), 400
+    try:
+        items = parse_batch_items(body.get('queries'), body.get('sources'), limit=Config.BATCH_MAX_QUERIES)
+    except ValueError as e:
+        return jsonify(error=str(e)), 400
+    use_cache = not body.get('no_cache')
+
+    def lines():
+        try:
+            for record in build_knowledge_base_batch(items, use_cache):
+                yield json.dumps(record) + "\n"
+        except Exception as e:
+            app.logger.error(f"Error in build_knowledge_base_batch: {str(e)}")
+            yield json.dumps({"type": "error", "error": f"An error occurred while building the batch: {str(e)}"}) + "\n"
+
+    response = Response(stream_with_context(lines()), mimetype='application/x-ndjson')
+    response.headers['X-Accel-Buffering'] = 'no'
+    return response
+
+@app.route('/api/build_kb/<job_id>', methods=['GET'])
+def build_knowledge_base_status(job_id):
+    job = job_manager.get(job_id)
+    if job is None:
+        return jsonify(error="Job not found"), 404
+    status = job.to_dict()
+    if job.status == DONE:
+        status["result"] = job.result
+    return jsonify(status), 200
+
+@app.route('/api/build_kb/<job_id>/result', methods=['GET'])
+def build_knowledge_base_result(job_id):
+    job = job_manager.get(job_id)
+    if job is None:
+        return jsonify(error="Job not found"), 404
+    if job.status == DONE:
+        return jsonify(job.result), 200
+    if job.status == FAILED:
+        return jsonify(error=f"An error occurred while building the knowledge base: {job.error}"), 500
+    if job.status == CANCELLED:
+        return jsonify(error="Job was cancelled"), 410
+    return jsonify(error=f"Job is {job.status}", status=job.status, stage=job.stage), 409
+
+@app.route('/api/build_kb/<job_id>', methods=['DELETE'])
+def cancel_build_knowledge_base(job_id):
+    job = job_manager.cancel(job_id)
+    if job is None:
+        return jsonify(error="Job not found"), 404
+    return jsonify(job.to_dict()), 200
+
+@app.route('/api/build_kb/stream', methods=['POST'])
+def build_knowledge_base_stream():
+    args = build_kb_request_args()
+
+    def events():
+        try:
+            yield from build_knowledge_base_events(**args)
+        except Exception as e:
+            app.logger.error(f"Error in build_knowledge_base_stream: {str(e)}")
+            yield "error", {"error": f"An error occurred while building the knowledge base: {str(e)}", "status": 500}
+
+    return sse_response(events())
+
+def chat_request_session():
+    session_id = request.json.get('session_id') or request.headers.get('X-Session-ID')
+    return session_registry.get(session_id)
+
 @app.route('/api/chat', methods=['POST'])
 def chat():
-    if not conversation_chain:
+    session = chat_request_session()
+    if not session:
         return jsonify({"error": "Knowledge base not built yet"}), 400
     
     user_message = request.json.get('message')
@@ -235,41 +664,192 @@ def chat():
     
     try:
         # Generate response
-        answer = conversation_chain.invoke({"question": user_message})
-        
-        # Truncate response if it exceeds MAX_TOKENS
-        if len(answer.split()) > Config.MAX_TOKENS:
-            answer = ' '.join(answer.split()[:Config.MAX_TOKENS]) + '...'
+        answer = session.chain.invoke({"question": user_message}, cache_config(not request.json.get('no_cache')))
         
-        # Parse and format the response
-        formatted_response = ""
-        sections = answer.split('\n\n')
-        
-        for section in sections:
-            if section.startswith("Direct Answer:"):
-                formatted_response += f"<p>{section.replace('Direct Answer:', '').strip()}</p>"
-            elif section.startswith("Key Points:"):
-                formatted_response += "<h3>Key Points:</h3><ul>"
-                points = [point.strip() for point in section.split('•')[1:] if point.strip()]
-                for point in points:
-                    formatted_response += f"<li>{point}</li>\n"
-                formatted_response += "</ul>"
-            elif section.startswith("Relevant References:"):
-                formatted_response += "<h3>Relevant References:</h3><ol>"
-                references = [ref.strip() for ref in section.split('\n')[1:] if ref.strip() and ref.strip() != '[N/A]']
-                if references:
-                    for ref in references:
-                        formatted_response += f"<li>{ref}</li>"
-                else:
-                    formatted_response += "<li>No relevant references available</li>"
-                formatted_response += "</ol>"
-            else:
-                formatted_response += f"<p>{section}</p>"
+        with stage("format"):
+            # Truncate response if it exceeds MAX_TOKENS
+            answer = truncate_words(answer)
+
+            # Parse and format the response
+            formatted_response = format_chat_response(answer)
 
         return jsonify({"response": formatted_response}), 200
     except Exception as e:
         app.logger.error(f"Error in chat: {str(e)}")
         return jsonify(error="An error occurred while processing your message. Please try again."), 500
+
+@app.route('/api/chat/stream', methods=['POST'])
+def chat_stream():
+    session = chat_request_session()
+    if not session:
+        return jsonify({"error": "Knowledge base not built yet"}), 400
+
+    user_message = request.json.get('message')
+    if not user_message:
+        return jsonify({"error": "No message provided"}), 400
+
+    config = cache_config(not request.json.get('no_cache'))
+
+    def events():
+        formatter = ChatResponseFormatter()
+        try:
+            for token in session.chain.stream({"question": user_message}, config):
+                text, sections = formatter.feed(token)
+                if text:
+                    yield "token", {"text": text}
+                for section in sections:
+                    yield "section", {"html": section}
+                if formatter.truncated:
+                    break
+            for section in formatter.finish():
+                yield "section", {"html": section}
+            yield "done", {}
+        except Exception as e:
+            app.logger.error(f"Error in chat_stream: {str(e)}")
+            yield "error", {"error": "An error occurred while processing your message. Please try again."}
+
+    return sse_response(events())
     
+def prescription_documents(drugs, session=None):
+    """Chunks about each drug, from the session's knowledge base if given, else the shared one.
+
+    Results for the drugs are interleaved so each gets a share of the context budget.
+    """
+    results = []
+    for drug in drugs:
+        if session is not None:
+            results.append(session.retriever.invoke(drug))
+            continue
+        store = default_knowledge_base.get().vector_store
+        if store is None:
+            return []
+        with stage("retrieve", scope="shared"):
+            results.append(store.similarity_search(drug, k=Config.PRESCRIPTION_RETRIEVAL_K))
+
+    documents, seen = [], set()
+    for rank in range(max((len(docs) for docs in results), default=0)):
+        for docs in results:
+            if rank < len(docs):
+                id_ = chunk_id(docs[rank])
+                if id_ not in seen:
+                    seen.add(id_)
+                    documents.append(docs[rank])
+    return documents
+
+@app.route('/api/analyze_prescription', methods=['POST'])
+def analyze_prescription():
+    from PIL import Image, UnidentifiedImageError
+
+    file = request.files.get('prescription')
+    if file is None or not file.filename:
+        return jsonify(error="No prescription image provided"), 400
+    extension = file.filename.rsplit('.', 1)[-1].lower() if '.' in file.filename else ''
+    if extension not in Config.PRESCRIPTION_IMAGE_EXTENSIONS:
+        return jsonify(error="Unsupported image type, please upload a PNG or JPEG"), 400
+    data = file.stream.read(Config.PRESCRIPTION_MAX_BYTES + 1)
+    if len(data) > Config.PRESCRIPTION_MAX_BYTES:
+        return jsonify(error="Image is too large"), 413
+
+    try:
+        ocr = read_prescription(data, cache=ocr_cache)
+    except ImageTooLargeError as e:
+        app.logger.warning(f"Rejected prescription image: {str(e)}")
+        return jsonify(error="Image is too large"), 413
+    except (UnidentifiedImageError, Image.DecompressionBombError) as e:
+        app.logger.warning(f"Rejected prescription image: {str(e)}")
+        return jsonify(error="The file could not be read as an image"), 400
+    except (ImportError, OSError) as e:
+        app.logger.error(f"OCR backend {Config.OCR_BACKEND} unavailable: {str(e)}")
+        return jsonify(error="Prescription analysis is not available on this server"), 503
+    except Exception as e:
+        app.logger.error(f"Error reading prescription: {str(e)}")
+        return jsonify(error="An error occurred while reading the prescription. Please try again."), 500
+
+    text = ocr['text']
+    drugs = extract_drug_names(text)
+    app.logger.info(f"Prescription {ocr['sha256'][:12]}: found {len(drugs)} medications {drugs}")
+    if not drugs:
+        return jsonify({"result": format_prescription_analysis(text, drugs), "drugs": [], "text": text,
+                        "citations": []}), 200
+
+    try:
+        session = session_registry.get(request.form.get('session_id') or request.headers.get('X-Session-ID'))
+        documents = prescription_documents(drugs, session)
+        question = f"{text}\n{', '.join(drugs)}"
+        with stage("pack"):
+            packed = context_packer.pack(documents, Config.PRESCRIPTION_ANALYSIS_PROMPT, question, label="prescription")
+        prompt = ChatPromptTemplate.from_template(Config.PRESCRIPTION_ANALYSIS_PROMPT)
+        chain = prompt | llm.get() | StrOutputParser()
+        answer = chain.invoke({"context": packed.text, "prescription": text, "drugs": ", ".join(drugs)},
+                              cache_config(not request.form.get('no_cache')))
+        with stage("format"):
+            result = format_prescription_analysis(text, drugs, truncate_words(answer))
+        return jsonify({"result": result, "drugs": drugs, "text": text, "citations": packed.citations}), 200
+    except Exception as e:
+        app.logger.error(f"Error in analyze_prescription: {str(e)}")
+        return jsonify(error="An error occurred while analyzing the prescription. Please try again."), 500
+
+@app.route('/api/cache_stats', methods=['GET'])
+def cache_stats():
+    return jsonify({
+        "llm": {**llm_response_cache.stats.to_dict(), "size": len(llm_response_cache)},
+        "semantic": semantic_cache.get().stats.to_dict() if semantic_cache.get() is not None else None,
+        "embeddings": default_embedding_service.get().stats(),
+        "sources": {
+            source: {"hits": handler.hits, "misses": handler.misses}
+            for source, handler in source_handlers.loaded().items()
+            if isinstance(handler, CachedSourceHandler)
+        },
+    }), 200
+
+def cache_counts():
+    counts = {
+        "llm": (llm_response_cache.stats.hits, llm_response_cache.stats.misses),
+        "embeddings": (default_embedding_service.get().hits, default_embedding_service.get().misses),
+    }
+    if semantic_cache.initialized and semantic_cache.get() is not None:
+        counts["semantic"] = (semantic_cache.get().stats.hits, semantic_cache.get().stats.misses)
+    for source, handler in source_handlers.loaded().items():
+        if isinstance(handler, CachedSourceHandler):
+            counts[f"source:{source}"] = (handler.hits, handler.misses)
+    return counts
+
+def session_metrics():
+    return [
+        ("medaissist_sessions_in_memory", "gauge", "Session knowledge bases held in memory",
+         [({}, len(session_registry))]),
+        ("medaissist_session_memory_bytes", "gauge", "Estimated memory used by in-memory sessions",
+         [({}, session_registry.memory_usage())]),
+    ]
+
+registry.register_collector(cache_collector(cache_counts))
+registry.register_collector(session_metrics)
+
+@app.before_request
+def start_request():
+    g.request_id_token = set_request_id(request.headers.get('X-Request-ID'))
+    g.request_started = time.perf_counter()
+
+@app.after_request
+def finish_request(response):
+    response.headers['X-Request-ID'] = get_request_id()
+    # Streamed responses are measured up to their first byte
+    endpoint = request.url_rule.rule if request.url_rule is not None else "unmatched"
+    HTTP_REQUESTS.inc(endpoint=endpoint, method=request.method, status=response.status_code)
+    HTTP_SECONDS.observe(time.perf_counter() - g.get('request_started', time.perf_counter()), endpoint=endpoint)
+    return response
+
+@app.teardown_request
+def end_request(exc):
+    token = g.pop('request_id_token', None)
+    if token is not None:
+        reset_request_id(token)
+
+@app.route('/metrics', methods=['GET'])
+def metrics():
+    if not Config.METRICS_ENABLED:
+        return jsonify(error="Metrics are disabled"), 404
+    return Response(registry.render(), mimetype='text/plain; version=0.0.4')
+
 if __name__ == '__main__':
-    app.run(debug=True)
\ No newline at end of file
+    create_app().run(debug=True)
\ No newline at end of file
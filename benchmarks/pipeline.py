@@ -0,0 +1,506 @@
+"""Load-test the knowledge-base build and chat endpoints offline.
+
+Usage:
+    python benchmarks/pipeline.py [--sessions 12] [--concurrency 4] [--chats 2] [--stream]
+        [--embeddings model|hashing] [--cache] [--source-latency 0] [--llm-token-delay 0]
+        [--json results.json] [--compare baseline.json]
+    python benchmarks/pipeline.py --record
+
+Source handlers are replaced by recordings (benchmarks/fixtures/source_recordings.json)
+and the LLM by a deterministic fake that writes answers in the Key words /
+Summary / References format, so runs need no network and are repeatable.
+Each session posts a scenario query to /api/build_kb, polls the job until it is
+done, then asks the scenario's questions through /api/chat (or
+/api/chat/stream with --stream), using the Flask test client from
+``--concurrency`` threads.
+
+Reports throughput, latency percentiles, peak RSS and time per pipeline stage.
+Save a run with ``--json`` and pass it to ``--compare`` on a later commit to see
+the change. ``--record`` refreshes the recordings from the live sources.
+"""
+import argparse
+import hashlib
+import json
+import os
+import platform
+import re
+import resource
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from langchain_core.embeddings import Embeddings  # noqa: E402
+from langchain_core.language_models.chat_models import BaseChatModel  # noqa: E402
+from langchain_core.messages import AIMessage, AIMessageChunk  # noqa: E402
+from langchain_core.outputs import ChatGeneration, ChatGenerationChunk, ChatResult  # noqa: E402
+
+from chunking import estimate_tokens, normalize_text  # noqa: E402
+from config import Config  # noqa: E402
+from sources.base_handler import BaseSourceHandler  # noqa: E402
+from sources.cache import normalize_query  # noqa: E402
+
+FIXTURES = os.path.join(ROOT, "benchmarks", "fixtures")
+DEFAULT_RECORDINGS = os.path.join(FIXTURES, "source_recordings.json")
+DEFAULT_SCENARIOS = os.path.join(FIXTURES, "scenarios.json")
+
+STOPWORDS = set("""a about after all also among and are as at be between but by compared context for from had has
+have in included including into is it more not of on or our outcome patients primary query question rates
+response risk secondary similar than that the their there these this those to was were which while with
+within""".split())
+ARTICLE_TYPES = ["randomized controlled trial", "cohort study", "meta-analysis", "systematic review",
+                 "observational study", "post hoc analysis", "practice guideline", "case report"]
+
+
+class ReplayHandler(BaseSourceHandler):
+    """Returns recorded results for a query, optionally sleeping for the recorded time."""
+
+    def __init__(self, recordings: dict, latency_scale: float = 0.0):
+        self.recordings = recordings
+        self.latency_scale = latency_scale
+
+    def fetch_data(self, query: str) -> list:
+        entry = self.recordings.get(normalize_query(query))
+        if entry is None:
+            return []
+        if self.latency_scale:
+            time.sleep(entry.get("elapsed", 0) * self.latency_scale)
+        return list(entry["documents"])
+
+
+class HashingEmbeddings(Embeddings):
+    """Deterministic bag-of-words vectors for machines without the embedding model."""
+
+    def __init__(self, size: int = 384):
+        self.size = size
+
+    def _embed(self, text):
+        vector = [0.0] * self.size
+        for word in normalize_text(text).split():
+            digest = hashlib.blake2b(word.encode("utf-8"), digest_size=8).digest()
+            value = int.from_bytes(digest, "big")
+            vector[value % self.size] += 1.0 if value & (1 << 63) else -1.0
+        norm = sum(v * v for v in vector) ** 0.5 or 1.0
+        return [v / norm for v in vector]
+
+    def embed_documents(self, texts):
+        return [self._embed(text) for text in texts]
+
+    def embed_query(self, text):
+        return self._embed(text)
+
+
+class BenchmarkChatModel(BaseChatModel):
+    """Deterministic chat model that answers in the app's summary and chat formats.
+
+    The answer is built from the prompt (cited titles, years, frequent terms),
+    so the same prompt always gives the same answer. ``token_delay`` seconds
+    are slept per streamed word to mimic generation speed.
+    """
+
+    token_delay: float = 0.0
+
+    @property
+    def _llm_type(self) -> str:
+        return "benchmark"
+
+    @property
+    def _identifying_params(self) -> dict:
+        return {"model": "benchmark", "token_delay": self.token_delay}
+
+    def _respond(self, prompt: str) -> str:
+        titles = re.findall(r"^\[(\d+)\] Title: (.+)$", prompt, re.MULTILINE)
+        years = sorted({int(year) for year in re.findall(r"\b(?:19|20)\d{2}\b", prompt)})
+        words = Counter(word for word in normalize_text(prompt).split()
+                        if len(word) > 5 and word not in STOPWORDS and not word.isdigit())
+        keywords = [word for word, _ in sorted(words.items(), key=lambda item: (-item[1], item[0]))[:6]]
+        types = [kind for kind in ARTICLE_TYPES if kind in prompt.lower()] or ["review"]
+        references = [f"[{number}] {title.strip()}" for number, title in titles[:3]]
+        first = titles[0][1].strip() if titles else "the retrieved literature"
+
+        if "Key words" in prompt:
+            query = re.search(r"Query: (.*)", prompt)
+            topic = query.group(1).strip() if query else "the query"
+            recommendations = [f"Consider {word} when assessing {topic}." for word in keywords[:3]]
+            return "\n".join([
+                f"1. Key words: {', '.join(keywords) or 'N/A'}",
+                f"2. Date range: {f'{years[0]}-{years[-1]}' if years else 'N/A'}",
+                f"3. Type of articles reviewed: {', '.join(types)}",
+                f"4. Summary: The {len(titles)} sources retrieved for {topic} are led by {first}. "
+                f"Findings most often concern {', '.join(keywords[:3]) or 'the query'}.",
+                "5. Recommended approach: " + " ".join(f"• {item}" for item in recommendations),
+                "6. Label Information: N/A",
+                "7. References: " + (" ".join(f"• {ref}" for ref in references) or "[N/A]"),
+            ])
+
+        question = re.search(r"Question: (.*)", prompt)
+        topic = question.group(1).strip() if question else "the question"
+        points = [f"• Evidence on {word} is reported in [{titles[i % len(titles)][0] if titles else 1}]."
+                  for i, word in enumerate(keywords[:3])]
+        return "\n\n".join([
+            f"Direct Answer: Regarding {topic}, the best supported evidence is {first}.",
+            "Key Points:\n" + "\n".join(points),
+            "Relevant References:\n" + ("\n".join(references) or "[N/A]"),
+        ])
+
+    def _usage(self, prompt, text):
+        input_tokens, output_tokens = estimate_tokens(prompt), estimate_tokens(text)
+        return {"input_tokens": input_tokens, "output_tokens": output_tokens,
+                "total_tokens": input_tokens + output_tokens}
+
+    @staticmethod
+    def _prompt(messages):
+        return "\n".join(str(message.content) for message in messages)
+
+    def _generate(self, messages, stop=None, run_manager=None, **kwargs):
+        prompt = self._prompt(messages)
+        text = self._respond(prompt)
+        if self.token_delay:
+            time.sleep(self.token_delay * len(text.split()))
+        message = AIMessage(content=text, usage_metadata=self._usage(prompt, text))
+        return ChatResult(generations=[ChatGeneration(message=message)])
+
+    def _stream(self, messages, stop=None, run_manager=None, **kwargs):
+        prompt = self._prompt(messages)
+        text = self._respond(prompt)
+        for piece in re.findall(r"\S+\s*|\s+", text):
+            if self.token_delay:
+                time.sleep(self.token_delay)
+            yield ChatGenerationChunk(message=AIMessageChunk(content=piece))
+        yield ChatGenerationChunk(message=AIMessageChunk(content="", usage_metadata=self._usage(prompt, text)))
+
+
+def percentile(values, fraction):
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(round(fraction * (len(ordered) - 1))))]
+
+
+def latency_summary(latencies, wall):
+    if not latencies:
+        return {"count": 0}
+    return {
+        "count": len(latencies),
+        "throughput_per_s": round(len(latencies) / wall, 3),
+        "mean_ms": round(sum(latencies) / len(latencies) * 1000, 1),
+        "p50_ms": round(percentile(latencies, 0.5) * 1000, 1),
+        "p90_ms": round(percentile(latencies, 0.9) * 1000, 1),
+        "p95_ms": round(percentile(latencies, 0.95) * 1000, 1),
+        "p99_ms": round(percentile(latencies, 0.99) * 1000, 1),
+        "max_ms": round(max(latencies) * 1000, 1),
+    }
+
+
+def current_rss_mb():
+    try:
+        with open("/proc/self/statm") as file:
+            return int(file.read().split()[1]) * os.sysconf("SC_PAGE_SIZE") / (1024 * 1024)
+    except (OSError, ValueError):
+        return peak_rss_mb()
+
+
+def peak_rss_mb():
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Kilobytes on Linux, bytes on macOS
+    return peak / (1024 * 1024) if sys.platform == "darwin" else peak / 1024
+
+
+class RssSampler(threading.Thread):
+    def __init__(self, interval=0.05):
+        super().__init__(daemon=True)
+        self.interval = interval
+        self.peak = current_rss_mb()
+        self._stop_event = threading.Event()
+
+    def run(self):
+        while not self._stop_event.wait(self.interval):
+            self.peak = max(self.peak, current_rss_mb())
+
+    def stop(self):
+        self._stop_event.set()
+        self.join()
+        self.peak = max(self.peak, current_rss_mb())
+
+
+def configure(args, workdir):
+    """Point every on-disk store at ``workdir`` and apply the run's settings, before the app is imported."""
+    Config.VECTOR_STORE_PATH = os.path.join(workdir, "vector_store")
+    Config.SOURCE_CACHE_PATH = os.path.join(workdir, "cache", "sources.sqlite3")
+    Config.PDF_CACHE_PATH = os.path.join(workdir, "cache", "pdf")
+    Config.SOURCE_CACHE_ENABLED = args.cache
+    Config.LLM_CACHE_ENABLED = args.cache
+    Config.SEMANTIC_CACHE_ENABLED = args.cache and Config.SEMANTIC_CACHE_ENABLED
+    Config.METRICS_ENABLED = True
+    Config.WARM_UP_ON_START = False
+    if args.job_workers:
+        Config.JOB_WORKERS = args.job_workers
+    Config.JOB_QUEUE_SIZE = max(Config.JOB_QUEUE_SIZE, args.sessions + args.warmup)
+
+    if args.embeddings == "hashing":
+        from embedding_service import default_embedding_service
+        default_embedding_service.get()._model = HashingEmbeddings()
+
+
+def load_app(args, recordings):
+    import app
+
+    if not args.verbose:
+        import logging
+        logging.getLogger().setLevel(logging.WARNING)
+    app.llm.set(app.build_llm(BenchmarkChatModel(token_delay=args.llm_token_delay)))
+    app.source_handlers.clear()
+    for source, entries in recordings.items():
+        app.source_handlers.set(source, app.wrap_source_handler(source, ReplayHandler(entries, args.source_latency)))
+    return app
+
+
+def run_build(client, scenario, poll_interval):
+    start = time.perf_counter()
+    response = client.post("/api/build_kb", data={"query": scenario["query"], "sources": scenario["sources"]})
+    if response.status_code != 202:
+        return time.perf_counter() - start, None, None, f"HTTP {response.status_code}"
+    job_id = response.json["job_id"]
+    while True:
+        status = client.get(f"/api/build_kb/{job_id}").json
+        if status["status"] in ("done", "failed", "cancelled"):
+            break
+        time.sleep(poll_interval)
+    elapsed = time.perf_counter() - start
+    if status["status"] != "done":
+        return elapsed, None, status.get("timings"), status.get("error") or status["status"]
+    return elapsed, status["result"].get("session_id"), status.get("timings"), None
+
+
+def run_chat(client, session_id, question, stream):
+    start = time.perf_counter()
+    body = {"session_id": session_id, "message": question}
+    if stream:
+        response = client.post("/api/chat/stream", json=body)
+        data = response.get_data(as_text=True)
+        error = None if response.status_code == 200 and "event: done" in data else f"HTTP {response.status_code}"
+    else:
+        response = client.post("/api/chat", json=body)
+        error = None if response.status_code == 200 else f"HTTP {response.status_code}"
+    return time.perf_counter() - start, error
+
+
+def run_session(app, index, scenarios, args, results):
+    scenario = scenarios[index % len(scenarios)]
+    client = app.app.test_client()
+    elapsed, session_id, timings, error = run_build(client, scenario, args.poll_interval)
+    results.append(("build", elapsed, error, timings))
+    if session_id is None:
+        return
+    for question in scenario["questions"][:args.chats]:
+        elapsed, error = run_chat(client, session_id, question, args.stream)
+        results.append(("chat_stream" if args.stream else "chat", elapsed, error, None))
+
+
+def stage_times(before, after):
+    stages = {}
+    for key, (count, total) in after.items():
+        previous_count, previous_total = before.get(key, (0, 0.0))
+        if count == previous_count:
+            continue
+        labels = dict(key)
+        name = labels.pop("stage")
+        if labels:
+            name += "[" + ",".join(f"{k}={v}" for k, v in sorted(labels.items())) + "]"
+        calls = count - previous_count
+        seconds = total - previous_total
+        stages[name] = {"calls": calls, "total_s": round(seconds, 4), "mean_ms": round(seconds / calls * 1000, 2)}
+    return dict(sorted(stages.items(), key=lambda item: -item[1]["total_s"]))
+
+
+def benchmark(args):
+    with open(args.recordings, encoding="utf-8") as file:
+        recordings = json.load(file)["sources"]
+    with open(args.scenarios, encoding="utf-8") as file:
+        scenarios = json.load(file)["scenarios"]
+
+    workdir = tempfile.mkdtemp(prefix="medaissist-bench-")
+    configure(args, workdir)
+    rss_before_import = current_rss_mb()
+    import_start = time.perf_counter()
+    app = load_app(args, recordings)
+    import_seconds = time.perf_counter() - import_start
+    from observability import STAGE_SECONDS, LLM_TOKENS
+
+    for i in range(args.warmup):
+        run_session(app, i, scenarios, args, [])
+
+    results = []
+    stages_before = STAGE_SECONDS.snapshot()
+    tokens_before = (LLM_TOKENS.value(direction="input"), LLM_TOKENS.value(direction="output"))
+    sampler = RssSampler()
+    sampler.start()
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=args.concurrency) as executor:
+        futures = [executor.submit(run_session, app, i, scenarios, args, results) for i in range(args.sessions)]
+        for future in futures:
+            future.result()
+    wall = time.perf_counter() - start
+    sampler.stop()
+
+    operations = {}
+    for name in dict.fromkeys(op for op, _, _, _ in results):
+        latencies = [elapsed for op, elapsed, error, _ in results if op == name and error is None]
+        errors = Counter(error for op, _, error, _ in results if op == name and error is not None)
+        operations[name] = {**latency_summary(latencies, wall), "errors": dict(errors)}
+
+    build_stages = {}
+    for op, _, error, timings in results:
+        if op == "build" and error is None:
+            for stage, seconds in (timings or {}).items():
+                build_stages.setdefault(stage, []).append(seconds)
+
+    return {
+        "sessions": args.sessions,
+        "concurrency": args.concurrency,
+        "wall_s": round(wall, 3),
+        "sessions_per_s": round(args.sessions / wall, 3),
+        "operations": operations,
+        "build_stage_mean_s": {stage: round(sum(v) / len(v), 4) for stage, v in build_stages.items()},
+        "stages": stage_times(stages_before, STAGE_SECONDS.snapshot()),
+        "llm_tokens": {
+            "input": LLM_TOKENS.value(direction="input") - tokens_before[0],
+            "output": LLM_TOKENS.value(direction="output") - tokens_before[1],
+        },
+        "memory_mb": {
+            "before_import": round(rss_before_import, 1),
+            "peak_during_run": round(sampler.peak, 1),
+            "peak_process": round(peak_rss_mb(), 1),
+        },
+        "import_app_s": round(import_seconds, 3),
+    }
+
+
+def record(args):
+    """Call the live source handlers for every scenario query and save the results."""
+    from sources.registry import SourceRegistry
+
+    with open(args.scenarios, encoding="utf-8") as file:
+        scenarios = json.load(file)["scenarios"]
+    registry = SourceRegistry()
+    recordings = {}
+    for scenario in scenarios:
+        for source in scenario["sources"]:
+            if source not in registry:
+                registry.register(source)
+            handler = registry.get(source)
+            if handler is None:
+                print(f"Skipping {source}: handler unavailable")
+                continue
+            start = time.perf_counter()
+            documents = handler.fetch_data(scenario["query"])
+            elapsed = time.perf_counter() - start
+            recordings.setdefault(source, {})[normalize_query(scenario["query"])] = {
+                "documents": documents, "elapsed": round(elapsed, 2),
+            }
+            print(f"{source:<16} {len(documents):>4} documents in {elapsed:.2f}s  {scenario['query']}")
+    with open(args.recordings, "w", encoding="utf-8") as file:
+        json.dump({"recorded_at": time.strftime("%Y-%m-%dT%H:%M:%S"), "sources": recordings}, file, indent=1)
+
+
+def git_revision():
+    try:
+        commit = subprocess.run(["git", "rev-parse", "--short", "HEAD"], cwd=ROOT, capture_output=True, text=True).stdout.strip()
+        dirty = bool(subprocess.run(["git", "status", "--porcelain", "--untracked-files=no"], cwd=ROOT,
+                                    capture_output=True, text=True).stdout.strip())
+        return commit + ("-dirty" if dirty else "")
+    except OSError:
+        return None
+
+
+def print_report(report):
+    results = report["results"]
+    print(f"{results['sessions']} sessions at concurrency {results['concurrency']} in {results['wall_s']}s "
+          f"({results['sessions_per_s']} sessions/s), commit {report['meta']['commit']}")
+    columns = ["count", "throughput_per_s", "p50_ms", "p95_ms", "p99_ms", "max_ms"]
+    print(f"\n{'operation':<14}" + "".join(f"{column:>18}" for column in columns) + "  errors")
+    for name, summary in results["operations"].items():
+        print(f"{name:<14}" + "".join(f"{summary.get(column, '-'):>18}" for column in columns)
+              + f"  {summary['errors'] or ''}")
+    print(f"\n{'stage':<34}{'calls':>8}{'total_s':>12}{'mean_ms':>12}")
+    for name, stage in results["stages"].items():
+        print(f"{name:<34}{stage['calls']:>8}{stage['total_s']:>12}{stage['mean_ms']:>12}")
+    memory = results["memory_mb"]
+    print(f"\nPeak RSS {memory['peak_during_run']} MB during the run ({memory['peak_process']} MB process peak); "
+          f"LLM tokens in/out {results['llm_tokens']['input']}/{results['llm_tokens']['output']}")
+
+
+def compare(report, baseline_path):
+    with open(baseline_path, encoding="utf-8") as file:
+        baseline = json.load(file)
+    print(f"\nChange against {baseline_path} (commit {baseline['meta'].get('commit')}):")
+
+    def line(label, old, new, higher_is_better=False):
+        if not old:
+            return
+        change = (new - old) / old * 100
+        better = change > 0 if higher_is_better else change < 0
+        print(f"  {label:<40}{old:>12}{new:>12}{change:>+9.1f}%  {'better' if better else 'worse' if change else ''}")
+
+    old, new = baseline["results"], report["results"]
+    line("sessions/s", old["sessions_per_s"], new["sessions_per_s"], higher_is_better=True)
+    for name, summary in new["operations"].items():
+        previous = old["operations"].get(name, {})
+        for column in ("p50_ms", "p95_ms"):
+            line(f"{name} {column}", previous.get(column), summary.get(column))
+    line("peak RSS MB", old["memory_mb"]["peak_during_run"], new["memory_mb"]["peak_during_run"])
+    for name, stage in new["stages"].items():
+        line(f"stage {name} mean_ms", old["stages"].get(name, {}).get("mean_ms"), stage["mean_ms"])
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--sessions", type=int, default=12, help="build + chat sessions to run")
+    parser.add_argument("--concurrency", type=int, default=4, help="sessions running at the same time")
+    parser.add_argument("--chats", type=int, default=2, help="questions asked per session")
+    parser.add_argument("--stream", action="store_true", help="use /api/chat/stream instead of /api/chat")
+    parser.add_argument("--warmup", type=int, default=1, help="untimed sessions run first")
+    parser.add_argument("--job-workers", type=int, help=f"build workers (default {Config.JOB_WORKERS})")
+    parser.add_argument("--embeddings", choices=["model", "hashing"], default="model",
+                        help="real embedding model, or deterministic hashing vectors when it is unavailable")
+    parser.add_argument("--cache", action="store_true", help="keep the source and LLM caches enabled")
+    parser.add_argument("--source-latency", type=float, default=0.0,
+                        help="multiple of the recorded fetch time to sleep in each replayed source")
+    parser.add_argument("--llm-token-delay", type=float, default=0.0, help="seconds per generated word")
+    parser.add_argument("--poll-interval", type=float, default=0.01, help="seconds between job status polls")
+    parser.add_argument("--recordings", default=DEFAULT_RECORDINGS)
+    parser.add_argument("--scenarios", default=DEFAULT_SCENARIOS)
+    parser.add_argument("--record", action="store_true", help="refresh the recordings from the live sources")
+    parser.add_argument("--verbose", action="store_true", help="keep the app's INFO logging")
+    parser.add_argument("--json", help="write the results to this file")
+    parser.add_argument("--compare", help="earlier --json output to compare against")
+    args = parser.parse_args()
+
+    if args.record:
+        record(args)
+        return
+
+    report = {
+        "meta": {
+            "commit": git_revision(),
+            "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S"),
+            "python": sys.version.split()[0],
+            "platform": platform.platform(),
+            "args": {key: value for key, value in vars(args).items() if key not in ("json", "compare")},
+        },
+        "results": benchmark(args),
+    }
+    print_report(report)
+    if args.compare:
+        compare(report, args.compare)
+    if args.json:
+        with open(args.json, "w") as file:
+            json.dump(report, file, indent=2)
+
+
+if __name__ == "__main__":
+    main()
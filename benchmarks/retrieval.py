@@ -0,0 +1,105 @@
+"""Compare dense, BM25, hybrid and reranked retrieval on a fixture corpus.
+
+Usage:
+    python benchmarks/retrieval.py [--corpus benchmarks/fixtures/retrieval_corpus.json]
+        [--k 1 3 5] [--repeat 5] [--rerank] [--json results.json]
+
+Indexes the corpus with the app's embedding model, then reports recall@k
+(fraction of each query's relevant documents found in the top k, averaged over
+queries) and p50/p95 retrieval latency for each mode.
+"""
+import argparse
+import json
+import os
+import sys
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from langchain_community.vectorstores import FAISS  # noqa: E402
+
+from config import Config  # noqa: E402
+from embedding_service import EmbeddingService, default_embedding_service  # noqa: E402
+from retrieval import HybridRetriever, default_reranker  # noqa: E402
+
+DEFAULT_CORPUS = os.path.join(ROOT, "benchmarks", "fixtures", "retrieval_corpus.json")
+
+
+def percentile(values, fraction):
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(round(fraction * (len(ordered) - 1))))]
+
+
+def build_retrievers(corpus, max_k, rerank):
+    ids = [doc["id"] for doc in corpus["documents"]]
+    texts = [doc["text"] for doc in corpus["documents"]]
+    id_by_text = dict(zip(texts, ids))
+    # No vector cache, so every timed query pays for its embedding
+    embeddings = EmbeddingService(model=default_embedding_service.get().model, cache_size=0)
+    store = FAISS.from_texts(texts, embeddings, ids=ids)
+    hybrid = HybridRetriever.from_vector_store(store, k=max_k, reranker=None)
+
+    modes = {
+        "dense": lambda query: hybrid.dense_search(query, max_k),
+        "bm25": lambda query: [id_ for id_, _ in hybrid.bm25.search(query, max_k)],
+        "hybrid": lambda query: [id_by_text[doc.page_content] for doc in hybrid.invoke(query)],
+    }
+    if rerank:
+        reranked = HybridRetriever.from_vector_store(store, k=max_k, reranker=default_reranker.get())
+        modes["hybrid+rerank"] = lambda query: [id_by_text[doc.page_content] for doc in reranked.invoke(query)]
+    return modes
+
+
+def run(corpus, ks, repeat, rerank):
+    modes = build_retrievers(corpus, max(ks), rerank)
+    queries = corpus["queries"]
+    report = {}
+    for mode, search in modes.items():
+        for query in queries:  # Load lazily built models before timing
+            search(query["query"])
+        latencies = []
+        recall = {k: 0.0 for k in ks}
+        for _ in range(repeat):
+            for query in queries:
+                start = time.perf_counter()
+                found = search(query["query"])
+                latencies.append(time.perf_counter() - start)
+                relevant = set(query["relevant"])
+                for k in ks:
+                    recall[k] += len(relevant & set(found[:k])) / len(relevant)
+        report[mode] = {
+            **{f"recall@{k}": round(total / (repeat * len(queries)), 3) for k, total in recall.items()},
+            "p50_ms": round(percentile(latencies, 0.5) * 1000, 2),
+            "p95_ms": round(percentile(latencies, 0.95) * 1000, 2),
+        }
+    return report
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--corpus", default=DEFAULT_CORPUS, help="fixture with documents and labelled queries")
+    parser.add_argument("--k", type=int, nargs="+", default=[1, 3, Config.RETRIEVAL_K], help="cut-offs for recall@k")
+    parser.add_argument("--repeat", type=int, default=5, help="times each query is run for latency")
+    parser.add_argument("--rerank", action="store_true", help=f"also rerank with {Config.RERANK_MODEL}")
+    parser.add_argument("--json", help="write the results to this file")
+    args = parser.parse_args()
+
+    with open(args.corpus, encoding="utf-8") as file:
+        corpus = json.load(file)
+    ks = sorted(set(args.k))
+    report = run(corpus, ks, args.repeat, args.rerank)
+
+    columns = [f"recall@{k}" for k in ks] + ["p50_ms", "p95_ms"]
+    print(f"{len(corpus['documents'])} documents, {len(corpus['queries'])} queries, embeddings: {Config.EMBEDDING_MODEL}")
+    print(f"\n{'mode':<16}" + "".join(f"{column:>12}" for column in columns))
+    for mode, results in report.items():
+        print(f"{mode:<16}" + "".join(f"{results[column]:>12}" for column in columns))
+
+    if args.json:
+        with open(args.json, "w") as file:
+            json.dump({"corpus": args.corpus, "embedding_model": Config.EMBEDDING_MODEL, "modes": report}, file, indent=2)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,100 @@
+"""Report how long importing the app takes, broken down by module.
+
+Usage:
+    python benchmarks/startup.py [--top 20] [--warm-up] [--json results.json]
+
+Runs ``python -X importtime -c "import app"`` in a fresh interpreter and sums
+the self time of every imported module under its top-level package. With
+``--warm-up`` it also times each lazily built component on first use.
+"""
+import argparse
+import json
+import os
+import subprocess
+import sys
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+WARM_UP_SCRIPT = """
+import json, time
+t = time.perf_counter(); import app; timings = {"import app": time.perf_counter() - t}
+def timed(name, fn):
+    t = time.perf_counter()
+    try:
+        fn()
+    except Exception as e:
+        timings[name + " (failed: " + type(e).__name__ + ")"] = time.perf_counter() - t
+        return
+    timings[name] = time.perf_counter() - t
+for source in app.source_handlers.names():
+    timed("handler:" + source, lambda: app.source_handlers.get(source))
+timed("llm", app.llm.get)
+timed("embedding model", lambda: app.default_embedding_service.get().model)
+timed("vector store", lambda: app.default_knowledge_base.get().vector_store)
+print("WARMUP_JSON " + json.dumps(timings))
+"""
+
+
+def import_times():
+    start = time.perf_counter()
+    result = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", "import app"],
+        cwd=ROOT, capture_output=True, text=True,
+    )
+    wall = time.perf_counter() - start
+    if result.returncode != 0:
+        raise SystemExit(f"Importing app failed:\n{result.stderr[-2000:]}")
+
+    packages, modules = {}, {}
+    for line in result.stderr.splitlines():
+        if not line.startswith("import time:") or "self [us]" in line:
+            continue
+        self_us, cumulative_us, name = [part.strip() for part in line[len("import time:"):].split("|")]
+        modules[name] = int(cumulative_us) / 1e6
+        package = name.split(".")[0]
+        packages[package] = packages.get(package, 0) + int(self_us) / 1e6
+    return wall, packages, modules
+
+
+def warm_up_times():
+    result = subprocess.run([sys.executable, "-c", WARM_UP_SCRIPT], cwd=ROOT, capture_output=True, text=True)
+    for line in result.stdout.splitlines():
+        if line.startswith("WARMUP_JSON "):
+            return json.loads(line[len("WARMUP_JSON "):])
+    raise SystemExit(f"Warm-up failed:\n{result.stderr[-2000:]}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--top", type=int, default=20, help="number of packages to show")
+    parser.add_argument("--warm-up", action="store_true", help="also time lazily built components")
+    parser.add_argument("--json", help="write the results to this file")
+    args = parser.parse_args()
+
+    wall, packages, modules = import_times()
+    report = {
+        "python": sys.version.split()[0],
+        "import_wall_seconds": round(wall, 3),
+        "app_import_seconds": round(modules.get("app", 0), 3),
+        "packages": {name: round(seconds, 4) for name, seconds in sorted(packages.items(), key=lambda item: -item[1])},
+    }
+
+    print(f"Interpreter start + import app: {wall:.3f}s (import app: {modules.get('app', 0):.3f}s)")
+    print(f"\n{'package':<40} {'self time (s)':>14}")
+    for name, seconds in list(report["packages"].items())[:args.top]:
+        print(f"{name:<40} {seconds:>14.4f}")
+
+    if args.warm_up:
+        report["warm_up"] = {name: round(seconds, 3) for name, seconds in warm_up_times().items()}
+        print(f"\n{'first use':<40} {'seconds':>14}")
+        for name, seconds in report["warm_up"].items():
+            print(f"{name:<40} {seconds:>14.3f}")
+
+    if args.json:
+        with open(args.json, "w") as file:
+            json.dump(report, file, indent=2)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,231 @@
+# chunking.py
+import hashlib
+import logging
+import re
+
+from langchain_core.documents import Document
+
+from config import Config
+from lazy import Lazy
+
+logger = logging.getLogger(__name__)
+
+WORD_PATTERN = re.compile(r"\w+|[^\w\s]")
+SENTENCE_PATTERN = re.compile(r"(?<=[.!?])\s+|\n+")
+TITLE_PATTERN = re.compile(r"^Title:\s*(.+)$", re.MULTILINE)
+MERSENNE_PRIME = (1 << 61) - 1
+
+
+def load_tokenizer():
+    """Tokenizer of the embedding model, or ``None`` when transformers is unavailable."""
+    model_name = Config.EMBEDDING_MODEL
+    if "/" not in model_name:
+        model_name = f"sentence-transformers/{model_name}"
+    try:
+        from transformers import AutoTokenizer
+        return AutoTokenizer.from_pretrained(model_name)
+    except Exception as e:
+        logger.warning(f"Tokenizer for {model_name} unavailable, estimating token counts: {str(e)}")
+        return None
+
+
+# Process-wide tokenizer, loaded once (a failed load is not retried)
+default_tokenizer = Lazy(load_tokenizer)
+
+
+def estimate_tokens(text: str) -> int:
+    # WordPiece splits long words into several pieces
+    return sum(1 + len(token) // 8 for token in WORD_PATTERN.findall(text))
+
+
+def count_tokens(text: str, tokenizer=None) -> int:
+    if tokenizer is None:
+        return estimate_tokens(text)
+    return len(tokenizer.encode(text, add_special_tokens=False))
+
+
+def normalize_text(text: str) -> str:
+    return " ".join(re.sub(r"[^\w\s]", " ", text.lower()).split())
+
+
+def extract_title(text: str):
+    match = TITLE_PATTERN.search(text)
+    return match.group(1).strip() if match else None
+
+
+def _hash64(value: str) -> int:
+    return int.from_bytes(hashlib.blake2b(value.encode("utf-8"), digest_size=8).digest(), "big")
+
+
+class MinHasher:
+    """MinHash signatures over word shingles, with LSH banding for candidate lookup."""
+
+    def __init__(self, num_perm: int = 64, bands: int = 16, shingle_size: int = 3, seed: int = 1):
+        self.num_perm = num_perm
+        self.bands = bands
+        self.rows = num_perm // bands
+        self.shingle_size = shingle_size
+        # Fixed pseudo-random permutations so signatures are stable across runs
+        self.permutations = [
+            (_hash64(f"a{seed}:{i}") % (MERSENNE_PRIME - 1) + 1, _hash64(f"b{seed}:{i}") % MERSENNE_PRIME)
+            for i in range(num_perm)
+        ]
+
+    def signature(self, text: str):
+        words = normalize_text(text).split()
+        if not words:
+            return None
+        size = min(self.shingle_size, len(words))
+        shingles = {_hash64(" ".join(words[i:i + size])) for i in range(len(words) - size + 1)}
+        return tuple(min((a * h + b) % MERSENNE_PRIME for h in shingles) for a, b in self.permutations)
+
+    def band_keys(self, signature):
+        return [(i, signature[i * self.rows:(i + 1) * self.rows]) for i in range(self.bands)]
+
+    @staticmethod
+    def similarity(first, second) -> float:
+        return sum(1 for a, b in zip(first, second) if a == b) / len(first)
+
+
+class Chunker:
+    """Splits documents into token-sized chunks and drops duplicate documents.
+
+    Chunks are sized in tokens of the embedding model's tokenizer. The ``Title:``
+    line of an article is repeated at the top of every chunk so the title and
+    abstract stay together. Documents whose text is identical, whose normalized
+    title matches an earlier one, or whose MinHash similarity is at least
+    ``near_duplicate_threshold`` are skipped before they are embedded. One
+    instance is meant to live for a single build so duplicates are caught across
+    all sources.
+    """
+
+    def __init__(self, max_tokens: int = None, overlap_tokens: int = None,
+                 near_duplicate_threshold: float = None, tokenizer=None):
+        self.max_tokens = max_tokens or Config.CHUNK_MAX_TOKENS
+        self.overlap_tokens = Config.CHUNK_OVERLAP_TOKENS if overlap_tokens is None else overlap_tokens
+        self.threshold = Config.NEAR_DUPLICATE_THRESHOLD if near_duplicate_threshold is None else near_duplicate_threshold
+        self.tokenizer = tokenizer if tokenizer is not None else default_tokenizer.get()
+        self.minhasher = MinHasher()
+        self._hashes = set()
+        self._titles = set()
+        self._bands = {}
+        self._signatures = []
+        self.stats = {
+            "documents": 0,
+            "exact_duplicates": 0,
+            "near_duplicates": 0,
+            "chunks": 0,
+            "chunks_saved": 0,
+        }
+
+    def count_tokens(self, text: str) -> int:
+        return count_tokens(text, self.tokenizer)
+
+    def split_documents(self, documents: list) -> list:
+        chunks = []
+        for doc in documents:
+            chunks.extend(self.split_document(doc))
+        return chunks
+
+    def split_document(self, doc) -> list:
+        """Return the chunks of ``doc``, or an empty list if it duplicates an earlier document."""
+        self.stats["documents"] += 1
+        text = doc.page_content or ""
+        title = extract_title(text)
+        pieces = self._split(text, title)
+
+        duplicate = self._duplicate_kind(text, title)
+        if duplicate:
+            self.stats[duplicate] += 1
+            self.stats["chunks_saved"] += len(pieces)
+            return []
+
+        self.stats["chunks"] += len(pieces)
+        return [
+            Document(page_content=piece, metadata={**doc.metadata, "chunk": i})
+            for i, piece in enumerate(pieces)
+        ]
+
+    def _duplicate_kind(self, text, title):
+        digest = hashlib.sha256(normalize_text(text).encode("utf-8")).hexdigest()
+        if digest in self._hashes:
+            return "exact_duplicates"
+        self._hashes.add(digest)
+
+        normalized_title = normalize_text(title) if title else ""
+        # Very short titles ("Introduction", "No title available") are not distinctive
+        if len(normalized_title) >= 20:
+            if normalized_title in self._titles:
+                return "near_duplicates"
+            self._titles.add(normalized_title)
+
+        signature = self.minhasher.signature(text)
+        if signature is None:
+            return None
+        candidates = set()
+        keys = self.minhasher.band_keys(signature)
+        for key in keys:
+            candidates.update(self._bands.get(key, ()))
+        for candidate in candidates:
+            if MinHasher.similarity(signature, self._signatures[candidate]) >= self.threshold:
+                return "near_duplicates"
+        index = len(self._signatures)
+        self._signatures.append(signature)
+        for key in keys:
+            self._bands.setdefault(key, []).append(index)
+        return None
+
+    def _split(self, text, title):
+        if self.count_tokens(text) <= self.max_tokens:
+            return [text] if text.strip() else []
+
+        header = ""
+        body = text
+        if title:
+            header = f"Title: {title}\n"
+            body = TITLE_PATTERN.sub("", text, count=1).strip()
+        budget = max(self.max_tokens - self.count_tokens(header), self.max_tokens // 2)
+
+        units = []
+        for sentence in SENTENCE_PATTERN.split(body):
+            sentence = sentence.strip()
+            if not sentence:
+                continue
+            tokens = self.count_tokens(sentence)
+            if tokens <= budget:
+                units.append((sentence, tokens))
+            else:
+                units.extend(self._split_long(sentence, budget))
+
+        chunks, current, current_tokens = [], [], 0
+        for unit, tokens in units:
+            if current and current_tokens + tokens > budget:
+                chunks.append(header + " ".join(u for u, _ in current))
+                # Carry trailing sentences over as overlap
+                overlap, overlap_tokens = [], 0
+                for previous in reversed(current):
+                    if overlap_tokens + previous[1] > self.overlap_tokens:
+                        break
+                    overlap.insert(0, previous)
+                    overlap_tokens += previous[1]
+                while overlap and overlap_tokens + tokens > budget:
+                    overlap_tokens -= overlap.pop(0)[1]
+                current, current_tokens = overlap, overlap_tokens
+            current.append((unit, tokens))
+            current_tokens += tokens
+        if current:
+            chunks.append(header + " ".join(u for u, _ in current))
+        return chunks
+
+    def _split_long(self, sentence, budget):
+        pieces, words, tokens = [], [], 0
+        for word in sentence.split():
+            word_tokens = self.count_tokens(word)
+            if words and tokens + word_tokens > budget:
+                pieces.append((" ".join(words), tokens))
+                words, tokens = [], 0
+            words.append(word)
+            tokens += word_tokens
+        if words:
+            pieces.append((" ".join(words), tokens))
+        return pieces
@@ -12,17 +12,125 @@ class Config:
     MAX_RESULTS = 30
     # Google Cloud Vision API Credentials
     GOOGLE_CLOUD_CREDENTIALS_PATH = "/Users/sanjij/work/external_demos/pubmed/ver1/google_cloud_credentials.json"
-    os.environ['GOOGLE_APPLICATION_CREDENTIALS'] = GOOGLE_CLOUD_CREDENTIALS_PATH
+
+    # Startup Configuration
+    # Build handlers, the LLM client and embeddings in the background at startup
+    # instead of on the first request
+    WARM_UP_ON_START = os.environ.get('WARM_UP_ON_START', '0') == '1'
+
+    # Observability Configuration
+    # Stage timings, counters and histograms served at /metrics
+    METRICS_ENABLED = os.environ.get('METRICS_ENABLED', '1') == '1'
+
+    # LLM Response Cache Configuration
+    LLM_CACHE_ENABLED = os.environ.get('LLM_CACHE_ENABLED', '1') == '1'
+    LLM_CACHE_SIZE = 512  # Exact-match responses kept in memory
+    SEMANTIC_CACHE_ENABLED = os.environ.get('SEMANTIC_CACHE_ENABLED', '0') == '1'
+    SEMANTIC_CACHE_THRESHOLD = 0.95  # Question embedding cosine similarity needed to reuse an answer
+    SEMANTIC_CACHE_SIZE = 1000
 
     # Source Configuration
     ENABLED_SOURCES = ['pubmed', 'google_scholar', 'wikipedia', 'internet']
+    # Seconds each source may take before it is reported as timed out
+    SOURCE_TIMEOUT = float(os.environ.get('SOURCE_TIMEOUT', 15))
+    SOURCE_TIMEOUTS = {'google_scholar': 20}
+    # Overall budget for fetching from all selected sources
+    SOURCE_FETCH_DEADLINE = float(os.environ.get('SOURCE_FETCH_DEADLINE', 25))
+
+    # PubMed E-utilities Configuration
+    PUBMED_EUTILS_URL = os.environ.get('PUBMED_EUTILS_URL', 'https://eutils.ncbi.nlm.nih.gov/entrez/eutils')
+    PUBMED_API_KEY = os.environ.get('PUBMED_API_KEY')  # Raises NCBI's limit from 3 to 10 requests/second
+    PUBMED_EMAIL = os.environ.get('PUBMED_EMAIL', '')  # Contact address NCBI asks tools to send
+    PUBMED_TOOL = 'MedAIssist'
+    PUBMED_MAX_RESULTS = int(os.environ.get('PUBMED_MAX_RESULTS', MAX_RESULTS))
+    PUBMED_BATCH_SIZE = 200  # Records per efetch request
+    PUBMED_POOL_SIZE = 4  # Keep-alive connections to NCBI
+    PUBMED_REQUEST_TIMEOUT = 10  # Seconds per HTTP request
+
+    # Source Result Cache Configuration
+    SOURCE_CACHE_ENABLED = os.environ.get('SOURCE_CACHE_ENABLED', '1') == '1'
+    SOURCE_CACHE_PATH = os.path.join('cache', 'sources.sqlite3')
+    SOURCE_CACHE_TTL = 24 * 3600  # Seconds results are reused, unless overridden below
+    SOURCE_CACHE_TTLS = {'wikipedia': 7 * 24 * 3600, 'internet': 3600}
+    SOURCE_CACHE_NEGATIVE_TTL = 300  # Seconds empty results and errors are remembered
 
     # Upload Configuration
     UPLOAD_FOLDER = 'uploads'
     ALLOWED_EXTENSIONS = {'pdf', 'png', 'jpg', 'jpeg'}
 
+    # PDF Ingestion Configuration
+    PDF_WORKERS = min(4, os.cpu_count() or 1)  # Processes used to extract page text
+    PDF_PAGES_PER_TASK = 16
+    PDF_CACHE_PATH = os.path.join('cache', 'pdf')
+
+    # Prescription Analysis Configuration
+    OCR_BACKEND = os.environ.get('OCR_BACKEND', 'tesseract')  # 'tesseract' (local) or 'google_vision'
+    OCR_WORKERS = min(2, os.cpu_count() or 1)  # Processes running OCR; 0 runs it in the request thread
+    OCR_CACHE_PATH = os.path.join('cache', 'ocr')
+    OCR_MAX_SIDE = 2000  # Images are downscaled to this many pixels on their longest side
+    OCR_MAX_PIXELS = 50_000_000  # Larger images are rejected before decoding
+    OCR_MAX_DESKEW_DEGREES = 10
+    PRESCRIPTION_IMAGE_EXTENSIONS = {'png', 'jpg', 'jpeg'}
+    PRESCRIPTION_MAX_BYTES = 10 * 1024 * 1024
+    PRESCRIPTION_MAX_DRUGS = 8
+    PRESCRIPTION_RETRIEVAL_K = 4  # Chunks retrieved per drug name
+
     # Vector Store Configuration
     VECTOR_STORE_PATH = 'vector_store'
+    # Map saved indexes read-only so worker processes share one copy through the page cache
+    VECTOR_STORE_MMAP = os.environ.get('VECTOR_STORE_MMAP', '1') == '1'
+    VECTOR_STORE_VERSIONS_KEPT = 2  # Index versions kept on disk for readers still loading an older one
+
+    # Session Configuration
+    SESSION_TTL = 24 * 3600  # Seconds before an unused session knowledge base is deleted
+    SESSION_IDLE_SECONDS = 15 * 60  # Seconds before an idle session is dropped from memory
+    SESSION_MEMORY_BUDGET_MB = 512  # Memory allowed for session indexes held in memory
+
+    # Background Job Configuration
+    JOB_WORKERS = 2  # Knowledge-base builds run at the same time
+    JOB_QUEUE_SIZE = 32  # Builds waiting for a worker before new ones are rejected
+    JOB_RETENTION = 3600  # Seconds finished jobs and their results are kept
+    JOB_CANCEL_CHECK_INTERVAL = 1.0  # Seconds between cancellation checks while a stage streams tokens
+    # SQLite file for job status shared by worker processes; kept in memory when unset
+    JOB_STORE_PATH = os.environ.get('JOB_STORE_PATH')
+
+    # Batch Build Configuration
+    BATCH_MAX_QUERIES = 100  # Queries accepted by one /api/build_kb/batch request
+    BATCH_FETCH_CONCURRENCY = 4  # Queries fetching from their sources at the same time
+    BATCH_LLM_CONCURRENCY = int(os.environ.get('BATCH_LLM_CONCURRENCY', 4))  # Summaries generated at the same time
+
+    # Embedding Configuration
+    EMBEDDING_MODEL = "all-MiniLM-L6-v2"
+    EMBEDDING_BATCH_SIZE = 64
+    EMBEDDING_CACHE_SIZE = 20000  # Number of chunk vectors kept in memory
+    INDEX_BATCH_SIZE = 256  # Chunks embedded and indexed per batch while ingesting
+
+    # Retrieval Configuration
+    RETRIEVAL_K = int(os.environ.get('RETRIEVAL_K', 8))  # Chunks retrieved per question, before context packing
+    RETRIEVAL_FETCH_K = 20  # Candidates taken from each of the dense and BM25 searches
+    RRF_K = 60  # Reciprocal-rank fusion constant
+    BM25_K1 = 1.5
+    BM25_B = 0.75
+    RERANK_ENABLED = os.environ.get('RERANK_ENABLED', '0') == '1'
+    RERANK_MODEL = "cross-encoder/ms-marco-MiniLM-L-6-v2"
+    # Time a retrieval may take before reranking is cut short
+    RETRIEVAL_LATENCY_BUDGET_MS = float(os.environ.get('RETRIEVAL_LATENCY_BUDGET_MS', 250))
+
+    # Context Packing Configuration
+    # Context window per model in tokens; the answer's MAX_TOKENS are reserved from it
+    CONTEXT_WINDOWS = {
+        'llama3.2': 8192,
+        'anthropic.claude-3-sonnet-20240229-v1:0': 200000,
+    }
+    DEFAULT_CONTEXT_WINDOW = 8192
+    # Retrieved text allowed in one prompt, however large the model's window
+    CONTEXT_MAX_TOKENS = int(os.environ.get('CONTEXT_MAX_TOKENS', 3000))
+    CONTEXT_MIN_PASSAGE_TOKENS = 48  # Smaller leftovers of a chunk are not worth including
+
+    # Chunking Configuration
+    CHUNK_MAX_TOKENS = 256  # all-MiniLM-L6-v2 truncates input beyond 256 tokens
+    CHUNK_OVERLAP_TOKENS = 32
+    NEAR_DUPLICATE_THRESHOLD = 0.9  # Estimated Jaccard similarity treated as a duplicate
 
     # Prompts
     GENERATE_SUMMARY_PROMPT = """
@@ -73,12 +181,37 @@ class Config:
     Response:
     """
 
+    PRESCRIPTION_ANALYSIS_PROMPT = """
+    Based on the provided context and the text read from a prescription image, review the prescribed medications:
+
+    Context: {context}
+    Prescription text: {prescription}
+    Medications found: {drugs}
+
+    Please structure your response as follows:
+
+    1. Start with a 1-2 sentence overview of the prescription.
+
+    2. Then, provide a section titled "Key Points:" with one bullet point (•) per medication giving its use, the prescribed dose and frequency if legible, and the most important cautions or interactions with the other medications.
+
+    3. Finally, include a section titled "Relevant References:" with 1-3 relevant references from the context. Format each reference as:
+    [1] Author(s). Title. Journal. Year;Volume(Issue):Pages.
+
+    If there are no relevant references, use [N/A] instead. If part of the prescription is illegible, say so rather than guessing.
+
+    Response:
+    """
+
+    @classmethod
+    def context_window(cls):
+        model = cls.OLLAMA_MODEL if cls.LLM_CHOICE == 'ollama' else cls.CLAUDE_MODEL_ID
+        return cls.CONTEXT_WINDOWS.get(model, cls.DEFAULT_CONTEXT_WINDOW)
+
     @classmethod
     def init_app(cls):
+        # Called on first use of Google Cloud services (and by warm-up), not on import
+        os.environ.setdefault('GOOGLE_APPLICATION_CREDENTIALS', cls.GOOGLE_CLOUD_CREDENTIALS_PATH)
         if not os.path.exists(cls.GOOGLE_CLOUD_CREDENTIALS_PATH):
             print(f"Warning: Google Cloud credentials file not found at {cls.GOOGLE_CLOUD_CREDENTIALS_PATH}")
         else:
             print(f"Google Cloud credentials set to: {cls.GOOGLE_CLOUD_CREDENTIALS_PATH}")
-
-# Call init_app when the config is imported
-Config.init_app()
\ No newline at end of file
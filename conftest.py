@@ -0,0 +1,65 @@
+import zlib
+
+import pytest
+from langchain_core.embeddings import Embeddings
+from langchain_core.language_models.fake_chat_models import FakeListChatModel
+
+from lazy import Lazy
+from sources.base_handler import BaseSourceHandler
+from sources.registry import SourceRegistry
+
+SUMMARY = ("1. Key words: metformin, kidney\n2. Date range: 2001-2004\n3. Type of articles reviewed: trials\n"
+           "4. Summary: Metformin is safe.\n5. Recommended approach: • Check eGFR\n6. Label Information: N/A\n"
+           "7. References: • Smith J. Metformin trial.")
+
+
+class WordEmbeddings(Embeddings):
+    """Bag-of-words vectors, so texts sharing words are similar."""
+
+    def _embed(self, text):
+        vector = [0.0] * 64
+        for word in text.lower().split():
+            vector[zlib.crc32(word.encode()) % 64] += 1.0
+        return vector
+
+    def embed_documents(self, texts):
+        return [self._embed(text) for text in texts]
+
+    def embed_query(self, text):
+        return self._embed(text)
+
+
+class StubSource(BaseSourceHandler):
+    """Returns ``results[query]`` and counts the calls."""
+
+    def __init__(self, results):
+        self.results = results
+        self.queries = []
+
+    def fetch_data(self, query: str) -> list:
+        self.queries.append(query)
+        result = self.results.get(query, [])
+        if isinstance(result, Exception):
+            raise result
+        return list(result)
+
+
+@pytest.fixture
+def app_env(tmp_path, monkeypatch):
+    """The app with on-disk state under ``tmp_path``, no sources and a fake LLM answering ``SUMMARY``.
+
+    Swap the model with ``app_env.llm.set()`` and add sources with ``app_env.source_handlers.set()``.
+    """
+    import app
+    from knowledge_base import KnowledgeBase
+    from sessions import SessionRegistry
+
+    embeddings = WordEmbeddings()
+    knowledge_base = KnowledgeBase(str(tmp_path / "vector_store"), embeddings=embeddings, mmap=False)
+    monkeypatch.setattr(app, "default_knowledge_base", Lazy(lambda: knowledge_base))
+    monkeypatch.setattr(app, "session_registry", SessionRegistry(
+        chain_factory=app.make_conversation_chain, root=str(tmp_path / "sessions"), embeddings=embeddings, mmap=False))
+    monkeypatch.setattr(app, "llm", Lazy(lambda: FakeListChatModel(responses=[SUMMARY])))
+    monkeypatch.setattr(app, "semantic_cache", Lazy(lambda: None))
+    monkeypatch.setattr(app, "source_handlers", SourceRegistry())
+    return app
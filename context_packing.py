@@ -0,0 +1,179 @@
+# context_packing.py
+import logging
+from collections import OrderedDict
+
+from chunking import SENTENCE_PATTERN, TITLE_PATTERN, count_tokens, default_tokenizer, extract_title, normalize_text
+from config import Config
+from knowledge_base import document_id
+
+logger = logging.getLogger(__name__)
+
+
+class PackedContext:
+    """Context text for a prompt, with the citations and chunks it was built from."""
+
+    def __init__(self, text: str, citations: list, documents: list, tokens: int, prompt_tokens: int, stats: dict):
+        self.text = text
+        self.citations = citations
+        self.documents = documents
+        self.tokens = tokens
+        self.prompt_tokens = prompt_tokens
+        self.stats = stats
+
+
+class ContextPacker:
+    """Fits retrieved chunks into a token budget for the prompt.
+
+    Chunks are taken in retrieval order until the budget is used up; a chunk
+    that does not fit whole is cut at a sentence boundary, and one that would
+    leave fewer than ``min_passage_tokens`` is skipped. Sentences already
+    included (e.g. from chunk overlap or the same abstract fetched twice) are
+    dropped. Chunks of one source document are merged under a single numbered
+    citation such as ``[1]``, with its title written once.
+
+    The budget is the model's context window less room for the answer, the
+    prompt template and the question, and never more than ``max_tokens``.
+    """
+
+    def __init__(self, context_window: int = None, answer_tokens: int = None, max_tokens: int = None,
+                 min_passage_tokens: int = None, tokenizer=None):
+        self.context_window = context_window or Config.context_window()
+        self.answer_tokens = Config.MAX_TOKENS if answer_tokens is None else answer_tokens
+        self.max_tokens = max_tokens or Config.CONTEXT_MAX_TOKENS
+        self.min_passage_tokens = Config.CONTEXT_MIN_PASSAGE_TOKENS if min_passage_tokens is None else min_passage_tokens
+        self._tokenizer = tokenizer
+        self._template_tokens = {}
+
+    @property
+    def tokenizer(self):
+        if self._tokenizer is None:
+            self._tokenizer = default_tokenizer.get() or False
+        return self._tokenizer or None
+
+    def count_tokens(self, text: str) -> int:
+        return count_tokens(text, self.tokenizer)
+
+    def budget(self, template: str = "", question: str = "") -> int:
+        if template not in self._template_tokens:
+            self._template_tokens[template] = self.count_tokens(template)
+        available = self.context_window - self.answer_tokens - self._template_tokens[template] - self.count_tokens(question)
+        return max(0, min(self.max_tokens, available))
+
+    def pack(self, documents: list, template: str = "", question: str = "", label: str = "prompt") -> PackedContext:
+        """Pack ``documents`` (best first) for a prompt built from ``template`` and ``question``."""
+        budget = self.budget(template, question)
+        stats = {"chunks": len(documents), "used": 0, "trimmed": 0, "skipped": 0, "duplicate_sentences": 0}
+        passages = OrderedDict()  # document ID -> passage
+        seen = set()
+        used = 0
+
+        for doc in documents:
+            text = doc.page_content or ""
+            title = extract_title(text)
+            body = TITLE_PATTERN.sub("", text, count=1) if title else text
+            sentences = []
+            for sentence in SENTENCE_PATTERN.split(body):
+                sentence = sentence.strip()
+                key = normalize_text(sentence)
+                if not key:
+                    continue
+                if key in seen:
+                    stats["duplicate_sentences"] += 1
+                    continue
+                sentences.append((key, sentence, self.count_tokens(sentence) + 1))
+            if not sentences:
+                stats["skipped"] += 1
+                continue
+
+            doc_id = doc.metadata.get("doc_id") or document_id(doc)
+            passage = passages.get(doc_id)
+            header_tokens = 0
+            if passage is None:
+                passage = {
+                    "id": len(passages) + 1,
+                    "label": self._label(doc, title),
+                    "metadata": doc.metadata,
+                    "sentences": [],
+                    "documents": [],
+                }
+                header_tokens = self.count_tokens(f"[{passage['id']}] {passage['label']}\n") + 2
+
+            remaining = budget - used - header_tokens
+            cost = sum(tokens for _, _, tokens in sentences)
+            if cost > remaining:
+                if remaining < self.min_passage_tokens:
+                    stats["skipped"] += 1
+                    continue
+                sentences = self._trim(sentences, remaining)
+                if not sentences:
+                    stats["skipped"] += 1
+                    continue
+                cost = sum(tokens for _, _, tokens in sentences)
+                stats["trimmed"] += 1
+
+            passages.setdefault(doc_id, passage)
+            passage["sentences"].extend(sentence for _, sentence, _ in sentences)
+            seen.update(key for key, _, _ in sentences)
+            used += header_tokens + cost
+            stats["used"] += 1
+            passage["documents"].append(doc)
+
+        text = "\n\n".join(
+            f"[{p['id']}] {p['label']}\n{' '.join(p['sentences'])}" for p in passages.values()
+        )
+        citations = [self._citation(p) for p in passages.values()]
+        packed_documents = [doc for p in passages.values() for doc in p["documents"]]
+        tokens = self.count_tokens(text)
+        prompt_tokens = self._template_tokens.get(template, 0) + self.count_tokens(question) + tokens
+        logger.info(
+            f"Prompt tokens for {label}: {prompt_tokens} (context {tokens} of budget {budget}; {stats['used']} of "
+            f"{stats['chunks']} chunks used, {stats['trimmed']} trimmed, {stats['skipped']} skipped, "
+            f"{stats['duplicate_sentences']} duplicate sentences dropped)"
+        )
+        return PackedContext(text, citations, packed_documents, tokens, prompt_tokens, stats)
+
+    def _trim(self, sentences, remaining):
+        kept, total = [], 0
+        for key, sentence, tokens in sentences:
+            if total + tokens > remaining:
+                break
+            kept.append((key, sentence, tokens))
+            total += tokens
+        if kept:
+            return kept
+        # Text without sentence breaks (e.g. PDF tables): keep leading words
+        key, sentence, _ = sentences[0]
+        words, total = [], 0
+        for word in sentence.split():
+            tokens = self.count_tokens(word)
+            if total + tokens > remaining - 1:
+                break
+            words.append(word)
+            total += tokens
+        return [(key, " ".join(words), total)] if words else []
+
+    @staticmethod
+    def _label(doc, title):
+        metadata = doc.metadata
+        if title:
+            details = [part for part in (ContextPacker._authors(metadata.get("authors")), metadata.get("journal"),
+                                         metadata.get("year")) if part]
+            return f"Title: {title} ({'; '.join(str(part) for part in details)})" if details else f"Title: {title}"
+        if metadata.get("file"):
+            return f"{metadata['file']}, page {metadata.get('page', '?')}"
+        return f"Source: {metadata.get('source', 'unknown')}"
+
+    @staticmethod
+    def _authors(authors):
+        if not authors:
+            return None
+        return ", ".join(authors[:3]) + (" et al." if len(authors) > 3 else "")
+
+    @staticmethod
+    def _citation(passage):
+        metadata = passage["metadata"]
+        citation = {"id": passage["id"], "label": passage["label"], "source": metadata.get("source")}
+        for key in ("doc_id", "pmid", "doi", "url", "journal", "year", "authors", "file", "page"):
+            if metadata.get(key) is not None:
+                citation[key] = metadata[key]
+        return citation
@@ -0,0 +1,108 @@
+# embedding_service.py
+import hashlib
+import logging
+import threading
+from collections import OrderedDict
+
+from langchain_core.embeddings import Embeddings
+
+from config import Config
+from lazy import Lazy
+from observability import stage
+
+logger = logging.getLogger(__name__)
+
+
+def text_hash(text: str) -> str:
+    return hashlib.sha256(text.encode("utf-8")).hexdigest()
+
+
+class EmbeddingService(Embeddings):
+    """Batched, cached embeddings on top of a single shared model.
+
+    The underlying model is only loaded on first use. Vectors are kept in an LRU
+    cache keyed by the SHA-256 of the chunk text, so repeated abstracts are never
+    encoded twice.
+    """
+
+    def __init__(self, model=None, model_name: str = None, batch_size: int = None, cache_size: int = None):
+        self._model = model
+        self.model_name = model_name or Config.EMBEDDING_MODEL
+        self.batch_size = batch_size or Config.EMBEDDING_BATCH_SIZE
+        self.cache_size = Config.EMBEDDING_CACHE_SIZE if cache_size is None else cache_size
+        self._cache = OrderedDict()
+        self._lock = threading.Lock()
+        self._model_lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    @property
+    def model(self):
+        if self._model is None:
+            with self._model_lock:
+                if self._model is None:
+                    from langchain_community.embeddings import HuggingFaceEmbeddings
+                    logger.info(f"Loading embedding model '{self.model_name}'")
+                    self._model = HuggingFaceEmbeddings(model_name=self.model_name)
+        return self._model
+
+    def _cache_get(self, key):
+        with self._lock:
+            vector = self._cache.get(key)
+            if vector is not None:
+                self._cache.move_to_end(key)
+                self.hits += 1
+            else:
+                self.misses += 1
+            return vector
+
+    def _cache_put(self, key, vector):
+        if self.cache_size <= 0:
+            return
+        with self._lock:
+            self._cache[key] = vector
+            self._cache.move_to_end(key)
+            while len(self._cache) > self.cache_size:
+                self._cache.popitem(last=False)
+
+    def embed_documents(self, texts: list) -> list:
+        keys = [text_hash(text) for text in texts]
+        vectors = [self._cache_get(key) for key in keys]
+
+        # Encode each distinct missing text once, in batches
+        missing = OrderedDict()
+        for i, (key, vector) in enumerate(zip(keys, vectors)):
+            if vector is None:
+                missing.setdefault(key, []).append(i)
+        missing_keys = list(missing)
+        for start in range(0, len(missing_keys), self.batch_size):
+            batch_keys = missing_keys[start:start + self.batch_size]
+            batch_texts = [texts[missing[key][0]] for key in batch_keys]
+            with stage("embed"):
+                batch_vectors = self.model.embed_documents(batch_texts)
+            for key, vector in zip(batch_keys, batch_vectors):
+                vector = list(vector)
+                self._cache_put(key, vector)
+                for i in missing[key]:
+                    vectors[i] = vector
+
+        if missing_keys:
+            logger.info(f"Embedded {len(missing_keys)} new chunks ({len(texts) - len(missing_keys)} reused from cache)")
+        return vectors
+
+    def embed_query(self, text: str) -> list:
+        return self.embed_documents([text])[0]
+
+    def stats(self) -> dict:
+        with self._lock:
+            total = self.hits + self.misses
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": self.hits / total if total else 0.0,
+                "size": len(self._cache),
+            }
+
+
+# Process-wide embedding service
+default_embedding_service = Lazy(EmbeddingService)
@@ -0,0 +1,155 @@
+# formatting.py
+import html
+import re
+
+from config import Config
+
+DISCLAIMER = (
+    "The information mentioned above may be outside of the current label indication for Product X in [country] "
+    "and has been provided following an unsolicited request for information from a treating physician. "
+    "Company ABC is providing this information as a scientific service further to an unsolicited request "
+    "and not in a promotional context."
+)
+
+
+def truncate_words(text, limit=None):
+    limit = limit or Config.MAX_TOKENS
+    words = text.split()
+    if len(words) > limit:
+        return ' '.join(words[:limit]) + '...'
+    return text
+
+
+def parse_summary(summary_text):
+    sections = {
+        'Key words': r'Key words:(.*?)(?=\n\d\.)',
+        'Date range': r'Date range:(.*?)(?=\n\d\.)',
+        'Type of articles reviewed': r'Type of articles reviewed:(.*?)(?=\n\d\.)',
+        'Summary': r'Summary:(.*?)(?=\n\d\.)',
+        'Recommended approach': r'Recommended approach:(.*?)(?=\n\d\.)',
+        'Label Information': r'Label Information:(.*?)(?=\n\d\.)',
+        'References': r'References:(.*?)$'
+    }
+
+    parsed = {}
+    for key, pattern in sections.items():
+        match = re.search(pattern, summary_text, re.DOTALL)
+        if match:
+            content = match.group(1).strip()
+            if key in ['Recommended approach', 'References']:
+                parsed[key] = [item.strip() for item in re.split(r'\s*•\s*', content) if item.strip()]
+            else:
+                parsed[key] = content
+
+    return parsed
+
+
+def format_summary(query, parsed_summary, articles_reviewed):
+    formatted_summary = f"""
+        <h2>Summary</h2>
+        <p><strong>Query:</strong> {query}</p>
+        <p><strong>Key words:</strong> {parsed_summary.get('Key words', 'N/A')}</p>
+        <p><strong>Date range:</strong> {parsed_summary.get('Date range', 'N/A')}</p>
+        <p><strong>Number of articles reviewed:</strong> {articles_reviewed}</p>
+        <p><strong>Type of articles reviewed:</strong> {parsed_summary.get('Type of articles reviewed', 'N/A')}</p>
+
+        <h3>Response:</h3>
+        <p>Dear Dr.,</p>
+        <p>{parsed_summary.get('Summary', 'N/A')}</p>
+
+        <h3>Recommended approach:</h3>
+        <ul>
+        {"".join(f"<li>{rec.strip()}</li>" for rec in parsed_summary.get('Recommended approach', []) if rec.strip())}
+        </ul>
+
+        <h3>Label Information:</h3>
+        <p>{parsed_summary.get('Label Information', 'N/A')}</p>
+
+        <p><em>{DISCLAIMER}</em></p>
+        """
+
+    # Always include the References section, even if it's empty
+    formatted_summary += """
+        <h3>References:</h3>
+        <ol>
+        """
+    if parsed_summary.get('References'):
+        formatted_summary += "".join(f"<li>{ref.strip()}</li>" for ref in parsed_summary['References'] if ref.strip() and ref.strip() != '[N/A]')
+    else:
+        formatted_summary += "<li>No references available</li>"
+    formatted_summary += "</ol>"
+    return formatted_summary
+
+
+def format_chat_section(section):
+    if section.startswith("Direct Answer:"):
+        return f"<p>{section.replace('Direct Answer:', '').strip()}</p>"
+    if section.startswith("Key Points:"):
+        formatted = "<h3>Key Points:</h3><ul>"
+        points = [point.strip() for point in section.split('•')[1:] if point.strip()]
+        for point in points:
+            formatted += f"<li>{point}</li>\n"
+        return formatted + "</ul>"
+    if section.startswith("Relevant References:"):
+        formatted = "<h3>Relevant References:</h3><ol>"
+        references = [ref.strip() for ref in section.split('\n')[1:] if ref.strip() and ref.strip() != '[N/A]']
+        if references:
+            for ref in references:
+                formatted += f"<li>{ref}</li>"
+        else:
+            formatted += "<li>No relevant references available</li>"
+        return formatted + "</ol>"
+    return f"<p>{section}</p>"
+
+
+def format_chat_response(answer):
+    return "".join(format_chat_section(section) for section in answer.split('\n\n'))
+
+
+def format_prescription_analysis(prescription_text, drugs, answer=None):
+    formatted = f"<p><strong>Medications found:</strong> {html.escape(', '.join(drugs)) or 'None recognised'}</p>"
+    if answer:
+        formatted += format_chat_response(answer)
+    else:
+        formatted += "<p>No medications could be recognised in the image. Please check that it is sharp and well lit.</p>"
+    return formatted + f"<h3>Text read from the image:</h3><pre>{html.escape(prescription_text.strip())}</pre>"
+
+
+class ChatResponseFormatter:
+    """Formats a streamed chat answer one section at a time.
+
+    Sections are separated by blank lines; each is rendered as soon as the next
+    one starts, and the last one when the stream ends.
+    """
+
+    def __init__(self, max_words=None):
+        self.max_words = max_words or Config.MAX_TOKENS
+        self.buffer = ""
+        self.words = 0
+        self.truncated = False
+        self._in_word = False
+
+    def feed(self, text):
+        """Add streamed text and return the text actually accepted plus any completed sections."""
+        if self.truncated:
+            return "", []
+        # Count words across chunk boundaries and cut at the word limit
+        for i, char in enumerate(text):
+            if not char.isspace() and not self._in_word:
+                if self.words >= self.max_words:
+                    text = text[:i].rstrip() + "..."
+                    self.truncated = True
+                    break
+                self.words += 1
+            self._in_word = not char.isspace()
+        self.buffer += text
+
+        sections = []
+        while '\n\n' in self.buffer:
+            section, self.buffer = self.buffer.split('\n\n', 1)
+            sections.append(format_chat_section(section))
+        return text, sections
+
+    def finish(self):
+        section, self.buffer = self.buffer, ""
+        return [format_chat_section(section)] if section else []
@@ -0,0 +1,184 @@
+# index_store.py
+import logging
+import os
+import pickle
+import re
+import shutil
+import threading
+import uuid
+from contextlib import contextmanager
+
+from langchain_community.vectorstores import FAISS
+
+from config import Config
+
+try:
+    import fcntl
+except ImportError:  # Windows: only threads of one process are serialized
+    fcntl = None
+
+logger = logging.getLogger(__name__)
+
+POINTER_FILE = "index.current"
+LOCK_FILE = "index.lock"
+VERSION_PATTERN = re.compile(r"^index\.v(\d+)$")
+TEMP_PREFIX = "index.tmp-"
+LEGACY = ""  # Version name of an index saved directly in the directory by older releases
+
+_thread_locks = {}
+_thread_locks_lock = threading.Lock()
+
+
+def _thread_lock(path):
+    # flock does not exclude other threads of the same process, so pair it with a thread lock
+    with _thread_locks_lock:
+        return _thread_locks.setdefault(os.path.abspath(path), threading.RLock())
+
+
+def mmap_flag() -> int:
+    import faiss
+    # IO_FLAG_MMAP_IFC maps flat vectors (faiss >= 1.11); older releases only honour IO_FLAG_MMAP
+    return getattr(faiss, "IO_FLAG_MMAP_IFC", faiss.IO_FLAG_MMAP | faiss.IO_FLAG_READ_ONLY)
+
+
+def with_index(vector_store, index):
+    """Copy of ``vector_store`` sharing its docstore but searching ``index``."""
+    return FAISS(vector_store.embedding_function, index, vector_store.docstore, vector_store.index_to_docstore_id)
+
+
+class IndexStore:
+    """Versioned FAISS index in one directory, safe to share between processes.
+
+    Every write saves a complete index to a temporary directory, renames it to
+    ``index.v<N>`` and then atomically replaces ``index.current`` with the new
+    version's name, so readers always load a whole version. Writers hold an
+    exclusive file lock on ``index.lock``; the newest ``keep`` versions are
+    kept for readers still opening them. Indexes can be loaded memory-mapped
+    and read-only, letting every worker share one copy through the page cache.
+    """
+
+    def __init__(self, path: str, keep: int = None):
+        self.path = path
+        self.keep = Config.VECTOR_STORE_VERSIONS_KEPT if keep is None else keep
+
+    def current(self):
+        """Name of the live version, ``LEGACY`` for an unversioned index, or ``None``."""
+        try:
+            with open(os.path.join(self.path, POINTER_FILE), encoding="utf-8") as file:
+                return file.read().strip() or None
+        except FileNotFoundError:
+            pass
+        if os.path.exists(os.path.join(self.path, "index.faiss")):
+            return LEGACY
+        return None
+
+    def exists(self) -> bool:
+        return self.current() is not None
+
+    def _marker(self):
+        pointer = os.path.join(self.path, POINTER_FILE)
+        return pointer if os.path.exists(pointer) else os.path.join(self.path, "index.faiss")
+
+    def mtime(self):
+        """Last write or :meth:`touch` of the index, or ``None`` if there is none."""
+        try:
+            return os.path.getmtime(self._marker())
+        except OSError:
+            return None
+
+    def touch(self):
+        try:
+            os.utime(self._marker())
+        except OSError:
+            pass
+
+    @contextmanager
+    def lock(self):
+        """Exclusive lock for writers, across threads and processes."""
+        with _thread_lock(self.path):
+            os.makedirs(self.path, exist_ok=True)
+            with open(os.path.join(self.path, LOCK_FILE), "a") as file:
+                if fcntl is not None:
+                    fcntl.flock(file, fcntl.LOCK_EX)
+                try:
+                    yield
+                finally:
+                    if fcntl is not None:
+                        fcntl.flock(file, fcntl.LOCK_UN)
+
+    def load(self, embeddings, mmap: bool = False):
+        """Load the live version. Returns ``(vector_store, version)``, or ``(None, None)`` if there is none.
+
+        With ``mmap`` the vectors are mapped read-only: the store can be
+        searched and reconstructed from, but not added to.
+        """
+        for attempt in range(3):
+            version = self.current()
+            if version is None:
+                return None, None
+            try:
+                return self._read(version, embeddings, mmap), version
+            except (FileNotFoundError, RuntimeError) as e:
+                # Pruned between reading the pointer and opening the files
+                if attempt == 2 or self.current() == version:
+                    raise
+                logger.info(f"Index version {version} in {self.path} was replaced while loading, retrying: {str(e)}")
+
+    def _read(self, version, embeddings, mmap):
+        import faiss
+
+        folder = os.path.join(self.path, version)
+        index = faiss.read_index(os.path.join(folder, "index.faiss"), mmap_flag() if mmap else 0)
+        with open(os.path.join(folder, "index.pkl"), "rb") as file:
+            docstore, index_to_docstore_id = pickle.load(file)
+        return FAISS(embeddings, index, docstore, index_to_docstore_id)
+
+    def map(self, vector_store, version: str):
+        """Swap ``vector_store``'s index for a read-only mapping of ``version`` on disk."""
+        import faiss
+        index = faiss.read_index(os.path.join(self.path, version, "index.faiss"), mmap_flag())
+        return with_index(vector_store, index)
+
+    def write(self, vector_store) -> str:
+        """Save ``vector_store`` as a new version and make it live. Call while holding :meth:`lock`."""
+        os.makedirs(self.path, exist_ok=True)
+        numbers = [int(match.group(1)) for match in map(VERSION_PATTERN.match, os.listdir(self.path)) if match]
+        version = f"index.v{max(numbers, default=0) + 1}"
+        temp = os.path.join(self.path, f"{TEMP_PREFIX}{os.getpid()}-{uuid.uuid4().hex[:8]}")
+        try:
+            vector_store.save_local(temp)
+            os.rename(temp, os.path.join(self.path, version))
+        except BaseException:
+            shutil.rmtree(temp, ignore_errors=True)
+            raise
+
+        pointer = os.path.join(self.path, POINTER_FILE)
+        temp_pointer = f"{temp}.current"
+        with open(temp_pointer, "w", encoding="utf-8") as file:
+            file.write(version)
+            file.flush()
+            os.fsync(file.fileno())
+        os.replace(temp_pointer, pointer)
+        self._prune(version)
+        return version
+
+    def _prune(self, live):
+        versions = sorted(
+            ((int(match.group(1)), name) for name in os.listdir(self.path)
+             for match in [VERSION_PATTERN.match(name)] if match),
+            reverse=True,
+        )
+        for _, name in versions[max(self.keep, 1):]:
+            if name != live:
+                shutil.rmtree(os.path.join(self.path, name), ignore_errors=True)
+        # Leftovers of writers that died mid-write; the lock guarantees none is in progress
+        for name in os.listdir(self.path):
+            if name.startswith(TEMP_PREFIX):
+                target = os.path.join(self.path, name)
+                if os.path.isdir(target):
+                    shutil.rmtree(target, ignore_errors=True)
+                else:
+                    os.remove(target)
+
+    def remove(self):
+        shutil.rmtree(self.path, ignore_errors=True)
@@ -0,0 +1,354 @@
+# jobs.py
+import contextvars
+import json
+import logging
+import os
+import queue
+import sqlite3
+import threading
+import time
+import uuid
+from abc import ABC, abstractmethod
+from contextlib import contextmanager
+
+from config import Config
+from observability import JOBS
+
+logger = logging.getLogger(__name__)
+
+QUEUED = "queued"
+RUNNING = "running"
+DONE = "done"
+FAILED = "failed"
+CANCELLED = "cancelled"
+FINISHED_STATES = {DONE, FAILED, CANCELLED}
+
+
+class QueueFullError(Exception):
+    pass
+
+
+class Job:
+    def __init__(self, kind: str, stages: list = None, job_id: str = None):
+        self.id = job_id or uuid.uuid4().hex
+        self.kind = kind
+        self.stages = list(stages or [])
+        self.status = QUEUED
+        self.stage = None
+        self.message = None
+        self.result = None
+        self.error = None
+        self.timings = {}
+        self.created_at = time.time()
+        self.started_at = None
+        self.finished_at = None
+        self.cancel_requested = False
+        self._stage_started = None
+
+    @property
+    def finished(self) -> bool:
+        return self.status in FINISHED_STATES
+
+    @property
+    def progress(self) -> float:
+        if self.status == DONE:
+            return 1.0
+        if self.stage in self.stages:
+            return round(self.stages.index(self.stage) / len(self.stages), 2)
+        return 0.0
+
+    def enter_stage(self, stage: str, message: str = None):
+        now = time.monotonic()
+        self._close_stage(now)
+        self.stage = stage
+        self.message = message
+        self._stage_started = now
+
+    def _close_stage(self, now=None):
+        if self.stage is not None and self._stage_started is not None:
+            now = now or time.monotonic()
+            self.timings[self.stage] = round(self.timings.get(self.stage, 0) + now - self._stage_started, 3)
+        self._stage_started = None
+
+    def to_dict(self) -> dict:
+        return {
+            "job_id": self.id,
+            "kind": self.kind,
+            "status": self.status,
+            "stage": self.stage,
+            "message": self.message,
+            "progress": self.progress,
+            "timings": self.timings,
+            "error": self.error,
+            "cancel_requested": self.cancel_requested,
+            "created_at": self.created_at,
+            "started_at": self.started_at,
+            "finished_at": self.finished_at,
+        }
+
+    @classmethod
+    def from_dict(cls, data: dict) -> "Job":
+        job = cls(data["kind"], data.get("stages"), job_id=data["job_id"])
+        for key in ("status", "stage", "message", "result", "error", "timings", "created_at", "started_at",
+                    "finished_at", "cancel_requested"):
+            if key in data:
+                setattr(job, key, data[key])
+        return job
+
+
+class JobBackend(ABC):
+    """Storage and queueing for jobs. Swap in another backend to run jobs out of process."""
+
+    @abstractmethod
+    def save(self, job: Job):
+        pass
+
+    @abstractmethod
+    def get(self, job_id: str):
+        pass
+
+    @abstractmethod
+    def enqueue(self, job_id: str):
+        pass
+
+    @abstractmethod
+    def dequeue(self, timeout: float = None):
+        pass
+
+    def cancel_requested(self, job: Job) -> bool:
+        """Whether cancellation of the running ``job`` has been requested, possibly from another process."""
+        return job.cancel_requested
+
+
+class InMemoryJobBackend(JobBackend):
+    """Keeps jobs in a dict and queued IDs in a bounded ``queue.Queue``."""
+
+    def __init__(self, max_queue: int = None, retention: float = None):
+        self.retention = Config.JOB_RETENTION if retention is None else retention
+        self._jobs = {}
+        self._queue = queue.Queue(maxsize=Config.JOB_QUEUE_SIZE if max_queue is None else max_queue)
+        self._lock = threading.Lock()
+
+    def save(self, job: Job):
+        with self._lock:
+            self._jobs[job.id] = job
+            self._purge()
+
+    def get(self, job_id: str):
+        with self._lock:
+            return self._jobs.get(job_id)
+
+    def enqueue(self, job_id: str):
+        try:
+            self._queue.put_nowait(job_id)
+        except queue.Full:
+            raise QueueFullError("Too many jobs queued, please retry later")
+
+    def dequeue(self, timeout: float = None):
+        try:
+            return self._queue.get(timeout=timeout)
+        except queue.Empty:
+            return None
+
+    def _purge(self):
+        cutoff = time.time() - self.retention
+        for job_id, job in list(self._jobs.items()):
+            if job.finished and job.finished_at < cutoff:
+                del self._jobs[job_id]
+
+
+class SQLiteJobBackend(InMemoryJobBackend):
+    """Keeps job state in a SQLite file shared by worker processes.
+
+    A job still runs in the process that accepted it (tasks are closures, so
+    the queue stays in memory), but its status, result and cancellation are
+    visible to every process, wherever a status request lands.
+    """
+
+    def __init__(self, path: str, max_queue: int = None, retention: float = None):
+        super().__init__(max_queue, retention)
+        self.path = path
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        with self._connect() as conn:
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS jobs ("
+                " id TEXT PRIMARY KEY,"
+                " data TEXT NOT NULL,"
+                " cancel_requested INTEGER NOT NULL DEFAULT 0,"
+                " finished_at REAL)"
+            )
+
+    @contextmanager
+    def _connect(self):
+        conn = sqlite3.connect(self.path, timeout=10)
+        try:
+            with conn:
+                yield conn
+        finally:
+            conn.close()
+
+    def save(self, job: Job):
+        data = job.to_dict()
+        data["stages"] = job.stages
+        data["result"] = job.result
+        with self._connect() as conn:
+            # A cancel request saved by another process is never cleared by the running one
+            conn.execute(
+                "INSERT INTO jobs (id, data, cancel_requested, finished_at) VALUES (?, ?, ?, ?)"
+                " ON CONFLICT(id) DO UPDATE SET data = excluded.data,"
+                " cancel_requested = MAX(cancel_requested, excluded.cancel_requested),"
+                " finished_at = excluded.finished_at",
+                (job.id, json.dumps(data), int(job.cancel_requested), job.finished_at),
+            )
+            conn.execute("DELETE FROM jobs WHERE finished_at < ?", (time.time() - self.retention,))
+
+    def get(self, job_id: str):
+        with self._connect() as conn:
+            row = conn.execute("SELECT data, cancel_requested FROM jobs WHERE id = ?", (job_id,)).fetchone()
+        if row is None:
+            return None
+        job = Job.from_dict(json.loads(row[0]))
+        job.cancel_requested = bool(row[1])
+        return job
+
+    def cancel_requested(self, job: Job) -> bool:
+        if job.cancel_requested:
+            return True
+        with self._connect() as conn:
+            row = conn.execute("SELECT cancel_requested FROM jobs WHERE id = ?", (job.id,)).fetchone()
+        job.cancel_requested = bool(row and row[0])
+        return job.cancel_requested
+
+
+def default_backend() -> JobBackend:
+    if Config.JOB_STORE_PATH:
+        return SQLiteJobBackend(Config.JOB_STORE_PATH)
+    return InMemoryJobBackend()
+
+
+class JobManager:
+    """Runs event-producing tasks on a bounded pool of worker threads.
+
+    A task is a callable returning an iterator of ``(event, data)`` pairs, the
+    same shape produced by the streaming endpoints: ``progress`` events move the
+    job to a new stage, ``result`` completes it and ``error`` fails it.
+    Cancellation is checked at each stage change and at most every
+    ``JOB_CANCEL_CHECK_INTERVAL`` seconds in between.
+    """
+
+    def __init__(self, backend: JobBackend = None, workers: int = None):
+        self.backend = backend or default_backend()
+        self.workers = workers or Config.JOB_WORKERS
+        self._tasks = {}
+        self._lock = threading.Lock()
+        self._threads = []
+
+    def _ensure_workers(self):
+        with self._lock:
+            if self._threads:
+                return
+            for i in range(self.workers):
+                thread = threading.Thread(target=self._work, name=f"job-worker-{i}", daemon=True)
+                thread.start()
+                self._threads.append(thread)
+
+    def submit(self, kind: str, task, stages: list = None) -> Job:
+        job = Job(kind, stages)
+        # The task runs in a copy of the submitter's context, keeping its request ID in logs
+        context = contextvars.copy_context()
+        with self._lock:
+            self._tasks[job.id] = (task, context)
+        self.backend.save(job)
+        try:
+            self.backend.enqueue(job.id)
+        except QueueFullError:
+            with self._lock:
+                self._tasks.pop(job.id, None)
+            job.status = FAILED
+            job.error = "Queue full"
+            job.finished_at = time.time()
+            self.backend.save(job)
+            raise
+        self._ensure_workers()
+        return job
+
+    def get(self, job_id: str):
+        return self.backend.get(job_id)
+
+    def cancel(self, job_id: str):
+        job = self.backend.get(job_id)
+        if job is None or job.finished:
+            return job
+        job.cancel_requested = True
+        if job.status == QUEUED:
+            self._finish(job, CANCELLED)
+            JOBS.inc(kind=job.kind, status=CANCELLED)
+        self.backend.save(job)
+        return job
+
+    def _finish(self, job, status, error=None):
+        job._close_stage()
+        job.status = status
+        job.error = error
+        job.finished_at = time.time()
+        with self._lock:
+            self._tasks.pop(job.id, None)
+
+    def _work(self):
+        while True:
+            job_id = self.backend.dequeue(timeout=1)
+            if job_id is None:
+                continue
+            job = self.backend.get(job_id)
+            with self._lock:
+                entry = self._tasks.get(job_id)
+            if job is None or entry is None or job.finished:
+                # Unknown, or cancelled while queued (possibly by another process)
+                with self._lock:
+                    self._tasks.pop(job_id, None)
+                continue
+            task, context = entry
+            context.run(self._run, job, task)
+
+    def _run(self, job, task):
+        job.status = RUNNING
+        job.started_at = time.time()
+        self.backend.save(job)
+        events = None
+        last_check = time.monotonic()
+        try:
+            events = iter(task())
+            for event, data in events:
+                # Token events only check for cancellation now and then, and never change the saved job
+                now = time.monotonic()
+                if event == "progress" or now - last_check >= Config.JOB_CANCEL_CHECK_INTERVAL:
+                    last_check = now
+                    if self.backend.cancel_requested(job):
+                        self._finish(job, CANCELLED)
+                        break
+                if event == "progress":
+                    state = (job.stage, job.message)
+                    job.enter_stage(data.get("stage"), data.get("message"))
+                    if (job.stage, job.message) != state:
+                        self.backend.save(job)
+                elif event == "result":
+                    job.result = data
+                    self._finish(job, DONE)
+                    self.backend.save(job)
+                elif event == "error":
+                    self._finish(job, FAILED, data.get("error"))
+                    self.backend.save(job)
+            if not job.finished:
+                self._finish(job, FAILED, "Job ended without a result")
+        except Exception as e:
+            logger.error(f"Error in {job.kind} job {job.id}: {str(e)}")
+            self._finish(job, FAILED, str(e))
+        finally:
+            if events is not None and hasattr(events, "close"):
+                events.close()
+            self.backend.save(job)
+        JOBS.inc(kind=job.kind, status=job.status)
+        logger.info(f"{job.kind} job {job.id} {job.status} in {job.finished_at - job.started_at:.2f}s {job.timings}")
@@ -0,0 +1,197 @@
+# knowledge_base.py
+import logging
+import threading
+
+from langchain_community.vectorstores import FAISS
+from langchain_core.documents import Document
+
+from config import Config
+from embedding_service import default_embedding_service, text_hash
+from index_store import IndexStore
+from lazy import Lazy
+from observability import stage
+
+logger = logging.getLogger(__name__)
+
+# Metadata keys that identify an article independently of how it was fetched
+STABLE_ID_KEYS = ("pmid", "doi", "url")
+
+
+def document_id(doc) -> str:
+    """Stable ID for a source document: PMID, DOI or URL when known, else a content hash."""
+    for key in STABLE_ID_KEYS:
+        value = doc.metadata.get(key)
+        if value:
+            return f"{key}:{str(value).strip().lower()}"
+    return f"sha256:{text_hash(doc.page_content)}"
+
+
+def source_document(record, source: str) -> Document:
+    """Document for one handler result: plain text, or a record with ``page_content`` and ``metadata``."""
+    if isinstance(record, dict):
+        return Document(page_content=record["page_content"], metadata={**record.get("metadata", {}), "source": source})
+    return Document(page_content=record, metadata={"source": source})
+
+
+def assign_document_ids(documents: list) -> list:
+    """Record ``doc_id`` in each document's metadata so split chunks inherit it."""
+    for doc in documents:
+        doc.metadata.setdefault("doc_id", document_id(doc))
+    return documents
+
+
+def chunk_id(chunk) -> str:
+    doc_id = chunk.metadata.get("doc_id") or document_id(chunk)
+    return text_hash(f"{doc_id}\n{chunk.page_content}")
+
+
+class KnowledgeBase:
+    """Persistent FAISS corpus that grows incrementally.
+
+    Chunks are keyed by a stable ID derived from their source document, so adding
+    the same article twice is a no-op and only new chunks are embedded. The index
+    lives in an :class:`IndexStore` under ``path`` that several worker processes
+    can share: it is loaded (memory-mapped when ``mmap``) on first access and
+    reloaded whenever another process has written a newer version. Writes take
+    the store's lock and apply on top of the latest version, so concurrent
+    builds never overwrite each other's chunks.
+    """
+
+    def __init__(self, path: str = None, embeddings=None, mmap: bool = None):
+        self.path = path or Config.VECTOR_STORE_PATH
+        self.embeddings = embeddings or default_embedding_service.get()
+        self.mmap = Config.VECTOR_STORE_MMAP if mmap is None else mmap
+        self.store = IndexStore(self.path)
+        self._vector_store = None
+        self._version = None
+        self._mapped = False
+        self._ids = set()
+        self._loaded = False
+        self._lock = threading.RLock()
+
+    @property
+    def vector_store(self):
+        with self._lock:
+            if not self._loaded or self.store.current() != self._version:
+                self._load()
+            return self._vector_store
+
+    def _load(self, mmap=None):
+        mmap = self.mmap if mmap is None else mmap
+        try:
+            store, version = self.store.load(self.embeddings, mmap=mmap)
+        except Exception as e:
+            logger.error(f"Error loading vector store from {self.path}: {str(e)}")
+            store, version = None, None
+        if store is not None:
+            logger.info(f"Loaded vector store {version or 'index'} from {self.path} with {store.index.ntotal} chunks"
+                        + (" (memory-mapped)" if mmap else ""))
+        self._set(store, version, mmap and store is not None)
+        self._loaded = True
+
+    def _set(self, store, version, mapped):
+        self._vector_store = store
+        self._version = version
+        self._mapped = mapped
+        self._ids = set(store.index_to_docstore_id.values()) if store is not None else set()
+
+    def __len__(self):
+        store = self.vector_store
+        return store.index.ntotal if store is not None else 0
+
+    def __contains__(self, id_):
+        self.vector_store
+        return id_ in self._ids
+
+    def add_documents(self, chunks: list) -> dict:
+        """Embed and index the chunks that are not already stored.
+
+        Returns counts of ``added`` and ``skipped`` chunks along with the ``ids`` of
+        every distinct chunk passed in.
+        """
+        with self._lock:
+            self.vector_store
+            ids, new_ids, new_chunks = [], [], []
+            seen = set()
+            for chunk in chunks:
+                id_ = chunk_id(chunk)
+                if id_ in seen:
+                    continue
+                seen.add(id_)
+                ids.append(id_)
+                if id_ in self._ids:
+                    continue
+                new_ids.append(id_)
+                new_chunks.append(chunk)
+
+            added = 0
+            if new_chunks:
+                vectors = self.embeddings.embed_documents([chunk.page_content for chunk in new_chunks])
+                with stage("index"), self.store.lock():
+                    added = self._append(new_ids, new_chunks, vectors)
+
+            skipped = len(chunks) - added
+            logger.info(f"Indexed {added} new chunks, skipped {skipped} already stored")
+            return {"added": added, "skipped": skipped, "ids": ids}
+
+    def _append(self, new_ids, new_chunks, vectors) -> int:
+        # Start from the latest version on disk, in writable memory
+        if self._mapped or self.store.current() != self._version:
+            self._load(mmap=False)
+        store = self._vector_store
+        pending = [(id_, chunk, vector) for id_, chunk, vector in zip(new_ids, new_chunks, vectors)
+                   if id_ not in self._ids]
+        if not pending:
+            return 0
+        text_embeddings = [(chunk.page_content, vector) for _, chunk, vector in pending]
+        metadatas = [chunk.metadata for _, chunk, _ in pending]
+        pending_ids = [id_ for id_, _, _ in pending]
+        if store is None:
+            store = FAISS.from_embeddings(text_embeddings, self.embeddings, metadatas=metadatas, ids=pending_ids)
+        else:
+            store.add_embeddings(text_embeddings, metadatas=metadatas, ids=pending_ids)
+        version = self.store.write(store)
+        if self.mmap:
+            self._set(self.store.map(store, version), version, True)
+        else:
+            self._set(store, version, False)
+        return len(pending)
+
+    def subset(self, ids: list):
+        """Build a standalone FAISS store over the given chunk IDs.
+
+        Vectors are copied out of the shared index, so nothing is re-embedded.
+        """
+        with self._lock:
+            store = self.vector_store
+            if store is None or not ids:
+                return None
+            positions = {id_: i for i, id_ in store.index_to_docstore_id.items()}
+            text_embeddings, metadatas, kept = [], [], []
+            for id_ in ids:
+                if id_ not in positions:
+                    continue
+                doc = store.docstore.search(id_)
+                text_embeddings.append((doc.page_content, store.index.reconstruct(positions[id_]).tolist()))
+                metadatas.append(doc.metadata)
+                kept.append(id_)
+        if not kept:
+            return None
+        with stage("index", scope="session"):
+            return FAISS.from_embeddings(text_embeddings, self.embeddings, metadatas=metadatas, ids=kept)
+
+    def save(self):
+        """Write the in-memory index as a new version."""
+        with self._lock, self.store.lock():
+            if self._vector_store is not None:
+                self._version = self.store.write(self._vector_store)
+
+    def as_retriever(self, **kwargs):
+        store = self.vector_store
+        if store is None:
+            raise ValueError("Knowledge base is empty")
+        return store.as_retriever(**kwargs)
+
+
+# Process-wide knowledge base
+default_knowledge_base = Lazy(KnowledgeBase)
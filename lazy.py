@@ -0,0 +1,38 @@
+# lazy.py
+import threading
+
+
+class Lazy:
+    """Thread-safe holder that builds an expensive object on first ``get()``.
+
+    ``set()`` replaces the object (useful for tests and benchmarks) and
+    ``reset()`` forces the next ``get()`` to build it again.
+    """
+
+    def __init__(self, factory):
+        self.factory = factory
+        self._value = None
+        self._initialized = False
+        self._lock = threading.Lock()
+
+    @property
+    def initialized(self) -> bool:
+        return self._initialized
+
+    def get(self):
+        if not self._initialized:
+            with self._lock:
+                if not self._initialized:
+                    self._value = self.factory()
+                    self._initialized = True
+        return self._value
+
+    def set(self, value):
+        with self._lock:
+            self._value = value
+            self._initialized = True
+
+    def reset(self):
+        with self._lock:
+            self._value = None
+            self._initialized = False
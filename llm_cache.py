@@ -0,0 +1,244 @@
+# llm_cache.py
+import hashlib
+import json
+import logging
+import math
+import threading
+from collections import OrderedDict
+
+from langchain_core.messages import AIMessage, AIMessageChunk
+from langchain_core.runnables import Runnable
+
+from config import Config
+
+logger = logging.getLogger(__name__)
+
+
+def cache_bypassed(config) -> bool:
+    """True when the caller asked to skip cache lookups for this invocation.
+
+    Pass ``config={"configurable": {"cache_bypass": True}}`` to a chain; fresh
+    results are still stored.
+    """
+    return bool(((config or {}).get("configurable") or {}).get("cache_bypass"))
+
+
+# Settings that change the answer, read directly when a model does not report them
+MODEL_SETTINGS = ("model", "model_name", "model_id", "temperature", "max_tokens", "num_predict", "num_ctx")
+
+
+def model_descriptor(llm) -> str:
+    """Model name and generation parameters, so different settings never share entries."""
+    # Look through wrappers such as MeteredChatModel to the model itself
+    while getattr(llm, "llm", None) is not None:
+        llm = llm.llm
+    params = dict(getattr(llm, "_identifying_params", None) or {})
+    for name in MODEL_SETTINGS:
+        value = getattr(llm, name, None)
+        if value is not None:
+            params.setdefault(name, value)
+    return f"{type(llm).__name__}:{json.dumps(params, sort_keys=True, default=str)}"
+
+
+class CacheStats:
+    def __init__(self):
+        self.hits = 0
+        self.misses = 0
+        self.bypassed = 0
+        self._lock = threading.Lock()
+
+    def record(self, hit: bool):
+        with self._lock:
+            if hit:
+                self.hits += 1
+            else:
+                self.misses += 1
+
+    def record_bypass(self):
+        with self._lock:
+            self.bypassed += 1
+
+    def to_dict(self) -> dict:
+        with self._lock:
+            total = self.hits + self.misses
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "bypassed": self.bypassed,
+                "hit_rate": self.hits / total if total else 0.0,
+            }
+
+
+class ResponseCache:
+    """Exact-match LRU cache of LLM responses keyed by prompt and model."""
+
+    def __init__(self, max_size: int = None):
+        self.max_size = Config.LLM_CACHE_SIZE if max_size is None else max_size
+        self.stats = CacheStats()
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def key(prompt: str, descriptor: str) -> str:
+        return hashlib.sha256(f"{descriptor}\n{prompt}".encode("utf-8")).hexdigest()
+
+    def get(self, key: str):
+        with self._lock:
+            value = self._entries.get(key)
+            if value is not None:
+                self._entries.move_to_end(key)
+        self.stats.record(value is not None)
+        return value
+
+    def set(self, key: str, value: str):
+        if self.max_size <= 0:
+            return
+        with self._lock:
+            self._entries[key] = value
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+
+    def __len__(self):
+        with self._lock:
+            return len(self._entries)
+
+
+class CachedChatModel(Runnable):
+    """Wraps a chat model with an exact-match :class:`ResponseCache`.
+
+    Works for ``invoke``, ``batch`` and ``stream``; a cached answer is streamed
+    back as a single chunk.
+    """
+
+    def __init__(self, llm, cache: ResponseCache = None):
+        self.llm = llm
+        self.cache = cache if cache is not None else ResponseCache()
+        self.descriptor = model_descriptor(llm)
+
+    def _key(self, input):
+        prompt = input.to_string() if hasattr(input, "to_string") else str(input)
+        return self.cache.key(prompt, self.descriptor)
+
+    def _lookup(self, key, config):
+        if cache_bypassed(config):
+            self.cache.stats.record_bypass()
+            return None
+        return self.cache.get(key)
+
+    def invoke(self, input, config=None, **kwargs):
+        key = self._key(input)
+        cached = self._lookup(key, config)
+        if cached is not None:
+            return AIMessage(content=cached)
+        result = self.llm.invoke(input, config, **kwargs)
+        self.cache.set(key, result.content)
+        return result
+
+    def stream(self, input, config=None, **kwargs):
+        key = self._key(input)
+        cached = self._lookup(key, config)
+        if cached is not None:
+            yield AIMessageChunk(content=cached)
+            return
+        text = ""
+        for chunk in self.llm.stream(input, config, **kwargs):
+            text += chunk.content
+            yield chunk
+        # Only complete answers are stored; an abandoned stream never gets here
+        self.cache.set(key, text)
+
+
+def _cosine(first, second) -> float:
+    dot = sum(a * b for a, b in zip(first, second))
+    norm = math.sqrt(sum(a * a for a in first)) * math.sqrt(sum(b * b for b in second))
+    return dot / norm if norm else 0.0
+
+
+class SemanticCache:
+    """Reuses answers for paraphrased questions over the same retrieved documents.
+
+    An entry matches when the retrieved chunk IDs are identical and the cosine
+    similarity of the question embeddings is at least ``threshold``.
+    """
+
+    def __init__(self, embeddings, threshold: float = None, max_size: int = None):
+        self.embeddings = embeddings
+        self.threshold = Config.SEMANTIC_CACHE_THRESHOLD if threshold is None else threshold
+        self.max_size = Config.SEMANTIC_CACHE_SIZE if max_size is None else max_size
+        self.stats = CacheStats()
+        self._entries = OrderedDict()  # (scope, doc IDs) -> [(vector, answer)]
+        self._count = 0
+        self._lock = threading.Lock()
+
+    def get(self, scope: str, question: str, doc_ids):
+        key = (scope, frozenset(doc_ids))
+        vector = self.embeddings.embed_query(question)
+        best = None
+        with self._lock:
+            for cached_vector, answer in self._entries.get(key, ()):
+                score = _cosine(vector, cached_vector)
+                if score >= self.threshold and (best is None or score >= best[0]):
+                    best = (score, answer)
+            if best is not None:
+                self._entries.move_to_end(key)
+        self.stats.record(best is not None)
+        return (best[1] if best else None), vector
+
+    def set(self, scope: str, vector, doc_ids, answer: str):
+        if self.max_size <= 0:
+            return
+        key = (scope, frozenset(doc_ids))
+        with self._lock:
+            self._entries.setdefault(key, []).append((vector, answer))
+            self._entries.move_to_end(key)
+            self._count += 1
+            while self._count > self.max_size and self._entries:
+                _, evicted = self._entries.popitem(last=False)
+                self._count -= len(evicted)
+
+
+class SemanticCachedRunnable(Runnable):
+    """Puts a :class:`SemanticCache` in front of an answer-producing runnable.
+
+    The input must be a dict with the question under ``question_key`` and the
+    retrieved Documents under ``docs_key``; the wrapped runnable must return a
+    string. Pass the chat ``model`` the runnable uses so that answers from
+    other models or settings are kept apart.
+    """
+
+    def __init__(self, runnable, cache: SemanticCache, question_key: str, docs_key: str, scope: str, doc_id=None,
+                 model=None):
+        self.runnable = runnable
+        self.cache = cache
+        self.question_key = question_key
+        self.docs_key = docs_key
+        self.scope = scope if model is None else f"{scope}:{model_descriptor(model)}"
+        self.doc_id = doc_id or (lambda doc: hashlib.sha256(doc.page_content.encode("utf-8")).hexdigest())
+
+    def _lookup(self, input, config):
+        doc_ids = [self.doc_id(doc) for doc in input.get(self.docs_key) or []]
+        if cache_bypassed(config):
+            self.cache.stats.record_bypass()
+            return None, self.cache.embeddings.embed_query(input[self.question_key]), doc_ids
+        answer, vector = self.cache.get(self.scope, input[self.question_key], doc_ids)
+        return answer, vector, doc_ids
+
+    def invoke(self, input, config=None, **kwargs):
+        answer, vector, doc_ids = self._lookup(input, config)
+        if answer is not None:
+            return answer
+        answer = self.runnable.invoke(input, config, **kwargs)
+        self.cache.set(self.scope, vector, doc_ids, answer)
+        return answer
+
+    def stream(self, input, config=None, **kwargs):
+        answer, vector, doc_ids = self._lookup(input, config)
+        if answer is not None:
+            yield answer
+            return
+        answer = ""
+        for chunk in self.runnable.stream(input, config, **kwargs):
+            answer += chunk
+            yield chunk
+        self.cache.set(self.scope, vector, doc_ids, answer)
@@ -0,0 +1,315 @@
+# observability.py
+import contextvars
+import logging
+import re
+import threading
+import time
+import uuid
+
+from langchain_core.runnables import Runnable
+
+from config import Config
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60)
+REQUEST_ID_PATTERN = re.compile(r"^[A-Za-z0-9._-]{1,64}$")
+
+_request_id = contextvars.ContextVar("request_id", default="-")
+
+
+def get_request_id() -> str:
+    return _request_id.get()
+
+
+def set_request_id(request_id: str = None):
+    """Use ``request_id`` (or a new one) for logs in the current context. Returns a reset token."""
+    if not request_id or not REQUEST_ID_PATTERN.match(request_id):
+        request_id = uuid.uuid4().hex[:16]
+    return _request_id.set(request_id)
+
+
+def reset_request_id(token):
+    try:
+        _request_id.reset(token)
+    except ValueError:
+        # Token from another context, e.g. a response finished in a different thread
+        _request_id.set("-")
+
+
+def install_log_request_ids():
+    """Give every log record a ``request_id`` attribute for use in log formats."""
+    factory = logging.getLogRecordFactory()
+    if getattr(factory, "adds_request_id", False):
+        return
+
+    def record_factory(*args, **kwargs):
+        record = factory(*args, **kwargs)
+        record.request_id = _request_id.get()
+        return record
+
+    record_factory.adds_request_id = True
+    logging.setLogRecordFactory(record_factory)
+
+
+def _escape(value) -> str:
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _format_labels(labels) -> str:
+    if not labels:
+        return ""
+    return "{" + ",".join(f'{name}="{_escape(value)}"' for name, value in labels) + "}"
+
+
+def _format_value(value) -> str:
+    if value == float("inf"):
+        return "+Inf"
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class Counter:
+    def __init__(self, name: str, documentation: str):
+        self.name = name
+        self.documentation = documentation
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def inc(self, amount: float = 1, **labels):
+        if not Config.METRICS_ENABLED:
+            return
+        key = tuple(sorted(labels.items()))
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def value(self, **labels) -> float:
+        with self._lock:
+            return self._values.get(tuple(sorted(labels.items())), 0)
+
+    def render(self) -> list:
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} counter"]
+        with self._lock:
+            for key, value in self._values.items():
+                lines.append(f"{self.name}{_format_labels(key)} {_format_value(value)}")
+        return lines
+
+
+class Histogram:
+    def __init__(self, name: str, documentation: str, buckets=DEFAULT_BUCKETS):
+        self.name = name
+        self.documentation = documentation
+        self.buckets = tuple(buckets) + (float("inf"),)
+        self._series = {}  # labels -> [bucket counts, sum, count]
+        self._lock = threading.Lock()
+
+    def observe(self, value: float, **labels):
+        if not Config.METRICS_ENABLED:
+            return
+        key = tuple(sorted(labels.items()))
+        with self._lock:
+            series = self._series.get(key)
+            if series is None:
+                series = self._series[key] = [[0] * len(self.buckets), 0.0, 0]
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    series[0][i] += 1
+                    break
+            series[1] += value
+            series[2] += 1
+
+    def count(self, **labels) -> int:
+        with self._lock:
+            series = self._series.get(tuple(sorted(labels.items())))
+            return series[2] if series else 0
+
+    def snapshot(self) -> dict:
+        """Map each label set (as a dict-items tuple) to ``(count, sum)``."""
+        with self._lock:
+            return {key: (count, total) for key, (_, total, count) in self._series.items()}
+
+    def render(self) -> list:
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} histogram"]
+        with self._lock:
+            for key, (counts, total, count) in self._series.items():
+                cumulative = 0
+                for bound, bucket_count in zip(self.buckets, counts):
+                    cumulative += bucket_count
+                    lines.append(f"{self.name}_bucket{_format_labels(key + (('le', _format_value(bound)),))} {cumulative}")
+                lines.append(f"{self.name}_sum{_format_labels(key)} {_format_value(total)}")
+                lines.append(f"{self.name}_count{_format_labels(key)} {count}")
+        return lines
+
+
+class MetricsRegistry:
+    """Counters and histograms plus collectors that read existing stats at scrape time.
+
+    A collector is a callable returning ``(name, type, documentation, samples)``
+    tuples, where ``samples`` is a list of ``(labels dict, value)`` pairs.
+    """
+
+    def __init__(self):
+        self._metrics = {}
+        self._collectors = []
+        self._lock = threading.Lock()
+
+    def _register(self, metric):
+        with self._lock:
+            return self._metrics.setdefault(metric.name, metric)
+
+    def counter(self, name: str, documentation: str) -> Counter:
+        return self._register(Counter(name, documentation))
+
+    def histogram(self, name: str, documentation: str, buckets=DEFAULT_BUCKETS) -> Histogram:
+        return self._register(Histogram(name, documentation, buckets))
+
+    def register_collector(self, collector):
+        with self._lock:
+            self._collectors.append(collector)
+
+    def render(self) -> str:
+        with self._lock:
+            metrics = list(self._metrics.values())
+            collectors = list(self._collectors)
+        lines = []
+        for metric in metrics:
+            lines.extend(metric.render())
+        for collector in collectors:
+            try:
+                families = collector()
+            except Exception as e:
+                logger.error(f"Error collecting metrics: {str(e)}")
+                continue
+            for name, kind, documentation, samples in families:
+                lines.append(f"# HELP {name} {documentation}")
+                lines.append(f"# TYPE {name} {kind}")
+                for labels, value in samples:
+                    lines.append(f"{name}{_format_labels(sorted(labels.items()))} {_format_value(value)}")
+        return "\n".join(lines) + "\n"
+
+
+registry = MetricsRegistry()
+
+STAGE_SECONDS = registry.histogram("medaissist_stage_seconds", "Time spent in each pipeline stage")
+STAGE_ERRORS = registry.counter("medaissist_stage_errors_total", "Pipeline stages that raised an error")
+HTTP_REQUESTS = registry.counter("medaissist_http_requests_total", "HTTP requests by endpoint and status")
+HTTP_SECONDS = registry.histogram("medaissist_http_request_seconds", "HTTP request latency by endpoint")
+SOURCE_FETCHES = registry.counter("medaissist_source_fetches_total", "Source fetches by source and status")
+SOURCE_DOCUMENTS = registry.counter("medaissist_source_documents_total", "Documents returned by each source")
+LLM_TOKENS = registry.counter("medaissist_llm_tokens_total", "LLM tokens by direction (input or output)")
+LLM_CALLS = registry.counter("medaissist_llm_calls_total", "LLM calls by mode (invoke or stream)")
+LLM_FIRST_TOKEN_SECONDS = registry.histogram("medaissist_llm_first_token_seconds", "Time to the first streamed LLM token")
+JOBS = registry.counter("medaissist_jobs_total", "Background jobs by kind and final status")
+
+
+class _Stage:
+    """Times one pipeline stage; see :func:`stage`."""
+
+    __slots__ = ("name", "labels", "start", "elapsed")
+
+    def __init__(self, name, labels):
+        self.name = name
+        self.labels = labels
+        self.elapsed = 0.0
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.elapsed = time.perf_counter() - self.start
+        STAGE_SECONDS.observe(self.elapsed, stage=self.name, **self.labels)
+        if exc_type is not None:
+            STAGE_ERRORS.inc(stage=self.name, **self.labels)
+        if logger.isEnabledFor(logging.DEBUG):
+            detail = " ".join(f"{key}={value}" for key, value in self.labels.items())
+            logger.debug(f"Stage {self.name} {detail} took {self.elapsed:.3f}s")
+        return False
+
+
+class _NullStage:
+    __slots__ = ()
+    elapsed = 0.0
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        return False
+
+
+_NULL_STAGE = _NullStage()
+
+
+def stage(name: str, **labels):
+    """Context manager recording the duration of a pipeline stage.
+
+    Observed into ``medaissist_stage_seconds{stage=...}`` with any extra labels
+    (e.g. ``source``). When metrics are disabled it does nothing.
+    """
+    if not Config.METRICS_ENABLED:
+        return _NULL_STAGE
+    return _Stage(name, labels)
+
+
+def record_usage(message, mode):
+    """Count input and output tokens from a chat model message's ``usage_metadata``."""
+    usage = getattr(message, "usage_metadata", None)
+    if usage:
+        LLM_TOKENS.inc(usage.get("input_tokens", 0), direction="input")
+        LLM_TOKENS.inc(usage.get("output_tokens", 0), direction="output")
+    LLM_CALLS.inc(mode=mode)
+
+
+class MeteredChatModel(Runnable):
+    """Wraps a chat model to time calls and count the tokens it reports."""
+
+    def __init__(self, llm):
+        self.llm = llm
+
+    def __getattr__(self, name):
+        # Expose the wrapped model's attributes (e.g. _identifying_params for cache keys)
+        if name == "llm":
+            raise AttributeError(name)
+        return getattr(self.llm, name)
+
+    def invoke(self, input, config=None, **kwargs):
+        with stage("llm"):
+            result = self.llm.invoke(input, config, **kwargs)
+        record_usage(result, "invoke")
+        return result
+
+    def stream(self, input, config=None, **kwargs):
+        if not Config.METRICS_ENABLED:
+            yield from self.llm.stream(input, config, **kwargs)
+            return
+        start = time.perf_counter()
+        first = True
+        usage = None
+        with stage("llm"):
+            for chunk in self.llm.stream(input, config, **kwargs):
+                if first:
+                    LLM_FIRST_TOKEN_SECONDS.observe(time.perf_counter() - start)
+                    first = False
+                if getattr(chunk, "usage_metadata", None):
+                    usage = chunk
+                yield chunk
+        record_usage(usage, "stream")
+
+
+def cache_collector(caches):
+    """Collector for cache hit and miss counts.
+
+    ``caches`` is a callable returning ``{name: (hits, misses)}``.
+    """
+    def collect():
+        stats = caches()
+        return [
+            ("medaissist_cache_hits_total", "counter", "Cache hits by cache",
+             [({"cache": name}, hits) for name, (hits, _) in stats.items()]),
+            ("medaissist_cache_misses_total", "counter", "Cache misses by cache",
+             [({"cache": name}, misses) for name, (_, misses) in stats.items()]),
+            ("medaissist_cache_hit_ratio", "gauge", "Share of lookups served from cache",
+             [({"cache": name}, hits / (hits + misses) if hits + misses else 0.0)
+              for name, (hits, misses) in stats.items()]),
+        ]
+    return collect
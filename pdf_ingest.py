@@ -0,0 +1,146 @@
+# pdf_ingest.py
+import hashlib
+import json
+import logging
+import multiprocessing
+import os
+import tempfile
+from concurrent.futures import ProcessPoolExecutor
+
+from langchain_core.documents import Document
+
+from config import Config
+from lazy import Lazy
+from observability import stage
+
+logger = logging.getLogger(__name__)
+
+
+def worker_context():
+    """Start method for worker process pools.
+
+    The server runs request, job and model threads, and a child forked from a
+    multithreaded process can deadlock on a lock held by one of them, so
+    workers are started from a fresh fork server (or spawned where there is none).
+    """
+    methods = multiprocessing.get_all_start_methods()
+    return multiprocessing.get_context("forkserver" if "forkserver" in methods else "spawn")
+
+
+# Process pool shared by all PDF extractions
+worker_pool = Lazy(lambda: ProcessPoolExecutor(max_workers=Config.PDF_WORKERS, mp_context=worker_context()))
+
+
+def save_upload(file_storage, directory: str):
+    """Stream an uploaded file to ``directory`` as ``<sha256>.pdf``.
+
+    Returns ``(path, sha256)``. Identical uploads end up at the same path.
+    """
+    os.makedirs(directory, exist_ok=True)
+    digest = hashlib.sha256()
+    fd, tmp_path = tempfile.mkstemp(dir=directory, suffix=".part")
+    try:
+        with os.fdopen(fd, "wb") as out:
+            while True:
+                block = file_storage.stream.read(1024 * 1024)
+                if not block:
+                    break
+                digest.update(block)
+                out.write(block)
+        sha256 = digest.hexdigest()
+        path = os.path.join(directory, f"{sha256}.pdf")
+        os.replace(tmp_path, path)
+        return path, sha256
+    except Exception:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        raise
+
+
+def page_count(path: str) -> int:
+    import PyPDF2
+    with open(path, "rb") as file:
+        return len(PyPDF2.PdfReader(file).pages)
+
+
+def _extract_range(path: str, start: int, stop: int) -> list:
+    # Runs in a worker process
+    import PyPDF2
+    with open(path, "rb") as file:
+        reader = PyPDF2.PdfReader(file)
+        return [reader.pages[i].extract_text() or "" for i in range(start, stop)]
+
+
+class PageCache:
+    """Extracted page text stored per file SHA-256."""
+
+    def __init__(self, directory: str):
+        self.directory = directory
+
+    def _path(self, sha256):
+        return os.path.join(self.directory, f"{sha256}.json")
+
+    def get(self, sha256: str):
+        try:
+            with open(self._path(sha256), encoding="utf-8") as file:
+                return json.load(file)
+        except FileNotFoundError:
+            return None
+        except (OSError, ValueError) as e:
+            logger.error(f"Error reading page cache for {sha256}: {str(e)}")
+            return None
+
+    def set(self, sha256: str, pages: list):
+        os.makedirs(self.directory, exist_ok=True)
+        fd, tmp_path = tempfile.mkstemp(dir=self.directory, suffix=".part")
+        with os.fdopen(fd, "w", encoding="utf-8") as file:
+            json.dump(pages, file)
+        os.replace(tmp_path, self._path(sha256))
+
+
+def page_document(text: str, sha256: str, filename: str, page: int) -> Document:
+    return Document(page_content=text, metadata={
+        "source": "pdf",
+        "file": filename,
+        "sha256": sha256,
+        "page": page,
+        "doc_id": f"pdf:{sha256}:{page}",
+    })
+
+
+def iter_pdf_pages(path: str, sha256: str, filename: str = None, page_cache: PageCache = None,
+                   pages_per_task: int = None):
+    """Yield one Document per page, in page order, as soon as each range is extracted.
+
+    Pages are extracted in a process pool ``pages_per_task`` at a time. When the
+    file's SHA-256 is already in ``page_cache`` no extraction happens at all.
+    """
+    filename = filename or os.path.basename(path)
+    cached = page_cache.get(sha256) if page_cache is not None else None
+    if cached is not None:
+        logger.info(f"Using cached text for {filename} ({len(cached)} pages)")
+        for i, text in enumerate(cached):
+            yield page_document(text, sha256, filename, i + 1)
+        return
+
+    pages_per_task = pages_per_task or Config.PDF_PAGES_PER_TASK
+    total = page_count(path)
+    ranges = [(start, min(start + pages_per_task, total)) for start in range(0, total, pages_per_task)]
+    executor = worker_pool.get()
+    futures = [executor.submit(_extract_range, path, start, stop) for start, stop in ranges]
+
+    pages = []
+    try:
+        for (start, _), future in zip(ranges, futures):
+            with stage("extract"):
+                texts = future.result()
+            for offset, text in enumerate(texts):
+                pages.append(text)
+                yield page_document(text, sha256, filename, start + offset + 1)
+    finally:
+        for future in futures:
+            future.cancel()
+
+    if page_cache is not None:
+        page_cache.set(sha256, pages)
+    logger.info(f"Extracted {total} pages from {filename}")
@@ -0,0 +1,214 @@
+# prescription.py
+import hashlib
+import io
+import logging
+import re
+import threading
+from abc import ABC, abstractmethod
+from concurrent.futures import ProcessPoolExecutor
+
+from config import Config
+from lazy import Lazy
+from observability import stage
+from pdf_ingest import worker_context
+
+logger = logging.getLogger(__name__)
+
+DOSE_UNITS = r"(?:mg|mcg|µg|g|ml|mL|iu|IU|units?|%)"
+DOSAGE_FORMS = r"(?:tab|tabs|tablet|tablets|cap|caps|capsule|capsules|inj|injection|syp|syrup|susp|suspension|" \
+               r"sol|solution|oint|ointment|cream|gel|drops|inhaler|patch)"
+# "Tab. Metformin", "Inj Insulin glargine"
+FORM_PATTERN = re.compile(rf"\b{DOSAGE_FORMS}\.?\s+([A-Za-z][A-Za-z-]{{2,}}(?:\s+[A-Za-z][A-Za-z-]{{2,}})?)",
+                          re.IGNORECASE)
+# "Metformin 500 mg", "Amoxicillin-clavulanate 625mg"
+DOSE_PATTERN = re.compile(rf"\b([A-Za-z][A-Za-z-]{{2,}})\s*\d+(?:[.,]\d+)?\s*{DOSE_UNITS}(?![A-Za-z])")
+# Words that look like drug names in the patterns above but are not
+NON_DRUG_WORDS = {
+    "take", "tab", "tabs", "tablet", "tablets", "cap", "caps", "capsule", "capsules", "dose", "daily", "once",
+    "twice", "every", "each", "with", "after", "before", "food", "meals", "for", "days", "weeks", "qty", "quantity",
+    "sig", "disp", "dispense", "refill", "refills", "total", "then", "and", "the", "oral", "orally", "by", "mouth",
+    "apply", "inject", "use", "give", "upto", "max", "maximum", "per", "day", "night", "morning", "bedtime",
+}
+
+
+class ImageTooLargeError(Exception):
+    pass
+
+
+class OCRBackend(ABC):
+    @abstractmethod
+    def image_to_text(self, image) -> str:
+        """Text in a preprocessed (grayscale) PIL image."""
+        pass
+
+
+class TesseractOCR(OCRBackend):
+    """Local, offline OCR with the Tesseract engine (needs the ``tesseract`` binary)."""
+
+    def image_to_text(self, image) -> str:
+        import pytesseract
+        # Page segmentation mode 6: one uniform block of text, which suits prescriptions
+        return pytesseract.image_to_string(image, config="--psm 6")
+
+
+class GoogleVisionOCR(OCRBackend):
+    """Google Cloud Vision document text detection."""
+
+    def __init__(self):
+        Config.init_app()
+        from google.cloud import vision
+        self._vision = vision
+        self._client = vision.ImageAnnotatorClient()
+
+    def image_to_text(self, image) -> str:
+        buffer = io.BytesIO()
+        image.save(buffer, format="PNG")
+        response = self._client.document_text_detection(image=self._vision.Image(content=buffer.getvalue()))
+        if response.error.message:
+            raise RuntimeError(f"Cloud Vision error: {response.error.message}")
+        return response.full_text_annotation.text
+
+
+OCR_BACKENDS = {
+    "tesseract": TesseractOCR,
+    "google_vision": GoogleVisionOCR,
+}
+
+_backends = {}
+_backends_lock = threading.Lock()
+
+
+def register_ocr_backend(name: str, factory):
+    """Make ``factory`` (a class or callable returning an :class:`OCRBackend`) available as ``name``."""
+    with _backends_lock:
+        OCR_BACKENDS[name] = factory
+        _backends.pop(name, None)
+
+
+def get_ocr_backend(name: str = None) -> OCRBackend:
+    """Backend instance for ``name``, created once per process."""
+    name = name or Config.OCR_BACKEND
+    if name not in _backends:
+        with _backends_lock:
+            if name not in _backends:
+                if name not in OCR_BACKENDS:
+                    raise ValueError(f"Unknown OCR backend: {name}")
+                _backends[name] = OCR_BACKENDS[name]()
+    return _backends[name]
+
+
+def estimate_skew(image, max_degrees: float) -> float:
+    """Angle (degrees) that straightens the text lines in a grayscale ``image``.
+
+    Text lines are straight when the row-by-row ink profile is most uneven, so
+    a small inverted, thresholded copy is rotated through candidate angles and
+    the one whose row means vary most wins, first in whole degrees, then in
+    tenths around the best.
+    """
+    from PIL import Image, ImageOps
+
+    small = image.copy()
+    small.thumbnail((400, 400))
+    ink = ImageOps.invert(ImageOps.autocontrast(small)).point(lambda value: 255 if value > 128 else 0)
+
+    def score(angle):
+        rotated = ink.rotate(angle, resample=Image.NEAREST, fillcolor=0)
+        rows = rotated.resize((1, rotated.height), Image.BOX).tobytes()
+        mean = sum(rows) / len(rows)
+        return sum((row - mean) ** 2 for row in rows)
+
+    limit = int(max_degrees)
+    best = max(range(-limit, limit + 1), key=score)
+    return max((best + step / 10 for step in range(-9, 10)), key=score)
+
+
+def preprocess_image(data: bytes, max_side: int = None, max_degrees: float = None):
+    """Prepare image bytes for OCR: orient, downscale, convert to grayscale and deskew.
+
+    Returns ``(image, angle)``. JPEGs are decoded at reduced size when possible,
+    so large phone photos are never decoded in full.
+    """
+    from PIL import Image, ImageOps
+
+    max_side = max_side or Config.OCR_MAX_SIDE
+    max_degrees = Config.OCR_MAX_DESKEW_DEGREES if max_degrees is None else max_degrees
+
+    # Opening only reads the header, so oversized images are rejected before any pixels are decoded
+    image = Image.open(io.BytesIO(data))
+    if image.width * image.height > Config.OCR_MAX_PIXELS:
+        raise ImageTooLargeError(f"Image of {image.width}x{image.height} pixels is over the "
+                                 f"{Config.OCR_MAX_PIXELS} pixel limit")
+    image.draft("L", (max_side, max_side))
+    image = ImageOps.exif_transpose(image)
+    image = image.convert("L")
+    if max(image.size) > max_side:
+        image.thumbnail((max_side, max_side), Image.LANCZOS)
+
+    angle = estimate_skew(image, max_degrees) if max_degrees else 0.0
+    if abs(angle) >= 0.5:
+        image = image.rotate(angle, resample=Image.BICUBIC, expand=True, fillcolor=255)
+    return ImageOps.autocontrast(image), angle
+
+
+def _ocr_image(data: bytes, backend: str, factory=None) -> dict:
+    # Runs in a worker process, which only knows the built-in backends unless given the factory
+    if factory is not None and backend not in OCR_BACKENDS:
+        register_ocr_backend(backend, factory)
+    image, angle = preprocess_image(data)
+    text = get_ocr_backend(backend).image_to_text(image)
+    return {"text": text, "backend": backend, "angle": round(angle, 1), "size": list(image.size)}
+
+
+# Process pool shared by all OCR requests
+worker_pool = Lazy(lambda: ProcessPoolExecutor(max_workers=Config.OCR_WORKERS, mp_context=worker_context()))
+
+
+def read_prescription(data: bytes, cache=None, backend: str = None) -> dict:
+    """OCR an uploaded prescription image.
+
+    Results are cached by image SHA-256 and backend, so the same photo is
+    only processed once. Preprocessing and OCR run in the process pool, or in
+    the calling thread when ``OCR_WORKERS`` is 0.
+    """
+    backend = backend or Config.OCR_BACKEND
+    sha256 = hashlib.sha256(data).hexdigest()
+    key = f"{sha256}-{backend}"
+    cached = cache.get(key) if cache is not None else None
+    if cached is not None:
+        logger.info(f"Using cached OCR text for image {sha256[:12]}")
+        return {**cached, "sha256": sha256, "cached": True}
+
+    with stage("ocr", backend=backend):
+        if Config.OCR_WORKERS:
+            result = worker_pool.get().submit(_ocr_image, data, backend, OCR_BACKENDS.get(backend)).result()
+        else:
+            result = _ocr_image(data, backend)
+    if cache is not None:
+        cache.set(key, result)
+    logger.info(f"OCR of image {sha256[:12]} with {backend}: {len(result['text'])} characters, "
+                f"deskewed {result['angle']} degrees")
+    return {**result, "sha256": sha256, "cached": False}
+
+
+def extract_drug_names(text: str) -> list:
+    """Likely drug names in OCR text, in order of appearance.
+
+    Names are taken from words before a dose ("Metformin 500 mg") or after a
+    dosage form ("Tab. Metformin"); names contained in one already found are
+    dropped.
+    """
+    found = []
+    for pattern in (FORM_PATTERN, DOSE_PATTERN):
+        for match in pattern.finditer(text):
+            words = [word for word in match.group(1).split() if word.lower() not in NON_DRUG_WORDS]
+            if words:
+                found.append((match.start(1), " ".join(words)))
+
+    names, seen = [], set()
+    for _, name in sorted(found):
+        key = name.lower()
+        if key in seen or any(key in other or other in key for other in seen):
+            continue
+        seen.add(key)
+        names.append(name[0].upper() + name[1:])
+    return names[:Config.PRESCRIPTION_MAX_DRUGS]
@@ -0,0 +1,210 @@
+# retrieval.py
+import logging
+import math
+import re
+import threading
+import time
+from collections import Counter
+
+import numpy as np
+from langchain_core.callbacks import CallbackManagerForRetrieverRun
+from langchain_core.documents import Document
+from langchain_core.retrievers import BaseRetriever
+
+from config import Config
+from lazy import Lazy
+from observability import stage
+
+logger = logging.getLogger(__name__)
+
+# Keeps drug names, gene symbols and doses whole ("covid-19", "brca1", "2.5mg")
+TOKEN_PATTERN = re.compile(r"[a-z0-9]+(?:[-./][a-z0-9]+)*")
+PART_PATTERN = re.compile(r"[a-z]+|[0-9]+(?:\.[0-9]+)?")
+
+
+def tokenize(text: str) -> list:
+    """Lowercased terms, plus the parts of compound terms ("il-6" gives "il-6", "il", "6")."""
+    terms = []
+    for token in TOKEN_PATTERN.findall(text.lower()):
+        terms.append(token)
+        parts = PART_PATTERN.findall(token)
+        if len(parts) > 1:
+            terms.extend(parts)
+    return terms
+
+
+class BM25Index:
+    """In-memory inverted index scored with Okapi BM25."""
+
+    def __init__(self, k1: float = None, b: float = None):
+        self.k1 = Config.BM25_K1 if k1 is None else k1
+        self.b = Config.BM25_B if b is None else b
+        self.ids = []
+        self.lengths = []
+        self.postings = {}  # term -> {position: term frequency}
+        self._total_length = 0
+
+    def add(self, ids, texts):
+        for id_, text in zip(ids, texts):
+            position = len(self.ids)
+            terms = Counter(tokenize(text))
+            for term, count in terms.items():
+                self.postings.setdefault(term, {})[position] = count
+            length = sum(terms.values())
+            self.ids.append(id_)
+            self.lengths.append(length)
+            self._total_length += length
+
+    def __len__(self):
+        return len(self.ids)
+
+    def search(self, query: str, k: int) -> list:
+        """Return up to ``k`` ``(id, score)`` pairs, best first."""
+        if not self.ids:
+            return []
+        n = len(self.ids)
+        average_length = self._total_length / n or 1
+        scores = {}
+        for term in set(tokenize(query)):
+            postings = self.postings.get(term)
+            if not postings:
+                continue
+            idf = math.log(1 + (n - len(postings) + 0.5) / (len(postings) + 0.5))
+            for position, tf in postings.items():
+                norm = self.k1 * (1 - self.b + self.b * self.lengths[position] / average_length)
+                scores[position] = scores.get(position, 0.0) + idf * tf * (self.k1 + 1) / (tf + norm)
+        best = sorted(scores.items(), key=lambda item: item[1], reverse=True)[:k]
+        return [(self.ids[position], score) for position, score in best]
+
+    def size(self) -> int:
+        """Rough in-memory footprint in bytes."""
+        return sum(len(term) + 50 + 16 * len(postings) for term, postings in self.postings.items())
+
+
+def reciprocal_rank_fusion(rankings, k: int = None) -> list:
+    """Fuse ranked ID lists: each ID scores ``sum(1 / (k + rank))`` over the lists it appears in."""
+    k = Config.RRF_K if k is None else k
+    scores = {}
+    for ranking in rankings:
+        for rank, id_ in enumerate(ranking, start=1):
+            scores[id_] = scores.get(id_, 0.0) + 1.0 / (k + rank)
+    return sorted(scores, key=scores.get, reverse=True)
+
+
+class CrossEncoderReranker:
+    """Scores (query, passage) pairs with a small local cross-encoder.
+
+    The model is loaded on first use. If sentence-transformers or the model is
+    unavailable, reranking is disabled and candidates keep their fused order.
+    """
+
+    def __init__(self, model_name: str = None):
+        self.model_name = model_name or Config.RERANK_MODEL
+        self._model = None
+        self._lock = threading.Lock()
+        # Moving average of seconds per scored pair, used to fit the latency budget
+        self.seconds_per_pair = None
+
+    @property
+    def model(self):
+        if self._model is None:
+            with self._lock:
+                if self._model is None:
+                    try:
+                        from sentence_transformers import CrossEncoder
+                        self._model = CrossEncoder(self.model_name)
+                        logger.info(f"Loaded reranker {self.model_name}")
+                    except Exception as e:
+                        logger.error(f"Reranker {self.model_name} unavailable, keeping fused order: {str(e)}")
+                        self._model = False
+        return self._model or None
+
+    def affordable(self, budget: float) -> int:
+        """How many pairs can be scored within ``budget`` seconds."""
+        if self.seconds_per_pair is None:
+            return 1 << 30
+        return int(budget / self.seconds_per_pair)
+
+    def score(self, query: str, texts: list) -> list:
+        start = time.perf_counter()
+        scores = self.model.predict([(query, text) for text in texts])
+        per_pair = (time.perf_counter() - start) / len(texts)
+        self.seconds_per_pair = per_pair if self.seconds_per_pair is None else 0.8 * self.seconds_per_pair + 0.2 * per_pair
+        return [float(score) for score in scores]
+
+
+# Process-wide reranker
+default_reranker = Lazy(CrossEncoderReranker)
+
+
+class HybridRetriever(BaseRetriever):
+    """Dense FAISS search and BM25 fused with reciprocal-rank fusion, optionally reranked.
+
+    Both searches return ``fetch_k`` candidates over the same chunks. The fused
+    list is reranked with a cross-encoder when a ``reranker`` is set, as far as
+    ``latency_budget`` seconds (measured from the start of the query) allow;
+    candidates that do not fit keep their fused order behind the reranked ones.
+    """
+
+    vector_store: object
+    bm25: object
+    k: int = 4
+    fetch_k: int = 20
+    rrf_k: int = 60
+    reranker: object = None
+    latency_budget: float = None
+
+    @classmethod
+    def from_vector_store(cls, vector_store, **kwargs):
+        """Build the BM25 index over the chunks already in ``vector_store``."""
+        bm25 = BM25Index()
+        ids = list(vector_store.index_to_docstore_id.values())
+        bm25.add(ids, [vector_store.docstore.search(id_).page_content for id_ in ids])
+        kwargs.setdefault("k", Config.RETRIEVAL_K)
+        kwargs.setdefault("fetch_k", Config.RETRIEVAL_FETCH_K)
+        kwargs.setdefault("rrf_k", Config.RRF_K)
+        kwargs.setdefault("latency_budget", Config.RETRIEVAL_LATENCY_BUDGET_MS / 1000)
+        if "reranker" not in kwargs and Config.RERANK_ENABLED:
+            kwargs["reranker"] = default_reranker.get()
+        return cls(vector_store=vector_store, bm25=bm25, **kwargs)
+
+    def dense_search(self, query: str, k: int) -> list:
+        store = self.vector_store
+        if store.index.ntotal == 0:
+            return []
+        embed = store.embedding_function
+        embedded = embed.embed_query(query) if hasattr(embed, "embed_query") else embed(query)
+        vector = np.array([embedded], dtype=np.float32)
+        if getattr(store, "_normalize_L2", False):
+            import faiss
+            faiss.normalize_L2(vector)
+        _, positions = store.index.search(vector, min(k, store.index.ntotal))
+        return [store.index_to_docstore_id[p] for p in positions[0] if p != -1]
+
+    def _get_relevant_documents(self, query: str, *, run_manager: CallbackManagerForRetrieverRun) -> list:
+        start = time.perf_counter()
+        with stage("retrieve"):
+            dense = self.dense_search(query, self.fetch_k)
+            sparse = [id_ for id_, _ in self.bm25.search(query, self.fetch_k)]
+            ids = reciprocal_rank_fusion([dense, sparse], self.rrf_k)
+            documents = [self.vector_store.docstore.search(id_) for id_ in ids]
+            documents = [doc for doc in documents if isinstance(doc, Document)]
+        if self.reranker is not None and documents:
+            with stage("rerank"):
+                documents = self._rerank(query, documents, start)
+        return documents[:self.k]
+
+    def _rerank(self, query, documents, start):
+        if self.reranker.model is None:
+            return documents
+        count = len(documents)
+        if self.latency_budget:
+            remaining = self.latency_budget - (time.perf_counter() - start)
+            count = min(count, self.reranker.affordable(remaining))
+            if count < min(self.k, len(documents)):
+                logger.info(f"Skipping rerank, {remaining * 1000:.0f}ms left of the retrieval budget")
+                return documents
+        head, tail = documents[:count], documents[count:]
+        scores = self.reranker.score(query, [doc.page_content for doc in head])
+        order = sorted(range(len(head)), key=lambda i: scores[i], reverse=True)
+        return [head[i] for i in order] + tail
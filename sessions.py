@@ -0,0 +1,196 @@
+# sessions.py
+import logging
+import os
+import re
+import threading
+import time
+import uuid
+from collections import OrderedDict
+
+from config import Config
+from embedding_service import default_embedding_service
+from index_store import IndexStore
+from retrieval import HybridRetriever
+
+logger = logging.getLogger(__name__)
+
+SESSION_ID_PATTERN = re.compile(r"^[A-Za-z0-9_-]{1,64}$")
+
+
+def new_session_id() -> str:
+    return uuid.uuid4().hex
+
+
+def valid_session_id(session_id) -> bool:
+    return bool(session_id) and bool(SESSION_ID_PATTERN.match(session_id))
+
+
+def estimate_size(vector_store) -> int:
+    """Rough in-memory footprint of a FAISS store in bytes (vectors plus text)."""
+    index = vector_store.index
+    docstore = vector_store.docstore
+    text_bytes = sum(len(docstore.search(id_).page_content) for id_ in vector_store.index_to_docstore_id.values())
+    return index.ntotal * index.d * 4 + text_bytes
+
+
+class SessionKnowledgeBase:
+    def __init__(self, session_id: str, vector_store, chain=None, version: str = None):
+        self.session_id = session_id
+        self.vector_store = vector_store
+        self.version = version
+        self.retriever = HybridRetriever.from_vector_store(vector_store)
+        self.chain = chain
+        self.size = estimate_size(vector_store) + self.retriever.bm25.size()
+        self.last_used = time.monotonic()
+
+
+class SessionRegistry:
+    """Maps session IDs to their own retriever and conversation chain.
+
+    Every session index is written as a new version of the :class:`IndexStore`
+    at ``<root>/<session_id>`` when it is stored, so any worker process can
+    restore it lazily (memory-mapped when ``mmap``) and notices when another
+    worker rebuilds it. In memory, sessions that have been idle
+    longer than ``idle_seconds`` or that push the total over ``memory_budget``
+    bytes are dropped least-recently-used first; sessions idle longer than
+    ``ttl`` are removed from disk as well.
+    """
+
+    def __init__(self, chain_factory=None, root: str = None, ttl: float = None,
+                 idle_seconds: float = None, memory_budget: int = None, embeddings=None, mmap: bool = None):
+        self.chain_factory = chain_factory
+        self.root = root or Config.VECTOR_STORE_PATH
+        self.ttl = Config.SESSION_TTL if ttl is None else ttl
+        self.idle_seconds = Config.SESSION_IDLE_SECONDS if idle_seconds is None else idle_seconds
+        self.memory_budget = Config.SESSION_MEMORY_BUDGET_MB * 1024 * 1024 if memory_budget is None else memory_budget
+        self.embeddings = embeddings or default_embedding_service.get()
+        self.mmap = Config.VECTOR_STORE_MMAP if mmap is None else mmap
+        self._sessions = OrderedDict()
+        self._lock = threading.RLock()
+
+    def _path(self, session_id):
+        if not valid_session_id(session_id):
+            raise ValueError(f"Invalid session ID: {session_id!r}")
+        return os.path.join(self.root, session_id)
+
+    def _store(self, session_id):
+        return IndexStore(self._path(session_id))
+
+    def _attach(self, session_id, vector_store, version):
+        entry = SessionKnowledgeBase(session_id, vector_store, version=version)
+        if self.chain_factory is not None:
+            entry.chain = self.chain_factory(entry.retriever)
+        self._sessions[session_id] = entry
+        self._sessions.move_to_end(session_id)
+        return entry
+
+    def put(self, session_id: str, vector_store) -> SessionKnowledgeBase:
+        store = self._store(session_id)
+        with store.lock():
+            version = store.write(vector_store)
+        with self._lock:
+            entry = self._attach(session_id, vector_store, version)
+            self._evict(keep=session_id)
+        self.purge_expired()
+        return entry
+
+    def get(self, session_id: str):
+        """Return the session's knowledge base, restoring it from disk if needed."""
+        if not valid_session_id(session_id):
+            return None
+        with self._lock:
+            entry = self._sessions.get(session_id)
+            if entry is not None and self._store(session_id).current() != entry.version:
+                # Rebuilt or removed by another worker
+                del self._sessions[session_id]
+                entry = None
+            if entry is None:
+                entry = self._restore(session_id)
+                if entry is None:
+                    return None
+            entry.last_used = time.monotonic()
+            self._sessions.move_to_end(session_id)
+            self._evict(keep=session_id)
+        self._touch(session_id)
+        return entry
+
+    def _restore(self, session_id):
+        store = self._store(session_id)
+        mtime = store.mtime()
+        if mtime is None:
+            return None
+        if self.ttl and time.time() - mtime > self.ttl:
+            self._delete(session_id)
+            return None
+        try:
+            vector_store, version = store.load(self.embeddings, mmap=self.mmap)
+        except Exception as e:
+            logger.error(f"Error restoring session {session_id}: {str(e)}")
+            return None
+        if vector_store is None:
+            return None
+        logger.info(f"Restored session {session_id} from {store.path}")
+        return self._attach(session_id, vector_store, version)
+
+    def _touch(self, session_id):
+        # Refresh the TTL clock of the on-disk copy, which other workers check
+        self._store(session_id).touch()
+
+    def remove(self, session_id: str):
+        with self._lock:
+            self._sessions.pop(session_id, None)
+            self._delete(session_id)
+
+    def _delete(self, session_id):
+        self._store(session_id).remove()
+
+    def purge_expired(self):
+        """Delete on-disk session indexes that have not been used within the TTL."""
+        if not self.ttl or not os.path.isdir(self.root):
+            return
+        cutoff = time.time() - self.ttl
+        for name in os.listdir(self.root):
+            if not valid_session_id(name):
+                continue
+            mtime = self._store(name).mtime()
+            if mtime is None:
+                continue
+            with self._lock:
+                if name not in self._sessions and mtime < cutoff:
+                    self._delete(name)
+                    logger.info(f"Expired session {name}")
+
+    def _evict(self, keep=None):
+        now = time.monotonic()
+        for session_id, entry in list(self._sessions.items()):
+            if session_id == keep:
+                continue
+            idle = now - entry.last_used
+            if self.ttl and idle > self.ttl:
+                del self._sessions[session_id]
+                self._delete(session_id)
+                logger.info(f"Expired session {session_id}")
+            elif self.idle_seconds and idle > self.idle_seconds:
+                del self._sessions[session_id]
+                logger.info(f"Spilled idle session {session_id} to disk")
+
+        total = self.memory_usage()
+        for session_id in list(self._sessions):
+            if total <= self.memory_budget:
+                break
+            if session_id == keep:
+                continue
+            total -= self._sessions.pop(session_id).size
+            logger.info(f"Spilled session {session_id} to disk to stay within memory budget")
+
+    def memory_usage(self) -> int:
+        with self._lock:
+            return sum(entry.size for entry in self._sessions.values())
+
+    def __contains__(self, session_id):
+        with self._lock:
+            return session_id in self._sessions
+
+    def __len__(self):
+        with self._lock:
+            return len(self._sessions)
@@ -0,0 +1,155 @@
+# sources/cache.py
+import json
+import logging
+import os
+import sqlite3
+import threading
+import time
+from concurrent.futures import Future
+from contextlib import contextmanager
+
+from .base_handler import BaseSourceHandler
+
+logger = logging.getLogger(__name__)
+
+
+class CachedSourceError(Exception):
+    """Raised when a recent upstream error for the same query is still cached."""
+
+
+def normalize_query(query: str) -> str:
+    return " ".join((query or "").lower().split())
+
+
+class SourceCache:
+    """SQLite-backed store of source results keyed by source and normalized query."""
+
+    def __init__(self, path: str):
+        self.path = path
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        with self._connect() as conn:
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS source_results ("
+                " source TEXT NOT NULL,"
+                " query TEXT NOT NULL,"
+                " documents TEXT,"
+                " error TEXT,"
+                " expires_at REAL NOT NULL,"
+                " PRIMARY KEY (source, query))"
+            )
+
+    @contextmanager
+    def _connect(self):
+        conn = sqlite3.connect(self.path, timeout=10)
+        try:
+            with conn:
+                yield conn
+        finally:
+            conn.close()
+
+    def get(self, source: str, query: str):
+        """Return ``(documents, error)`` for a live entry, or ``None`` on a miss."""
+        with self._connect() as conn:
+            row = conn.execute(
+                "SELECT documents, error, expires_at FROM source_results WHERE source = ? AND query = ?",
+                (source, query),
+            ).fetchone()
+        if row is None or row[2] < time.time():
+            return None
+        documents = json.loads(row[0]) if row[0] is not None else None
+        return documents, row[1]
+
+    def set(self, source: str, query: str, documents=None, error: str = None, ttl: float = 0):
+        with self._connect() as conn:
+            conn.execute(
+                "INSERT OR REPLACE INTO source_results (source, query, documents, error, expires_at)"
+                " VALUES (?, ?, ?, ?, ?)",
+                (source, query, json.dumps(documents) if documents is not None else None, error, time.time() + ttl),
+            )
+
+    def purge_expired(self):
+        with self._connect() as conn:
+            conn.execute("DELETE FROM source_results WHERE expires_at < ?", (time.time(),))
+
+    def clear(self):
+        with self._connect() as conn:
+            conn.execute("DELETE FROM source_results")
+
+
+class CachedSourceHandler(BaseSourceHandler):
+    """Wraps a handler with a result cache and single-flight de-duplication.
+
+    Non-empty results are kept for ``ttl`` seconds. Empty results and upstream
+    errors are cached for ``negative_ttl`` seconds so a failing or empty query is
+    not retried on every build. Concurrent calls for the same query share one
+    upstream request.
+    """
+
+    def __init__(self, handler: BaseSourceHandler, source: str, cache: SourceCache,
+                 ttl: float, negative_ttl: float):
+        self.handler = handler
+        self.source = source
+        self.cache = cache
+        self.ttl = ttl
+        self.negative_ttl = negative_ttl
+        self.hits = 0
+        self.misses = 0
+        self._inflight = {}
+        self._lock = threading.Lock()
+
+    def fetch_data(self, query: str) -> list:
+        key = normalize_query(query)
+        cached = self._lookup(key)
+        leader = False
+        if cached is None:
+            with self._lock:
+                future = self._inflight.get(key)
+                if future is None:
+                    # A previous leader may have stored its result and left since the lookup above
+                    cached = self._lookup(key)
+                    if cached is None:
+                        leader = True
+                        future = Future()
+                        self._inflight[key] = future
+                        self.misses += 1
+        if cached is not None:
+            with self._lock:
+                self.hits += 1
+            documents, error = cached
+            if error:
+                raise CachedSourceError(error)
+            return documents
+        if not leader:
+            return list(future.result())
+
+        try:
+            documents = self.handler.fetch_data(query)
+            self._store(key, documents=documents,
+                        ttl=self.ttl if documents else self.negative_ttl)
+            future.set_result(documents)
+            return documents
+        except Exception as e:
+            self._store(key, error=str(e), ttl=self.negative_ttl)
+            future.set_exception(e)
+            raise
+        finally:
+            with self._lock:
+                self._inflight.pop(key, None)
+
+    def _lookup(self, key):
+        try:
+            return self.cache.get(self.source, key)
+        except sqlite3.Error as e:
+            logger.error(f"Error reading source cache for {self.source}: {str(e)}")
+            return None
+
+    def _store(self, key, documents=None, error=None, ttl=0):
+        if ttl <= 0:
+            return
+        try:
+            self.cache.set(self.source, key, documents=documents, error=error, ttl=ttl)
+        except (sqlite3.Error, TypeError, ValueError) as e:
+            logger.error(f"Error writing source cache for {self.source}: {str(e)}")
@@ -0,0 +1,110 @@
+# sources/fanout.py
+import contextvars
+import logging
+import time
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+from dataclasses import dataclass, field
+
+from observability import SOURCE_DOCUMENTS, SOURCE_FETCHES, stage
+
+logger = logging.getLogger(__name__)
+
+STATUS_OK = "ok"
+STATUS_ERROR = "error"
+STATUS_TIMEOUT = "timeout"
+
+
+@dataclass
+class SourceResult:
+    source: str
+    status: str
+    documents: list = field(default_factory=list)
+    elapsed: float = 0.0
+    error: str = None
+
+    @property
+    def ok(self) -> bool:
+        return self.status == STATUS_OK
+
+
+def fetch_all(handlers: dict, query: str, timeout: float = None, timeouts: dict = None,
+              deadline: float = None) -> dict:
+    """Run ``fetch_data(query)`` on every handler concurrently.
+
+    ``timeout`` is the default per-source budget in seconds, ``timeouts`` overrides
+    it for individual sources and ``deadline`` caps the whole fan-out. Sources that
+    miss their budget are reported with status ``timeout`` instead of blocking the
+    caller; their worker threads are abandoned rather than joined.
+
+    Returns a dict mapping source name to :class:`SourceResult`, in the order of
+    ``handlers``.
+    """
+    if not handlers:
+        return {}
+
+    timeouts = timeouts or {}
+    start = time.monotonic()
+    global_end = start + deadline if deadline is not None else None
+
+    def budget_end(source):
+        limit = timeouts.get(source, timeout)
+        end = start + limit if limit is not None else None
+        if global_end is not None:
+            end = global_end if end is None else min(end, global_end)
+        return end
+
+    def run(source, handler):
+        began = time.monotonic()
+        with stage("fetch", source=source):
+            documents = handler.fetch_data(query)
+        return documents, time.monotonic() - began
+
+    executor = ThreadPoolExecutor(max_workers=len(handlers), thread_name_prefix="source-fetch")
+    # Each fetch runs in a copy of the caller's context so logs keep its request ID
+    futures = {
+        executor.submit(contextvars.copy_context().run, run, source, handler): source
+        for source, handler in handlers.items()
+    }
+    ends = {future: budget_end(source) for future, source in futures.items()}
+    results = {}
+    pending = set(futures)
+
+    try:
+        while pending:
+            now = time.monotonic()
+            for future in [f for f in pending if ends[f] is not None and ends[f] <= now]:
+                if future.done():
+                    continue
+                pending.discard(future)
+                future.cancel()
+                source = futures[future]
+                results[source] = SourceResult(source, STATUS_TIMEOUT, elapsed=now - start,
+                                               error="Timed out waiting for source")
+                logger.warning(f"Source '{source}' timed out after {now - start:.2f}s")
+            if not pending:
+                break
+
+            upcoming = [ends[f] for f in pending if ends[f] is not None]
+            wait_for = max(0.0, min(upcoming) - now) if upcoming else None
+            done, _ = wait(pending, timeout=wait_for, return_when=FIRST_COMPLETED)
+            for future in done:
+                pending.discard(future)
+                source = futures[future]
+                try:
+                    documents, elapsed = future.result()
+                    results[source] = SourceResult(source, STATUS_OK, list(documents or []), elapsed)
+                except Exception as e:
+                    logger.error(f"Error fetching data from {source}: {str(e)}")
+                    results[source] = SourceResult(source, STATUS_ERROR, elapsed=time.monotonic() - start,
+                                                   error=str(e))
+    finally:
+        # Don't join stragglers: a stalled upstream must not hold the response.
+        # Fetches that have not started are cancelled by hand (cancel_futures needs Python 3.9).
+        for future in futures:
+            future.cancel()
+        executor.shutdown(wait=False)
+
+    for result in results.values():
+        SOURCE_FETCHES.inc(source=result.source, status=result.status)
+        SOURCE_DOCUMENTS.inc(len(result.documents), source=result.source)
+    return {source: results[source] for source in handlers}
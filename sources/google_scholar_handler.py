@@ -1,7 +1,10 @@
+import logging
 from .base_handler import BaseSourceHandler
 from scholarly import scholarly
 from config import Config
 
+logger = logging.getLogger(__name__)
+
 class GoogleScholarHandler(BaseSourceHandler):
     def fetch_data(self, query: str) -> list:
         try:
@@ -19,10 +22,10 @@ class GoogleScholarHandler(BaseSourceHandler):
                 except StopIteration:
                     break
                 except Exception as e:
-                    print(f"Error processing Google Scholar result: {str(e)}")
+                    logger.warning(f"Error processing Google Scholar result: {str(e)}")
             
-            print(f"Google Scholar query '{query}' returned {len(documents)} results")
+            logger.info(f"Google Scholar query '{query}' returned {len(documents)} results")
             return documents
         except Exception as e:
-            print(f"Error in Google Scholar query: {str(e)}")
+            logger.error(f"Error in Google Scholar query: {str(e)}")
             return []
\ No newline at end of file
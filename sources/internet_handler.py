@@ -1,6 +1,9 @@
+import logging
 from .base_handler import BaseSourceHandler
 from duckduckgo_search import DDGS
 
+logger = logging.getLogger(__name__)
+
 class InternetHandler(BaseSourceHandler):
     def fetch_data(self, query: str) -> list:
         try:
@@ -8,5 +11,5 @@ class InternetHandler(BaseSourceHandler):
                 results = list(ddgs.text(query, max_results=10))
             return [f"Title: {result['title']}\nSnippet: {result['body']}\nURL: {result['href']}" for result in results]
         except Exception as e:
-            print(f"Error in Internet search: {str(e)}")
+            logger.error(f"Error in Internet search: {str(e)}")
             return []
\ No newline at end of file
@@ -1,28 +1,163 @@
+import logging
+import re
+import xml.etree.ElementTree as ET
+
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+
 from .base_handler import BaseSourceHandler
-from pymed import PubMed
+from .rate_limit import TokenBucket
 from config import Config
+from lazy import Lazy
+
+logger = logging.getLogger(__name__)
+
+YEAR_PATTERN = re.compile(r"\b(\d{4})\b")
+
+# Process-wide limiter for NCBI: 10 requests/second with an API key, 3 without
+default_rate_limiter = Lazy(lambda: TokenBucket(10 if Config.PUBMED_API_KEY else 3))
+
+
+def _text(element) -> str:
+    """Text of ``element`` including inline markup such as <i> or <sup>."""
+    if element is None:
+        return ""
+    return " ".join("".join(element.itertext()).split())
+
+
+def parse_article(article) -> dict:
+    """Turn a <PubmedArticle> element into a record with ``page_content`` and ``metadata``."""
+    citation = article.find("MedlineCitation")
+    details = citation.find("Article")
+    pmid = _text(citation.find("PMID"))
+    title = _text(details.find("ArticleTitle")) or "No title available"
+
+    sections = []
+    for part in details.findall("Abstract/AbstractText"):
+        text = _text(part)
+        if text:
+            label = part.get("Label")
+            sections.append(f"{label.capitalize()}: {text}" if label else text)
+    abstract = " ".join(sections) or "No abstract available"
+
+    journal = details.find("Journal")
+    pub_date = journal.find("JournalIssue/PubDate") if journal is not None else None
+    year = _text(pub_date.find("Year")) if pub_date is not None else ""
+    if not year and pub_date is not None:
+        match = YEAR_PATTERN.search(_text(pub_date.find("MedlineDate")))
+        year = match.group(1) if match else ""
+
+    authors = []
+    for author in details.findall("AuthorList/Author"):
+        name = _text(author.find("CollectiveName"))
+        if not name:
+            name = " ".join(filter(None, (_text(author.find("LastName")), _text(author.find("Initials")))))
+        if name:
+            authors.append(name)
+
+    doi = ""
+    for article_id in article.findall("PubmedData/ArticleIdList/ArticleId"):
+        if article_id.get("IdType") == "doi":
+            doi = _text(article_id)
+            break
+
+    metadata = {
+        "pmid": pmid,
+        "title": title,
+        "journal": _text(journal.find("Title")) if journal is not None else "",
+        "year": int(year) if year.isdigit() else None,
+        "authors": authors,
+        "publication_types": [_text(kind) for kind in details.findall("PublicationTypeList/PublicationType")],
+        "doi": doi or None,
+        "url": f"https://pubmed.ncbi.nlm.nih.gov/{pmid}/" if pmid else None,
+    }
+    return {
+        "page_content": f"Title: {title}\nAbstract: {abstract}",
+        "metadata": {key: value for key, value in metadata.items() if value not in (None, "", [])},
+    }
+
 
 class PubmedHandler(BaseSourceHandler):
-    def __init__(self):
-        self.pubmed = PubMed(tool="MyTool", email="my@email.address")
+    """Searches PubMed through the NCBI E-utilities.
+
+    esearch stores the matching PMIDs on NCBI's history server, then efetch
+    pages through them ``batch_size`` records at a time over pooled keep-alive
+    connections. Each efetch response is parsed as it streams in, so memory
+    stays flat however many results are requested. Every request waits on the
+    shared NCBI rate limiter.
+    """
+
+    def __init__(self, base_url: str = None, max_results: int = None, batch_size: int = None,
+                 api_key: str = None, rate_limiter: TokenBucket = None):
+        self.base_url = (base_url or Config.PUBMED_EUTILS_URL).rstrip("/")
+        self.max_results = max_results or Config.PUBMED_MAX_RESULTS
+        self.batch_size = batch_size or Config.PUBMED_BATCH_SIZE
+        self.api_key = api_key if api_key is not None else Config.PUBMED_API_KEY
+        self.rate_limiter = rate_limiter or default_rate_limiter.get()
+        self.session = requests.Session()
+        retry = Retry(total=3, backoff_factor=0.5, status_forcelist=(429, 500, 502, 503, 504),
+                      allowed_methods=None, respect_retry_after_header=True)
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=Config.PUBMED_POOL_SIZE, max_retries=retry)
+        self.session.mount("http://", adapter)
+        self.session.mount("https://", adapter)
+
+    def _params(self, **params) -> dict:
+        params.update(db="pubmed", tool=Config.PUBMED_TOOL)
+        if Config.PUBMED_EMAIL:
+            params["email"] = Config.PUBMED_EMAIL
+        if self.api_key:
+            params["api_key"] = self.api_key
+        return params
+
+    def search(self, query: str):
+        """Run esearch with history. Returns ``(count, webenv, query_key)``."""
+        self.rate_limiter.acquire()
+        response = self.session.get(
+            f"{self.base_url}/esearch.fcgi",
+            params=self._params(term=query, usehistory="y", retmax=0, retmode="json", sort="relevance"),
+            timeout=Config.PUBMED_REQUEST_TIMEOUT,
+        )
+        response.raise_for_status()
+        result = response.json()["esearchresult"]
+        if "ERROR" in result:
+            raise RuntimeError(f"esearch error: {result['ERROR']}")
+        return int(result.get("count", 0)), result["webenv"], result["querykey"]
+
+    def fetch_batch(self, webenv: str, query_key: str, start: int, size: int):
+        """Yield records for one efetch page, parsing the XML as it arrives."""
+        self.rate_limiter.acquire()
+        with self.session.post(
+            f"{self.base_url}/efetch.fcgi",
+            data=self._params(WebEnv=webenv, query_key=query_key, retstart=start, retmax=size, retmode="xml"),
+            timeout=Config.PUBMED_REQUEST_TIMEOUT,
+            stream=True,
+        ) as response:
+            response.raise_for_status()
+            response.raw.decode_content = True
+            root = None
+            for event, element in ET.iterparse(response.raw, events=("start", "end")):
+                if root is None:
+                    root = element
+                if event == "end" and element.tag == "PubmedArticle":
+                    yield parse_article(element)
+                    root.clear()
+
+    def fetch_records(self, query: str):
+        """Yield structured records for ``query``, best match first, up to ``max_results``."""
+        count, webenv, query_key = self.search(f"{query} AND (english[Language])")
+        total = min(count, self.max_results)
+        for start in range(0, total, self.batch_size):
+            yield from self.fetch_batch(webenv, query_key, start, min(self.batch_size, total - start))
 
     def fetch_data(self, query: str) -> list:
+        if not query.strip():
+            return []
+        documents = []
         try:
-            if not query.strip():
-                return []
-
-            enhanced_query = f"{query} AND (english[Language])"
-            results = self.pubmed.query(enhanced_query, max_results=Config.MAX_RESULTS)
-            documents = []
-            
-            for article in results:
-                title = getattr(article, 'title', 'No title available')
-                abstract = getattr(article, 'abstract', 'No abstract available')
-                if title or abstract:
-                    documents.append(f"Title: {title}\nAbstract: {abstract}")
-            
-            print(f"PubMed query '{enhanced_query}' returned {len(documents)} results")
-            return documents
+            for record in self.fetch_records(query):
+                documents.append(record)
         except Exception as e:
-            print(f"Error in PubMed query: {str(e)}")
-            return []
\ No newline at end of file
+            logger.error(f"Error in PubMed query after {len(documents)} results: {str(e)}")
+        logger.info(f"PubMed query '{query}' returned {len(documents)} results")
+        return documents
@@ -0,0 +1,91 @@
+# sources/registry.py
+import importlib
+import logging
+import threading
+
+logger = logging.getLogger(__name__)
+
+
+def default_target(source: str) -> str:
+    """``pubmed`` -> ``sources.pubmed_handler:PubmedHandler``."""
+    handler_name = ''.join(word.capitalize() for word in source.split('_')) + 'Handler'
+    return f"sources.{source}_handler:{handler_name}"
+
+
+class SourceRegistry:
+    """Source handlers registered by name and imported on first use.
+
+    A handler whose module or third-party library fails to import is logged
+    once and then reported as unavailable, so a missing optional dependency only
+    disables that source. ``wrap(source, handler)`` can decorate each handler
+    when it is created, e.g. to add caching.
+    """
+
+    def __init__(self, wrap=None):
+        self.wrap = wrap
+        self._targets = {}
+        self._handlers = {}
+        self._failed = {}
+        self._lock = threading.Lock()
+
+    def register(self, source: str, target=None):
+        """Register ``target`` ("module:Class", a class or any factory) under ``source``."""
+        with self._lock:
+            self._targets[source] = target or default_target(source)
+            self._handlers.pop(source, None)
+            self._failed.pop(source, None)
+
+    def set(self, source: str, handler):
+        """Register an already constructed handler."""
+        with self._lock:
+            self._targets[source] = handler
+            self._handlers[source] = handler
+            self._failed.pop(source, None)
+
+    def names(self) -> list:
+        with self._lock:
+            return list(self._targets)
+
+    def __contains__(self, source):
+        with self._lock:
+            return source in self._targets
+
+    def loaded(self) -> dict:
+        with self._lock:
+            return dict(self._handlers)
+
+    def errors(self) -> dict:
+        with self._lock:
+            return dict(self._failed)
+
+    def get(self, source: str):
+        """Return the handler for ``source``, importing it on first use, or ``None``."""
+        with self._lock:
+            if source in self._handlers:
+                return self._handlers[source]
+            if source in self._failed or source not in self._targets:
+                return None
+            target = self._targets[source]
+            try:
+                if isinstance(target, str):
+                    module_name, _, class_name = target.partition(':')
+                    target = getattr(importlib.import_module(module_name), class_name)
+                handler = target()
+                if self.wrap is not None:
+                    handler = self.wrap(source, handler)
+            except ImportError as e:
+                logger.warning(f"Handler for source '{source}' not available: {e}")
+                self._failed[source] = str(e)
+                return None
+            except Exception as e:
+                logger.error(f"Error loading handler for source '{source}': {e}")
+                self._failed[source] = str(e)
+                return None
+            self._handlers[source] = handler
+            return handler
+
+    def clear(self):
+        with self._lock:
+            self._targets.clear()
+            self._handlers.clear()
+            self._failed.clear()
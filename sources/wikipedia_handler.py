@@ -1,13 +1,18 @@
-# sources/wikipedia_handler.py
+import logging
 from .base_handler import BaseSourceHandler
 import wikipedia
 
+logger = logging.getLogger(__name__)
+
 class WikipediaHandler(BaseSourceHandler):
     def fetch_data(self, query: str) -> list:
+        # No page or an ambiguous title is an empty result, so it is only cached briefly and never indexed
         try:
             page = wikipedia.page(query)
             return [f"Title: {page.title}\nContent: {page.summary}"]
         except wikipedia.exceptions.DisambiguationError as e:
-            return [f"Multiple pages found for '{query}'. Possible matches: {', '.join(e.options[:5])}"]
+            logger.info(f"Multiple Wikipedia pages found for '{query}': {', '.join(e.options[:5])}")
+            return []
         except wikipedia.exceptions.PageError:
-            return [f"No Wikipedia page found for '{query}'"]
\ No newline at end of file
+            logger.info(f"No Wikipedia page found for '{query}'")
+            return []
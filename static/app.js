@@ -6,6 +6,7 @@ document.addEventListener('DOMContentLoaded', () => {
     const chatInput = document.getElementById('chat-input');
     const logContent = document.getElementById('log-content');
     const summaryContent = document.getElementById('summary-content');
+    let sessionId = null;
 
     console.log('DOM fully loaded and parsed');
 
@@ -22,6 +23,30 @@ document.addEventListener('DOMContentLoaded', () => {
         summaryContent.innerHTML = summary;
     }
 
+    // Reads a text/event-stream response body and calls onEvent(event, data) per message
+    async function readEventStream(response, onEvent) {
+        const reader = response.body.getReader();
+        const decoder = new TextDecoder();
+        let buffer = '';
+        while (true) {
+            const { value, done } = await reader.read();
+            if (done) break;
+            buffer += decoder.decode(value, { stream: true });
+            let boundary;
+            while ((boundary = buffer.indexOf('\n\n')) !== -1) {
+                const message = buffer.slice(0, boundary);
+                buffer = buffer.slice(boundary + 2);
+                let event = 'message';
+                let data = '';
+                message.split('\n').forEach(line => {
+                    if (line.startsWith('event: ')) event = line.slice(7);
+                    else if (line.startsWith('data: ')) data += line.slice(6);
+                });
+                onEvent(event, data ? JSON.parse(data) : {});
+            }
+        }
+    }
+
     buildKbBtn.addEventListener('click', async () => {
         console.log('Build KB button clicked');
         // Reset summary and chat windows
@@ -32,34 +57,56 @@ document.addEventListener('DOMContentLoaded', () => {
 
         const query = document.getElementById('query-input').value;
         const sources = Array.from(document.querySelectorAll('input[name="source"]:checked')).map(el => el.value);
-        const pdfFile = document.getElementById('pdf-upload').files[0];
+        const pdfFiles = Array.from(document.getElementById('pdf-upload').files);
 
         console.log('Query:', query);
         console.log('Sources:', sources);
-        console.log('PDF File:', pdfFile ? pdfFile.name : 'None');
+        console.log('PDF Files:', pdfFiles.length ? pdfFiles.map(file => file.name).join(', ') : 'None');
 
         const formData = new FormData();
         formData.append('query', query);
         sources.forEach(source => formData.append('sources', source));
-        if (pdfFile) {
-            formData.append('pdf', pdfFile);
+        if (sessionId) {
+            formData.append('session_id', sessionId);
         }
+        pdfFiles.forEach(file => formData.append('pdf', file));
 
         try {
             console.log('Sending request to build KB');
-            const response = await fetch('/api/build_kb', {
+            const response = await fetch('/api/build_kb/stream', {
                 method: 'POST',
                 body: formData
             });
-            const data = await response.json();
-            console.log('Response received:', data);
-            if (response.ok) {
-                addToLog(`Knowledge base built successfully. Articles reviewed: ${data.articles_reviewed}`);
-                displaySummary(data.summary);
-            } else {
-                addToLog(`Error: ${data.error}`);
-                summaryContent.innerHTML = `<p>Error: ${data.error}</p>`;
+            if (!response.ok) {
+                const data = await response.json();
+                throw new Error(data.error);
             }
+            const summaryStream = document.createElement('pre');
+            summaryStream.className = 'summary-stream';
+            await readEventStream(response, (event, data) => {
+                if (event === 'progress') {
+                    addToLog(data.message);
+                    if (data.stage === 'summarizing') {
+                        summaryContent.innerHTML = '';
+                        summaryContent.appendChild(summaryStream);
+                    }
+                } else if (event === 'token') {
+                    summaryStream.textContent += data.text;
+                } else if (event === 'result') {
+                    console.log('Response received:', data);
+                    if (data.session_id) {
+                        sessionId = data.session_id;
+                    }
+                    addToLog(`Knowledge base built successfully. Articles reviewed: ${data.articles_reviewed}`);
+                    if (data.partial_sources && data.partial_sources.length) {
+                        addToLog(`Partial results: no data from ${data.partial_sources.join(', ')}`);
+                    }
+                    displaySummary(data.summary);
+                } else if (event === 'error') {
+                    addToLog(`Error: ${data.error}`);
+                    summaryContent.innerHTML = `<p>Error: ${data.error}</p>`;
+                }
+            });
         } catch (error) {
             console.error('Error building knowledge base:', error);
             addToLog('Error building knowledge base. Please try again.');
@@ -80,6 +127,9 @@ document.addEventListener('DOMContentLoaded', () => {
         showLoading('analyze-prescription-btn');
         const formData = new FormData();
         formData.append('prescription', prescriptionFile);
+        if (sessionId) {
+            formData.append('session_id', sessionId);
+        }
 
         try {
             const response = await fetch('/api/analyze_prescription', {
@@ -119,23 +169,42 @@ document.addEventListener('DOMContentLoaded', () => {
         showLoading('send-chat-btn');
     
         try {
-            const response = await fetch('/api/chat', {
+            const response = await fetch('/api/chat/stream', {
                 method: 'POST',
                 headers: {
                     'Content-Type': 'application/json',
                 },
-                body: JSON.stringify({ message })
+                body: JSON.stringify({ message, session_id: sessionId })
             });
-            const data = await response.json();
-            if (response.ok) {
-                const assistantMessage = document.createElement('div');
-                assistantMessage.className = 'chat-message assistant';
-                // Convert double asterisks to bold HTML tags
-                assistantMessage.innerHTML = data.response.replace(/\*\*(.*?)\*\*/g, '<strong>$1</strong>');
-                chatMessages.appendChild(assistantMessage);
-            } else {
+            if (!response.ok) {
+                const data = await response.json();
                 addMessageToChat('Assistant', `Error: ${data.error}`);
+                return;
             }
+            const assistantMessage = document.createElement('div');
+            assistantMessage.className = 'chat-message assistant';
+            const formatted = document.createElement('div');
+            const pending = document.createElement('p');
+            pending.className = 'chat-pending';
+            assistantMessage.appendChild(formatted);
+            assistantMessage.appendChild(pending);
+            chatMessages.appendChild(assistantMessage);
+            await readEventStream(response, (event, data) => {
+                if (event === 'token') {
+                    // Raw text of the section still being generated
+                    pending.textContent += data.text;
+                } else if (event === 'section') {
+                    // Convert double asterisks to bold HTML tags
+                    formatted.insertAdjacentHTML('beforeend', data.html.replace(/\*\*(.*?)\*\*/g, '<strong>$1</strong>'));
+                    const rest = pending.textContent.split('\n\n');
+                    pending.textContent = rest.slice(1).join('\n\n');
+                } else if (event === 'done') {
+                    pending.remove();
+                } else if (event === 'error') {
+                    pending.textContent = `Error: ${data.error}`;
+                }
+                chatMessages.scrollTop = chatMessages.scrollHeight;
+            });
         } catch (error) {
             console.error('Error sending chat message:', error);
             addMessageToChat('Assistant', 'Error: Unable to get a response. Please try again.');
@@ -0,0 +1,139 @@
+import json
+
+import pytest
+from langchain_core.runnables import RunnableLambda
+
+from config import Config
+from conftest import SUMMARY, StubSource
+
+
+def records(source, *pmids):
+    return [{"page_content": f"Title: {source} article {pmid} on metformin\nAbstract: Finding {pmid} from {source}.",
+             "metadata": {"pmid": f"{source}-{pmid}"}} for pmid in pmids]
+
+
+def summarize_unless_insulin(prompt):
+    if "Query: insulin" in prompt.to_string():
+        raise RuntimeError("model overloaded")
+    return SUMMARY
+
+
+@pytest.fixture
+def batch_env(app_env):
+    sources = {
+        "a": StubSource({"Metformin CKD": records("a", 1, 2), "insulin": records("a", 3), "empty": [""]}),
+        "b": StubSource({"Metformin CKD": records("b", 4)}),
+    }
+    for name, source in sources.items():
+        app_env.source_handlers.set(name, source)
+    app_env.llm.set(RunnableLambda(summarize_unless_insulin))
+    return app_env, sources
+
+
+def test_batch_items_are_normalized(app_env):
+    items = app_env.parse_batch_items(
+        [" metformin ", {"query": "insulin", "sources": ["pubmed"], "session_id": "s1"},
+         {"query": "statins", "session_id": "../bad"}],
+        default_sources=["wikipedia"])
+    assert [(item["query"], item["sources"]) for item in items] == [
+        ("metformin", ["wikipedia"]), ("insulin", ["pubmed"]), ("statins", ["wikipedia"])]
+    assert items[1]["session_id"] == "s1"
+    assert items[2]["session_id"] != "../bad"
+    assert app_env.parse_batch_items(["metformin"])[0]["sources"] == Config.ENABLED_SOURCES
+
+
+@pytest.mark.parametrize("items, defaults, error", [
+    (None, None, "No queries provided"),
+    ([], None, "No queries provided"),
+    (["a", "b", "c"], None, "Too many queries"),
+    (["  "], None, "Query 1 is empty"),
+    ([{"query": 123}], None, "Query 1 is empty"),
+    (["metformin", 5], None, "Query 2 must be a string or an object"),
+    ([{"query": "x", "sources": "pubmed"}], None, "Sources of query 1 must be a list of strings"),
+    ([{"query": "x", "sources": ["pubmed", 1]}], None, "Sources of query 1 must be a list of strings"),
+    ([{"query": "x", "session_id": 7}], None, "Session ID of query 1 must be a string"),
+    (["x"], "pubmed", "Sources must be a list of strings"),
+])
+def test_malformed_batch_items_are_rejected(app_env, items, defaults, error):
+    with pytest.raises(ValueError, match=error):
+        app_env.parse_batch_items(items, defaults, limit=2)
+
+
+@pytest.mark.parametrize("body", [
+    ["metformin"],
+    {"queries": [{"query": "x", "sources": "pubmed"}]},
+    {"queries": [{"query": 123}]},
+    {"queries": ["x"], "sources": "pubmed"},
+])
+def test_batch_endpoint_rejects_malformed_bodies(app_env, body):
+    response = app_env.app.test_client().post("/api/build_kb/batch", json=body)
+    assert response.status_code == 400
+    assert "error" in response.json
+    response = app_env.app.test_client().post("/api/build_kb/batch", data="not json",
+                                              content_type="application/json")
+    assert response.status_code == 400
+
+
+def test_batch_shares_fetches_filters_sources_and_reports_each_item(batch_env):
+    app, sources = batch_env
+    items = app.parse_batch_items([
+        {"query": "Metformin CKD", "sources": ["a"]},
+        {"query": "metformin  ckd", "sources": ["b"]},
+        {"query": "insulin", "sources": ["a", "b"]},
+        {"query": "unknown", "sources": ["a"]},
+        {"query": "empty", "sources": ["a"]},
+    ])
+    output = list(app.build_knowledge_base_batch(items))
+
+    # Each distinct query is fetched once, from the union of the sources asking for it
+    assert sources["a"].queries.count("Metformin CKD") == 1
+    assert sorted(sources["b"].queries) == ["Metformin CKD", "insulin"]
+
+    stats = output[-1]
+    assert stats["type"] == "stats"
+    assert (stats["queries"], stats["fetches"], stats["shared_fetches"]) == (5, 4, 1)
+    assert (stats["succeeded"], stats["failed"]) == (4, 1)
+    assert stats["added"] == stats["chunks"] == 4
+
+    by_index = {record["index"]: record for record in output[:-1]}
+    assert sorted(by_index) == [0, 1, 2, 3, 4]
+    assert (by_index[0]["type"], by_index[0]["articles_reviewed"]) == ("result", 2)
+    assert (by_index[1]["type"], by_index[1]["articles_reviewed"]) == ("result", 1)
+    assert by_index[0]["session_id"] != by_index[1]["session_id"]
+    assert app.session_registry.get(by_index[1]["session_id"]).vector_store.index.ntotal == 1
+    assert (by_index[2]["type"], by_index[2]["error"]) == ("error", "Error generating summary: model overloaded")
+    assert by_index[3]["message"] == by_index[4]["message"] == "No relevant documents found"
+
+
+def test_batch_endpoint_streams_one_json_line_per_item_then_stats(batch_env, monkeypatch):
+    app, _ = batch_env
+    monkeypatch.setattr(Config, "BATCH_LLM_CONCURRENCY", 1)
+    response = app.app.test_client().post("/api/build_kb/batch", json={
+        "queries": ["unknown", "Metformin CKD", {"query": "insulin", "sources": ["a"]}], "sources": ["a", "b"]})
+    assert response.status_code == 200
+    assert response.mimetype == "application/x-ndjson"
+
+    lines = [json.loads(line) for line in response.get_data(as_text=True).splitlines()]
+    # Items without documents are reported first, then summaries as they complete
+    assert [(line["type"], line.get("index")) for line in lines] == [
+        ("result", 0), ("result", 1), ("error", 2), ("stats", None)]
+    assert lines[-1]["llm_concurrency"] == 1
+    assert [line["elapsed"] for line in lines[:-1]] == sorted(line["elapsed"] for line in lines[:-1])
+
+
+def test_build_batch_command_writes_jsonl(batch_env, tmp_path):
+    app, _ = batch_env
+    queries = tmp_path / "queries.txt"
+    queries.write_text('Metformin CKD\n\n{"query": "unknown", "sources": ["a"]}\n')
+    output = tmp_path / "results.jsonl"
+
+    result = app.app.test_cli_runner().invoke(args=["build-batch", str(queries), "--source", "a", "-o", str(output)])
+    assert result.exit_code == 0, result.output
+    lines = [json.loads(line) for line in output.read_text().splitlines()]
+    assert [line["type"] for line in lines] == ["result", "result", "stats"]
+    assert {line["query"] for line in lines[:-1]} == {"Metformin CKD", "unknown"}
+
+    queries.write_text('{"query": "x", "sources": "a"}\n')
+    result = app.app.test_cli_runner().invoke(args=["build-batch", str(queries)])
+    assert result.exit_code == 2
+    assert "Sources of query 1 must be a list of strings" in result.output
@@ -0,0 +1,77 @@
+import random
+
+from langchain_core.documents import Document
+
+from chunking import Chunker, MinHasher
+
+WORDS = ("metformin lowers glucose production in the liver and improves insulin sensitivity in muscle while "
+         "lactic acidosis remains rare but serious in patients with reduced kidney function or heart failure").split()
+
+
+class WordTokenizer:
+    def encode(self, text, add_special_tokens=True):
+        return text.split()
+
+
+def chunker(**kwargs):
+    return Chunker(tokenizer=WordTokenizer(), **kwargs)
+
+
+def passage(count, seed=0):
+    return " ".join(random.Random(seed).choices(WORDS, k=count))
+
+
+def test_chunks_fit_the_token_budget_and_repeat_the_title():
+    sentences = [f"Sentence {i} {passage(8, i)}." for i in range(12)]
+    doc = Document(page_content="Title: Metformin in kidney disease\nAbstract: " + " ".join(sentences),
+                   metadata={"doc_id": "pmid:1"})
+    chunks = chunker(max_tokens=40, overlap_tokens=10).split_documents([doc])
+
+    assert len(chunks) > 1
+    for i, chunk in enumerate(chunks):
+        assert len(chunk.page_content.split()) <= 40
+        assert chunk.page_content.startswith("Title: Metformin in kidney disease\n")
+        assert chunk.metadata == {"doc_id": "pmid:1", "chunk": i}
+    # Consecutive chunks overlap by a trailing sentence
+    assert chunks[0].page_content.split("Sentence ")[-1] in chunks[1].page_content
+
+
+def test_short_documents_are_one_chunk():
+    chunks = chunker(max_tokens=40).split_documents([Document(page_content="Title: Short\nAbstract: Brief.")])
+    assert [chunk.page_content for chunk in chunks] == ["Title: Short\nAbstract: Brief."]
+
+
+def test_exact_and_same_title_duplicates_are_dropped():
+    instance = chunker()
+    docs = [
+        Document(page_content="Title: Metformin in kidney disease\nAbstract: " + passage(30)),
+        Document(page_content="title: METFORMIN in kidney disease!\nabstract: " + passage(30).upper()),
+        Document(page_content="Title: Metformin in Kidney Disease\nAbstract: " + passage(30, 7)),
+        # Short titles are not distinctive enough to compare
+        Document(page_content="Title: Introduction\nAbstract: " + passage(30, 3)),
+        Document(page_content="Title: Introduction\nAbstract: " + passage(30, 14)),
+    ]
+    chunks = instance.split_documents(docs)
+
+    assert [chunk.page_content for chunk in chunks] == [docs[0].page_content, docs[3].page_content,
+                                                        docs[4].page_content]
+    assert instance.stats == {"documents": 5, "exact_duplicates": 1, "near_duplicates": 1, "chunks": 3,
+                              "chunks_saved": 2}
+
+
+def test_near_duplicates_are_dropped_by_minhash_similarity():
+    text = passage(120)
+    words = text.split()
+    edited = " ".join(words[:60] + ["aspirin"] + words[61:])
+    minhasher = MinHasher()
+    assert MinHasher.similarity(minhasher.signature(text), minhasher.signature(edited)) >= 0.9
+    assert MinHasher.similarity(minhasher.signature(text), minhasher.signature(passage(120, 5))) < 0.9
+
+    instance = chunker(max_tokens=500)
+    chunks = instance.split_documents([Document(page_content=text), Document(page_content=edited),
+                                       Document(page_content=passage(40, 9))])
+    assert len(chunks) == 2
+    assert (instance.stats["near_duplicates"], instance.stats["chunks_saved"]) == (1, 1)
+
+    strict = chunker(max_tokens=500, near_duplicate_threshold=1.0)
+    assert len(strict.split_documents([Document(page_content=text), Document(page_content=edited)])) == 2
@@ -0,0 +1,51 @@
+from langchain_core.documents import Document
+
+from chunking import estimate_tokens
+from context_packing import ContextPacker
+
+
+def make_packer(max_tokens=1000, min_passage_tokens=5):
+    return ContextPacker(context_window=100000, answer_tokens=0, max_tokens=max_tokens,
+                         min_passage_tokens=min_passage_tokens, tokenizer=False)
+
+
+def doc(text, doc_id, **metadata):
+    return Document(page_content=text, metadata={"doc_id": doc_id, "source": "pubmed", **metadata})
+
+
+def test_chunks_of_one_document_share_a_citation_and_overlap_is_dropped():
+    docs = [
+        doc("Title: Metformin in CKD\nMetformin is safe above eGFR 30. Reduce the dose below 45.", "pmid:1", pmid="1"),
+        doc("Title: Metformin in CKD\nReduce the dose below 45. Stop below eGFR 30.", "pmid:1", pmid="1"),
+        doc("Title: Apixaban dosing\nUse 2.5 mg twice daily with two criteria.", "pmid:2", pmid="2"),
+    ]
+    packed = make_packer().pack(docs)
+    assert packed.text == (
+        "[1] Title: Metformin in CKD\nMetformin is safe above eGFR 30. Reduce the dose below 45. Stop below eGFR 30.\n\n"
+        "[2] Title: Apixaban dosing\nUse 2.5 mg twice daily with two criteria."
+    )
+    assert [c["pmid"] for c in packed.citations] == ["1", "2"]
+    assert packed.stats["duplicate_sentences"] == 1
+    assert len(packed.documents) == 3
+
+
+def test_context_stays_within_budget_and_keeps_rank_order():
+    sentences = " ".join(f"Sentence number {i} about dosing." for i in range(40))
+    docs = [doc(f"Title: Doc {i}\n{sentences.replace('dosing', f'drug{i}')}", f"d{i}") for i in range(5)]
+    packed = make_packer(max_tokens=200).pack(docs)
+    assert packed.tokens <= 200
+    assert packed.text.startswith("[1] Title: Doc 0")
+    assert packed.stats["trimmed"] + packed.stats["skipped"] >= 4
+
+
+def test_budget_reserves_answer_template_and_question():
+    packer = ContextPacker(context_window=1000, answer_tokens=600, max_tokens=5000, tokenizer=False)
+    template = "Context: {context}\nQuestion: {question}"
+    question = "What is the apixaban dose?"
+    assert packer.budget(template, question) == 400 - estimate_tokens(template) - estimate_tokens(question)
+
+
+def test_text_without_sentence_breaks_is_cut_by_words():
+    packed = make_packer(max_tokens=30).pack([doc("word " * 200, "pdf:1:1", file="a.pdf", page=1)])
+    assert packed.text.startswith("[1] a.pdf, page 1\nword word")
+    assert packed.tokens <= 30
@@ -0,0 +1,52 @@
+import langchain_community.embeddings
+
+from embedding_service import EmbeddingService
+
+
+class StubModel:
+    def __init__(self):
+        self.batches = []
+
+    def embed_documents(self, texts):
+        self.batches.append(list(texts))
+        return [[float(len(text)), 1.0] for text in texts]
+
+
+def test_missing_texts_are_embedded_in_batches_once_each():
+    model = StubModel()
+    service = EmbeddingService(model=model, batch_size=2)
+    vectors = service.embed_documents(["a", "bb", "a", "ccc", "dddd"])
+
+    assert vectors == [[1.0, 1.0], [2.0, 1.0], [1.0, 1.0], [3.0, 1.0], [4.0, 1.0]]
+    assert model.batches == [["a", "bb"], ["ccc", "dddd"]]
+
+
+def test_cached_vectors_skip_the_model_and_cache_is_bounded():
+    model = StubModel()
+    service = EmbeddingService(model=model, batch_size=8, cache_size=2)
+    service.embed_documents(["a", "bb"])
+    assert service.embed_query("bb") == [2.0, 1.0]
+    assert len(model.batches) == 1
+    assert (service.hits, service.misses) == (1, 2)
+
+    service.embed_documents(["ccc"])  # evicts "a", the least recently used
+    assert service.stats()["size"] == 2
+    service.embed_documents(["bb", "a"])
+    assert model.batches[1:] == [["ccc"], ["a"]]
+
+
+def test_model_is_loaded_on_first_use(monkeypatch):
+    loaded = []
+
+    class StubHuggingFaceEmbeddings(StubModel):
+        def __init__(self, model_name):
+            super().__init__()
+            loaded.append(model_name)
+
+    monkeypatch.setattr(langchain_community.embeddings, "HuggingFaceEmbeddings", StubHuggingFaceEmbeddings,
+                        raising=False)
+    service = EmbeddingService(model_name="stub-model")
+    assert loaded == []
+    service.embed_documents(["a"])
+    service.embed_documents(["bb"])
+    assert loaded == ["stub-model"]
@@ -0,0 +1,51 @@
+import time
+from sources.base_handler import BaseSourceHandler
+from sources.fanout import fetch_all
+
+
+class SleepyHandler(BaseSourceHandler):
+    def __init__(self, delay, results=None, error=None):
+        self.delay = delay
+        self.results = results or []
+        self.error = error
+
+    def fetch_data(self, query: str) -> list:
+        time.sleep(self.delay)
+        if self.error:
+            raise self.error
+        return [f"{query}: {result}" for result in self.results]
+
+
+def test_handlers_run_concurrently():
+    handlers = {name: SleepyHandler(0.2, ["doc"]) for name in ("a", "b", "c", "d")}
+    start = time.monotonic()
+    results = fetch_all(handlers, "aspirin", timeout=2)
+    assert time.monotonic() - start < 0.6
+    assert all(result.ok for result in results.values())
+    assert results["a"].documents == ["aspirin: doc"]
+
+
+def test_slow_source_is_reported_as_timeout():
+    handlers = {"fast": SleepyHandler(0.01, ["doc"]), "slow": SleepyHandler(2)}
+    start = time.monotonic()
+    results = fetch_all(handlers, "q", timeout=5, timeouts={"slow": 0.2})
+    assert time.monotonic() - start < 1
+    assert results["fast"].ok
+    assert results["slow"].status == "timeout"
+
+
+def test_global_deadline_caps_all_sources():
+    handlers = {"a": SleepyHandler(2), "b": SleepyHandler(0.01, ["doc"])}
+    start = time.monotonic()
+    results = fetch_all(handlers, "q", timeout=5, deadline=0.2)
+    assert time.monotonic() - start < 1
+    assert results["a"].status == "timeout"
+    assert results["b"].ok
+
+
+def test_handler_errors_are_isolated():
+    handlers = {"broken": SleepyHandler(0, error=RuntimeError("boom")), "ok": SleepyHandler(0, ["doc"])}
+    results = fetch_all(handlers, "q", timeout=1)
+    assert results["broken"].status == "error"
+    assert results["broken"].error == "boom"
+    assert results["ok"].documents == ["q: doc"]
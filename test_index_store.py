@@ -0,0 +1,67 @@
+import multiprocessing
+import os
+
+import pytest
+from langchain_core.documents import Document
+
+from conftest import WordEmbeddings
+from index_store import POINTER_FILE, IndexStore
+from knowledge_base import KnowledgeBase
+from sessions import SessionRegistry
+
+
+def chunks(prefix, count):
+    return [Document(page_content=f"{prefix} chunk {i}", metadata={"doc_id": f"{prefix}:{i}"}) for i in range(count)]
+
+
+def add_from_process(path, prefix):
+    KnowledgeBase(path, embeddings=WordEmbeddings()).add_documents(chunks(prefix, 5))
+
+
+def test_workers_build_on_each_others_versions(tmp_path):
+    path = str(tmp_path / "vector_store")
+    first = KnowledgeBase(path, embeddings=WordEmbeddings())
+    second = KnowledgeBase(path, embeddings=WordEmbeddings())
+    assert len(second) == 0
+
+    assert first.add_documents(chunks("a", 3))["added"] == 3
+    assert second.add_documents(chunks("a", 3) + chunks("b", 2))["added"] == 2
+    assert first.add_documents(chunks("c", 1))["added"] == 1
+
+    assert len(first) == len(second) == 6
+    assert first._mapped and second._mapped
+    with open(os.path.join(path, POINTER_FILE)) as file:
+        assert file.read() == "index.v3"
+    assert sorted(name for name in os.listdir(path) if name.startswith("index.v")) == ["index.v2", "index.v3"]
+    assert [doc.page_content for doc in second.vector_store.similarity_search("b chunk 1", k=1)] == ["b chunk 1"]
+
+
+def test_concurrent_processes_do_not_lose_chunks(tmp_path):
+    if "fork" not in multiprocessing.get_all_start_methods():
+        pytest.skip("needs fork")
+    path = str(tmp_path / "vector_store")
+    context = multiprocessing.get_context("fork")
+    processes = [context.Process(target=add_from_process, args=(path, f"p{i}")) for i in range(4)]
+    for process in processes:
+        process.start()
+    for process in processes:
+        process.join(30)
+        assert process.exitcode == 0
+    assert len(KnowledgeBase(path, embeddings=WordEmbeddings())) == 20
+
+
+def test_session_rebuilt_by_another_worker_is_reloaded(tmp_path):
+    kb = KnowledgeBase(str(tmp_path / "kb"), embeddings=WordEmbeddings(), mmap=False)
+    ids = kb.add_documents(chunks("a", 4))["ids"]
+    root = str(tmp_path / "sessions")
+    worker_one = SessionRegistry(root=root, embeddings=WordEmbeddings())
+    worker_two = SessionRegistry(root=root, embeddings=WordEmbeddings())
+
+    worker_one.put("s1", kb.subset(ids[:2]))
+    assert worker_two.get("s1").vector_store.index.ntotal == 2
+    worker_one.put("s1", kb.subset(ids))
+    assert worker_two.get("s1").vector_store.index.ntotal == 4
+    assert IndexStore(os.path.join(root, "s1")).current() == "index.v2"
+
+    worker_one.remove("s1")
+    assert worker_two.get("s1") is None
@@ -0,0 +1,274 @@
+import threading
+import time
+
+import pytest
+
+from config import Config
+from conftest import StubSource
+from jobs import (CANCELLED, DONE, FAILED, QUEUED, RUNNING, InMemoryJobBackend, Job, JobManager, QueueFullError,
+                  SQLiteJobBackend)
+
+STAGES = ["fetching", "summarizing"]
+
+
+def wait_for(predicate, timeout=5):
+    deadline = time.monotonic() + timeout
+    while not predicate():
+        assert time.monotonic() < deadline, "timed out"
+        time.sleep(0.01)
+
+
+class HeldBackend(InMemoryJobBackend):
+    """Never hands a job to a worker, so submitted jobs stay queued."""
+
+    def dequeue(self, timeout=None):
+        time.sleep(timeout or 0)
+        return None
+
+
+class FullBackend(InMemoryJobBackend):
+    def enqueue(self, job_id):
+        raise QueueFullError("Too many jobs queued, please retry later")
+
+
+class CountingBackend(InMemoryJobBackend):
+    def __init__(self):
+        super().__init__()
+        self.saves = 0
+        self.cancel_checks = 0
+
+    def save(self, job):
+        self.saves += 1
+        super().save(job)
+
+    def cancel_requested(self, job):
+        self.cancel_checks += 1
+        return super().cancel_requested(job)
+
+
+def streaming_task(tokens):
+    def task():
+        for stage in STAGES:
+            yield "progress", {"stage": stage, "message": stage.title()}
+            for _ in range(tokens):
+                yield "token", {"text": "a"}
+        yield "result", {"summary": "a" * tokens}
+    return task
+
+
+def blocking_task(started, release, log):
+    def task():
+        log.append("started")
+        yield "progress", {"stage": "fetching", "message": "Fetching"}
+        started.set()
+        release.wait(5)
+        log.append("released")
+        yield "progress", {"stage": "summarizing", "message": "Summarizing"}
+        yield "result", {"summary": "done"}
+    return task
+
+
+def test_job_reports_stage_progress_timings_and_result():
+    manager = JobManager(InMemoryJobBackend(), workers=1)
+    started, release, log = threading.Event(), threading.Event(), []
+    job = manager.submit("build_kb", blocking_task(started, release, log), stages=STAGES)
+    assert started.wait(5)
+
+    status = manager.get(job.id).to_dict()
+    assert (status["status"], status["stage"], status["message"], status["progress"]) == \
+        (RUNNING, "fetching", "Fetching", 0.0)
+    release.set()
+    wait_for(lambda: manager.get(job.id).finished)
+
+    job = manager.get(job.id)
+    assert (job.status, job.stage, job.progress, job.result) == (DONE, "summarizing", 1.0, {"summary": "done"})
+    assert set(job.timings) == set(STAGES)
+    assert job.timings["fetching"] >= 0
+    assert job.started_at <= job.finished_at
+
+
+def test_streamed_tokens_do_not_save_the_job(monkeypatch):
+    monkeypatch.setattr(Config, "JOB_CANCEL_CHECK_INTERVAL", 60)
+    backend = CountingBackend()
+    manager = JobManager(backend, workers=1)
+    job = manager.submit("build_kb", streaming_task(500), stages=STAGES)
+    wait_for(lambda: manager.get(job.id).finished)
+
+    assert manager.get(job.id).status == DONE
+    # Submitted, started, one save per stage, the result and the final save
+    assert backend.saves == 6
+    assert backend.cancel_checks == len(STAGES)
+
+
+def test_full_queue_rejects_new_jobs():
+    manager = JobManager(InMemoryJobBackend(max_queue=1), workers=1)
+    started, release, log = threading.Event(), threading.Event(), []
+    manager.submit("build_kb", blocking_task(started, release, log))
+    assert started.wait(5)
+    queued = manager.submit("build_kb", blocking_task(threading.Event(), release, log))
+    with pytest.raises(QueueFullError):
+        manager.submit("build_kb", blocking_task(threading.Event(), release, log))
+
+    assert manager.get(queued.id).status == QUEUED
+    release.set()
+    wait_for(lambda: manager.get(queued.id).finished)
+    assert manager.get(queued.id).status == DONE
+
+
+def test_cancelled_queued_job_never_runs():
+    manager = JobManager(InMemoryJobBackend(), workers=1)
+    started, release, log = threading.Event(), threading.Event(), []
+    running = manager.submit("build_kb", blocking_task(started, release, log))
+    assert started.wait(5)
+    queued_log = []
+    queued = manager.submit("build_kb", blocking_task(threading.Event(), release, queued_log))
+
+    assert manager.cancel(queued.id).status == CANCELLED
+    release.set()
+    wait_for(lambda: manager.get(running.id).finished)
+    time.sleep(0.1)
+    assert manager.get(queued.id).status == CANCELLED
+    assert queued_log == []
+
+
+def test_running_job_is_cancelled_at_its_next_event():
+    manager = JobManager(InMemoryJobBackend(), workers=1)
+    started, release, log = threading.Event(), threading.Event(), []
+    job = manager.submit("build_kb", blocking_task(started, release, log))
+    assert started.wait(5)
+
+    assert manager.cancel(job.id).cancel_requested
+    release.set()
+    wait_for(lambda: manager.get(job.id).finished)
+    job = manager.get(job.id)
+    assert (job.status, job.result) == (CANCELLED, None)
+    assert log == ["started", "released"]
+    assert manager.cancel(job.id).status == CANCELLED  # cancelling a finished job changes nothing
+
+
+def test_failed_and_incomplete_tasks_fail_the_job():
+    manager = JobManager(InMemoryJobBackend(), workers=1)
+    failing = manager.submit("build_kb", lambda: iter([("error", {"error": "No documents"})]))
+    silent = manager.submit("build_kb", lambda: iter([("progress", {"stage": "fetching"})]))
+    wait_for(lambda: manager.get(failing.id).finished and manager.get(silent.id).finished)
+    assert (manager.get(failing.id).status, manager.get(failing.id).error) == (FAILED, "No documents")
+    assert (manager.get(silent.id).status, manager.get(silent.id).error) == (FAILED, "Job ended without a result")
+
+
+def test_finished_jobs_are_purged_after_the_retention_period():
+    backend = InMemoryJobBackend(retention=60)
+    old, recent, queued = Job("build_kb"), Job("build_kb"), Job("build_kb")
+    old.status, old.finished_at = DONE, time.time() - 120
+    recent.status, recent.finished_at = DONE, time.time() - 30
+    queued.created_at = time.time() - 120
+    for job in (old, recent, queued):
+        backend.save(job)
+
+    assert backend.get(old.id) is None
+    assert backend.get(recent.id) is recent
+    assert backend.get(queued.id) is queued
+
+
+def test_build_routes_queue_poll_and_cancel(app_env, monkeypatch):
+    app_env.source_handlers.set("stub", StubSource({"metformin": [
+        {"page_content": "Title: Metformin in kidney disease\nAbstract: Dose by eGFR.", "metadata": {"pmid": "1"}},
+    ]}))
+    monkeypatch.setattr(app_env, "job_manager", JobManager(InMemoryJobBackend(), workers=1))
+    client = app_env.app.test_client()
+
+    response = client.post("/api/build_kb", data={"query": "metformin", "sources": ["stub"], "session_id": "s1"})
+    assert response.status_code == 202
+    body = response.json
+    assert body["status_url"] == f"/api/build_kb/{body['job_id']}"
+    assert response.headers["Location"].endswith(body["status_url"])
+    assert body["session_id"] == "s1"
+
+    wait_for(lambda: client.get(body["status_url"]).json["status"] in (DONE, FAILED))
+    status = client.get(body["status_url"]).json
+    assert status["status"] == DONE
+    assert set(status["timings"]) == {"fetching", "embedding", "indexing", "summarizing"}
+    assert status["result"]["session_id"] == "s1"
+    assert client.get(f"{body['status_url']}/result").json == status["result"]
+    assert client.delete(body["status_url"]).json["status"] == DONE
+
+    assert client.get("/api/build_kb/unknown").status_code == 404
+    assert client.delete("/api/build_kb/unknown").status_code == 404
+
+
+def test_build_routes_report_queued_cancelled_and_rejected_jobs(app_env, monkeypatch):
+    monkeypatch.setattr(app_env, "job_manager", JobManager(HeldBackend(), workers=1))
+    client = app_env.app.test_client()
+    job_url = client.post("/api/build_kb", data={"query": "metformin"}).json["status_url"]
+
+    response = client.get(f"{job_url}/result")
+    assert (response.status_code, response.json["status"]) == (409, QUEUED)
+    assert client.delete(job_url).json["status"] == CANCELLED
+    assert client.get(f"{job_url}/result").status_code == 410
+
+    monkeypatch.setattr(app_env, "job_manager", JobManager(FullBackend(), workers=1))
+    response = client.post("/api/build_kb", data={"query": "metformin"})
+    assert response.status_code == 503
+
+
+def test_sqlite_backend_round_trips_jobs_between_processes(tmp_path):
+    path = str(tmp_path / "jobs.sqlite3")
+    first, second = SQLiteJobBackend(path), SQLiteJobBackend(path)
+    job = Job("build_kb", STAGES)
+    job.status, job.stage, job.message = RUNNING, "fetching", "Fetching"
+    job.timings, job.started_at = {"fetching": 0.5}, time.time()
+    first.save(job)
+
+    loaded = second.get(job.id)
+    assert loaded.to_dict() == job.to_dict()
+    assert loaded.stages == STAGES
+    assert second.get("unknown") is None
+
+    job.status, job.result, job.finished_at = DONE, {"summary": "done"}, time.time()
+    first.save(job)
+    assert (second.get(job.id).status, second.get(job.id).result) == (DONE, {"summary": "done"})
+
+
+def test_sqlite_cancel_request_survives_later_saves_by_the_running_process(tmp_path):
+    path = str(tmp_path / "jobs.sqlite3")
+    running, other = SQLiteJobBackend(path), SQLiteJobBackend(path)
+    job = Job("build_kb")
+    job.status = RUNNING
+    running.save(job)
+
+    cancelled = other.get(job.id)
+    cancelled.cancel_requested = True
+    other.save(cancelled)
+    job.enter_stage("summarizing")
+    running.save(job)  # the running process's copy still has cancel_requested False
+
+    assert other.get(job.id).cancel_requested
+    assert running.cancel_requested(job)
+
+
+def test_sqlite_backend_purges_finished_jobs_after_the_retention_period(tmp_path):
+    backend = SQLiteJobBackend(str(tmp_path / "jobs.sqlite3"), retention=60)
+    old, queued = Job("build_kb"), Job("build_kb")
+    old.status, old.finished_at = DONE, time.time() - 120
+    backend.save(old)
+    backend.save(queued)
+    assert backend.get(old.id) is None
+    assert backend.get(queued.id).status == QUEUED
+
+
+def test_queued_job_cancelled_from_another_process_is_skipped(tmp_path):
+    path = str(tmp_path / "jobs.sqlite3")
+    manager = JobManager(SQLiteJobBackend(path), workers=1)
+    started, release, log = threading.Event(), threading.Event(), []
+    running = manager.submit("build_kb", blocking_task(started, release, log))
+    assert started.wait(5)
+    queued_log = []
+    queued = manager.submit("build_kb", blocking_task(threading.Event(), release, queued_log))
+
+    other_process = JobManager(SQLiteJobBackend(path), workers=1)
+    assert other_process.cancel(queued.id).status == CANCELLED
+    release.set()
+    wait_for(lambda: manager.get(running.id).finished)
+    time.sleep(0.1)
+    assert manager.get(queued.id).status == CANCELLED
+    assert queued_log == []
+    assert queued.id not in manager._tasks
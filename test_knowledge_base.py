@@ -0,0 +1,51 @@
+from langchain_core.documents import Document
+
+from conftest import WordEmbeddings
+from knowledge_base import KnowledgeBase, assign_document_ids, document_id
+
+
+class CountingEmbeddings(WordEmbeddings):
+    def __init__(self):
+        self.embedded = []
+
+    def embed_documents(self, texts):
+        self.embedded.extend(texts)
+        return super().embed_documents(texts)
+
+
+def article(text, **metadata):
+    return assign_document_ids([Document(page_content=text, metadata=metadata)])[0]
+
+
+def test_document_id_prefers_pmid_then_doi_then_url_then_content():
+    text = "Title: Metformin\nAbstract: Lowers HbA1c."
+    assert document_id(Document(page_content=text, metadata={"pmid": "123", "doi": "10.1/X", "url": "u"})) == "pmid:123"
+    assert document_id(Document(page_content=text, metadata={"doi": " 10.1/X ", "url": "u"})) == "doi:10.1/x"
+    assert document_id(Document(page_content=text, metadata={"url": "https://a.org/Page"})) == "url:https://a.org/page"
+    assert document_id(Document(page_content=text)).startswith("sha256:")
+    assert document_id(Document(page_content=text)) == document_id(Document(page_content=text, metadata={"pmid": ""}))
+
+
+def test_readding_an_article_is_a_no_op(tmp_path):
+    embeddings = CountingEmbeddings()
+    kb = KnowledgeBase(str(tmp_path), embeddings=embeddings, mmap=False)
+    first = kb.add_documents([article("Metformin trial", pmid="1", source="pubmed")])
+    # Same PMID fetched again, e.g. through another source with different metadata
+    second = kb.add_documents([article("Metformin trial", pmid="1", source="google_scholar")])
+
+    assert (first["added"], second["added"], second["skipped"]) == (1, 0, 1)
+    assert first["ids"] == second["ids"]
+    assert len(kb) == 1
+    assert embeddings.embedded == ["Metformin trial"]
+
+
+def test_only_new_chunks_are_embedded(tmp_path):
+    embeddings = CountingEmbeddings()
+    kb = KnowledgeBase(str(tmp_path), embeddings=embeddings, mmap=False)
+    kb.add_documents([article("Metformin trial", pmid="1"), article("Insulin dosing", pmid="2")])
+    embeddings.embedded.clear()
+
+    stats = kb.add_documents([article("Insulin dosing", pmid="2"), article("Statin review", doi="10.1/s")])
+    assert (stats["added"], stats["skipped"]) == (1, 1)
+    assert embeddings.embedded == ["Statin review"]
+    assert len(KnowledgeBase(str(tmp_path), embeddings=embeddings, mmap=False)) == 3
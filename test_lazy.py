@@ -0,0 +1,39 @@
+import threading
+import time
+
+from lazy import Lazy
+
+
+def test_concurrent_gets_build_the_object_once():
+    calls = []
+
+    def build():
+        calls.append(threading.current_thread().name)
+        time.sleep(0.05)
+        return object()
+
+    lazy = Lazy(build)
+    barrier = threading.Barrier(8)
+    values = []
+
+    def get():
+        barrier.wait()
+        values.append(lazy.get())
+
+    threads = [threading.Thread(target=get) for _ in range(8)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert len(calls) == 1
+    assert len(values) == 8 and all(value is values[0] for value in values)
+
+
+def test_set_and_reset_replace_the_object():
+    lazy = Lazy(list)
+    assert not lazy.initialized
+    lazy.set(None)
+    assert lazy.initialized and lazy.get() is None
+    lazy.reset()
+    assert lazy.get() == [] and lazy.initialized
@@ -0,0 +1,133 @@
+from langchain_core.documents import Document
+from langchain_core.language_models.fake_chat_models import FakeListChatModel
+from langchain_core.runnables import RunnableLambda
+
+from app import cache_config
+from conftest import WordEmbeddings
+from llm_cache import CachedChatModel, ResponseCache, SemanticCache, SemanticCachedRunnable, model_descriptor
+from observability import MeteredChatModel
+
+DOCS = [Document(page_content="Metformin in kidney disease"), Document(page_content="Insulin dosing")]
+
+
+class CountingAnswers:
+    def __init__(self):
+        self.questions = []
+
+    def __call__(self, input):
+        self.questions.append(input["question"])
+        return f"answer {len(self.questions)}"
+
+
+class LocalChatModel(FakeListChatModel):
+    """Reports no identifying parameters, like ChatOllama."""
+
+    model: str = "llama3"
+    temperature: float = 0.0
+
+    @property
+    def _identifying_params(self):
+        return {}
+
+
+def semantic(threshold=0.9, max_size=10):
+    answers = CountingAnswers()
+    cache = SemanticCache(WordEmbeddings(), threshold=threshold, max_size=max_size)
+    return SemanticCachedRunnable(RunnableLambda(answers), cache, "question", "docs", "chat"), cache, answers
+
+
+def test_exact_prompts_reuse_the_cached_response():
+    model = FakeListChatModel(responses=["first", "second", "third"])
+    llm = CachedChatModel(model, ResponseCache())
+
+    assert llm.invoke("Is metformin safe?").content == "first"
+    assert llm.invoke("Is metformin safe?").content == "first"
+    assert [chunk.content for chunk in llm.stream("Is metformin safe?")] == ["first"]
+    assert llm.invoke("Is insulin safe?").content == "second"
+    assert model.i == 2
+    assert (llm.cache.stats.hits, llm.cache.stats.misses) == (2, 2)
+
+
+def test_bypass_skips_lookup_but_stores_the_fresh_answer():
+    model = FakeListChatModel(responses=["first", "second"])
+    llm = CachedChatModel(model, ResponseCache())
+    llm.invoke("Is metformin safe?")
+
+    assert llm.invoke("Is metformin safe?", cache_config(False)).content == "second"
+    assert llm.invoke("Is metformin safe?", cache_config(True)).content == "second"
+    assert cache_config(True) is None
+    assert llm.cache.stats.bypassed == 1
+
+
+def test_least_recently_used_responses_are_evicted():
+    cache = ResponseCache(max_size=2)
+    cache.set("a", "A")
+    cache.set("b", "B")
+    cache.get("a")
+    cache.set("c", "C")
+    assert (cache.get("a"), cache.get("b"), cache.get("c")) == ("A", None, "C")
+    assert len(cache) == 2
+
+
+def test_paraphrased_questions_reuse_answers_above_the_threshold():
+    runnable, cache, answers = semantic(threshold=0.9)
+    assert runnable.invoke({"question": "is metformin safe in ckd", "docs": DOCS}) == "answer 1"
+    # Cosine similarity 5 / sqrt(30) = 0.91
+    assert runnable.invoke({"question": "Is metformin safe in CKD patients", "docs": DOCS}) == "answer 1"
+    assert runnable.invoke({"question": "how is insulin dosed", "docs": DOCS}) == "answer 2"
+
+    strict, _, strict_answers = semantic(threshold=0.95)
+    strict.invoke({"question": "is metformin safe in ckd", "docs": DOCS})
+    strict.invoke({"question": "Is metformin safe in CKD patients", "docs": DOCS})
+    assert len(strict_answers.questions) == 2
+    assert (cache.stats.hits, cache.stats.misses) == (1, 2)
+
+
+def test_semantic_entries_are_isolated_by_scope_and_documents():
+    runnable, cache, answers = semantic()
+    runnable.invoke({"question": "is metformin safe", "docs": DOCS})
+    runnable.invoke({"question": "is metformin safe", "docs": DOCS[:1]})
+    summary = SemanticCachedRunnable(RunnableLambda(answers), cache, "question", "docs", "summary")
+    summary.invoke({"question": "is metformin safe", "docs": DOCS})
+    # Order of the retrieved documents does not matter
+    assert runnable.invoke({"question": "is metformin safe", "docs": DOCS[::-1]}) == "answer 1"
+    assert len(answers.questions) == 3
+
+
+def test_semantic_cache_evicts_oldest_document_sets_and_honours_bypass():
+    runnable, cache, answers = semantic(max_size=1)
+    runnable.invoke({"question": "is metformin safe", "docs": DOCS[:1]})
+    runnable.invoke({"question": "is insulin safe", "docs": DOCS[1:]})
+    runnable.invoke({"question": "is metformin safe", "docs": DOCS[:1]})
+    assert len(answers.questions) == 3
+
+    assert [*runnable.stream({"question": "is metformin safe", "docs": DOCS[:1]})] == ["answer 3"]
+    assert runnable.invoke({"question": "is metformin safe", "docs": DOCS[:1]}, cache_config(False)) == "answer 4"
+    assert cache.stats.bypassed == 1
+
+
+def test_models_with_different_settings_do_not_share_entries():
+    cache = ResponseCache()
+    llama = CachedChatModel(MeteredChatModel(LocalChatModel(responses=["llama"])), cache)
+    warm = CachedChatModel(MeteredChatModel(LocalChatModel(responses=["warm"], temperature=0.7)), cache)
+    mistral = CachedChatModel(MeteredChatModel(LocalChatModel(responses=["mistral"], model="mistral")), cache)
+    same = CachedChatModel(MeteredChatModel(LocalChatModel(responses=["unused"])), cache)
+
+    assert [llm.invoke("Is metformin safe?").content for llm in (llama, warm, mistral, same)] == \
+        ["llama", "warm", "mistral", "llama"]
+    assert len(cache) == 3
+
+    answers = CountingAnswers()
+    semantic_cache = SemanticCache(WordEmbeddings())
+    for model in (LocalChatModel(responses=[""]), LocalChatModel(responses=[""], model="mistral")):
+        SemanticCachedRunnable(RunnableLambda(answers), semantic_cache, "question", "docs", "chat",
+                               model=model).invoke({"question": "is metformin safe", "docs": DOCS})
+    assert len(answers.questions) == 2
+
+
+def test_ollama_descriptor_includes_the_model_and_settings():
+    from langchain_ollama import ChatOllama
+    descriptors = {model_descriptor(ChatOllama(model="llama3", temperature=0)),
+                   model_descriptor(ChatOllama(model="llama3", temperature=0.7)),
+                   model_descriptor(ChatOllama(model="mistral", temperature=0))}
+    assert len(descriptors) == 3
@@ -0,0 +1,88 @@
+import logging
+
+from langchain_core.messages import AIMessage, AIMessageChunk
+from langchain_core.runnables import RunnableLambda
+
+import observability
+from config import Config
+from observability import (LLM_TOKENS, STAGE_SECONDS, MeteredChatModel, MetricsRegistry, get_request_id,
+                           reset_request_id, set_request_id, stage)
+from sources.base_handler import BaseSourceHandler
+from sources.fanout import fetch_all
+
+
+class RequestIdHandler(BaseSourceHandler):
+    def fetch_data(self, query: str) -> list:
+        return [get_request_id()]
+
+
+def test_registry_renders_prometheus_text():
+    registry = MetricsRegistry()
+    counter = registry.counter("test_requests_total", "Requests")
+    histogram = registry.histogram("test_seconds", "Latency", buckets=(0.1, 1))
+    counter.inc(endpoint="/api/chat")
+    counter.inc(2, endpoint="/api/chat")
+    histogram.observe(0.5, stage="llm")
+    registry.register_collector(lambda: [("test_ratio", "gauge", "Ratio", [({"cache": "llm"}, 0.25)])])
+
+    text = registry.render()
+    assert "# TYPE test_requests_total counter" in text
+    assert 'test_requests_total{endpoint="/api/chat"} 3' in text
+    assert 'test_seconds_bucket{stage="llm",le="0.1"} 0' in text
+    assert 'test_seconds_bucket{stage="llm",le="1"} 1' in text
+    assert 'test_seconds_bucket{stage="llm",le="+Inf"} 1' in text
+    assert 'test_seconds_count{stage="llm"} 1' in text
+    assert 'test_ratio{cache="llm"} 0.25' in text
+
+
+def test_stage_is_recorded_and_skipped_when_disabled(monkeypatch):
+    before = STAGE_SECONDS.count(stage="test-stage")
+    with stage("test-stage"):
+        pass
+    assert STAGE_SECONDS.count(stage="test-stage") == before + 1
+
+    monkeypatch.setattr(Config, "METRICS_ENABLED", False)
+    with stage("test-stage"):
+        pass
+    assert STAGE_SECONDS.count(stage="test-stage") == before + 1
+
+
+def test_request_id_reaches_fan_out_threads_and_log_records():
+    observability.install_log_request_ids()
+    token = set_request_id("req-123")
+    try:
+        results = fetch_all({"a": RequestIdHandler(), "b": RequestIdHandler()}, "q")
+        record = logging.getLogRecordFactory()("test", logging.INFO, __file__, 1, "message", (), None)
+    finally:
+        reset_request_id(token)
+    assert [result.documents for result in results.values()] == [["req-123"], ["req-123"]]
+    assert record.request_id == "req-123"
+    assert get_request_id() == "-"
+
+
+def test_invalid_request_id_is_replaced():
+    token = set_request_id("bad id\nwith newline")
+    try:
+        assert get_request_id() != "bad id\nwith newline"
+        assert len(get_request_id()) == 16
+    finally:
+        reset_request_id(token)
+
+
+def test_metered_chat_model_counts_reported_tokens():
+    usage = {"input_tokens": 7, "output_tokens": 3, "total_tokens": 10}
+    input_before = LLM_TOKENS.value(direction="input")
+    output_before = LLM_TOKENS.value(direction="output")
+
+    llm = MeteredChatModel(RunnableLambda(lambda _: AIMessage(content="answer", usage_metadata=usage)))
+    assert llm.invoke("prompt").content == "answer"
+
+    def stream(_):
+        yield AIMessageChunk(content="ans")
+        yield AIMessageChunk(content="wer", usage_metadata=usage)
+
+    llm.llm = RunnableLambda(stream)
+    assert "".join(chunk.content for chunk in llm.stream("prompt")) == "answer"
+
+    assert LLM_TOKENS.value(direction="input") == input_before + 14
+    assert LLM_TOKENS.value(direction="output") == output_before + 6
@@ -0,0 +1,73 @@
+import io
+import os
+
+from PyPDF2 import PageObject, PdfWriter
+from PyPDF2.generic import DecodedStreamObject, DictionaryObject, NameObject
+from werkzeug.datastructures import FileStorage
+
+import pdf_ingest
+from lazy import Lazy
+from pdf_ingest import PageCache, iter_pdf_pages, save_upload, worker_pool
+
+
+def make_pdf(pages):
+    writer = PdfWriter()
+    font = writer._add_object(DictionaryObject({
+        NameObject("/Type"): NameObject("/Font"),
+        NameObject("/Subtype"): NameObject("/Type1"),
+        NameObject("/BaseFont"): NameObject("/Helvetica"),
+    }))
+    for i in range(pages):
+        page = PageObject.create_blank_page(width=612, height=792)
+        content = DecodedStreamObject()
+        content.set_data(f"BT /F1 12 Tf 72 720 Td (Page {i + 1}) Tj ET".encode("ascii"))
+        page[NameObject("/Contents")] = writer._add_object(content)
+        page[NameObject("/Resources")] = DictionaryObject({
+            NameObject("/Font"): DictionaryObject({NameObject("/F1"): font}),
+        })
+        writer.add_page(page)
+    buffer = io.BytesIO()
+    writer.write(buffer)
+    return buffer.getvalue()
+
+
+class RecordingExecutor:
+    def __init__(self, executor):
+        self.executor = executor
+        self.ranges = []
+
+    def submit(self, function, path, start, stop):
+        self.ranges.append((start, stop))
+        return self.executor.submit(function, path, start, stop)
+
+
+def test_identical_uploads_are_saved_once_under_their_hash(tmp_path):
+    data = make_pdf(1)
+    first = save_upload(FileStorage(io.BytesIO(data), "a.pdf"), str(tmp_path))
+    second = save_upload(FileStorage(io.BytesIO(data), "renamed.pdf"), str(tmp_path))
+
+    assert first == second
+    assert os.path.basename(first[0]) == f"{first[1]}.pdf"
+    assert os.listdir(tmp_path) == [f"{first[1]}.pdf"]
+
+
+def test_pages_are_extracted_in_batches_then_served_from_the_cache(tmp_path, monkeypatch):
+    path, sha256 = save_upload(FileStorage(io.BytesIO(make_pdf(5)), "trial.pdf"), str(tmp_path / "uploads"))
+    cache = PageCache(str(tmp_path / "cache"))
+    executor = RecordingExecutor(worker_pool.get())
+    monkeypatch.setattr(pdf_ingest, "worker_pool", Lazy(lambda: executor))
+
+    pages = list(iter_pdf_pages(path, sha256, "trial.pdf", page_cache=cache, pages_per_task=2))
+    assert executor.ranges == [(0, 2), (2, 4), (4, 5)]
+    assert [page.page_content.strip() for page in pages] == [f"Page {i}" for i in range(1, 6)]
+    assert pages[2].metadata == {"source": "pdf", "file": "trial.pdf", "sha256": sha256, "page": 3,
+                                 "doc_id": f"pdf:{sha256}:3"}
+    assert cache.get(sha256) == [page.page_content for page in pages]
+
+    cached = list(iter_pdf_pages(path, sha256, "trial.pdf", page_cache=cache, pages_per_task=2))
+    assert len(executor.ranges) == 3
+    assert [page.page_content for page in cached] == [page.page_content for page in pages]
+
+
+def test_workers_are_not_forked_from_the_server_process():
+    assert worker_pool.get()._mp_context.get_start_method() in ("forkserver", "spawn")
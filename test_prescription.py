@@ -0,0 +1,98 @@
+import io
+
+import pytest
+from langchain_community.vectorstores import FAISS
+from PIL import Image, ImageDraw
+
+import prescription
+from config import Config
+from conftest import WordEmbeddings
+from prescription import ImageTooLargeError, OCRBackend, extract_drug_names, preprocess_image, read_prescription
+from pdf_ingest import PageCache
+
+
+class RecordingOCR(OCRBackend):
+    calls = []
+
+    def image_to_text(self, image) -> str:
+        self.calls.append((image.mode, image.size))
+        return "Tab. Metformin 500 mg twice daily\nAtorvastatin 20mg at night"
+
+
+@pytest.fixture
+def recording_backend(monkeypatch):
+    monkeypatch.setitem(prescription.OCR_BACKENDS, "recording", RecordingOCR)
+    monkeypatch.setitem(prescription._backends, "recording", RecordingOCR())
+    RecordingOCR.calls = []
+    return "recording"
+
+
+def skewed_page(angle, size=(3000, 2200), fmt="PNG"):
+    image = Image.new("RGB", size, "white")
+    draw = ImageDraw.Draw(image)
+    for y in range(200, size[1] - 200, 90):
+        draw.rectangle([200, y, size[0] - 400, y + 30], fill="black")
+    buffer = io.BytesIO()
+    image.rotate(angle, expand=True, fillcolor="white").save(buffer, format=fmt)
+    return buffer.getvalue()
+
+
+def test_image_is_downscaled_grayscale_and_deskewed():
+    image, angle = preprocess_image(skewed_page(-4, fmt="JPEG"), max_side=1000)
+    assert image.mode == "L"
+    assert angle == 4.0
+    assert max(image.size) < 1100  # expanded slightly by the straightening rotation
+
+
+def test_drug_names_are_found_after_forms_and_before_doses():
+    text = ("Rx\n1. Tab. Metformin 500 mg twice daily after meals\n2. Atorvastatin 20mg at bedtime\n"
+            "3. Inj Insulin glargine 10 units at night\n4. Metformin 500 mg\nTake 1 tablet daily. Qty 30")
+    assert extract_drug_names(text) == ["Metformin", "Atorvastatin", "Insulin glargine"]
+
+
+def test_images_over_the_pixel_limit_are_rejected_before_decoding(monkeypatch):
+    monkeypatch.setattr(Config, "OCR_MAX_PIXELS", 3000 * 2000)
+    with pytest.raises(ImageTooLargeError):
+        preprocess_image(skewed_page(0, size=(3000, 2100)))
+
+
+def test_ocr_results_are_cached_by_image_hash(tmp_path, monkeypatch, recording_backend):
+    monkeypatch.setattr(Config, "OCR_WORKERS", 0)
+    cache = PageCache(str(tmp_path))
+    data = skewed_page(3)
+
+    first = read_prescription(data, cache=cache, backend=recording_backend)
+    second = read_prescription(data, cache=cache, backend=recording_backend)
+    assert first["text"] == second["text"]
+    assert (first["cached"], second["cached"]) == (False, True)
+    assert len(RecordingOCR.calls) == 1
+    assert RecordingOCR.calls[0][0] == "L"
+    assert max(RecordingOCR.calls[0][1]) <= Config.OCR_MAX_SIDE * 1.1
+
+
+def test_registered_backends_run_in_the_worker_pool(recording_backend):
+    assert prescription.worker_pool.get()._mp_context.get_start_method() in ("forkserver", "spawn")
+    result = read_prescription(skewed_page(0, size=(800, 600)), backend=recording_backend)
+    assert result["text"].startswith("Tab. Metformin")
+    assert RecordingOCR.calls == []  # called in a worker process
+
+
+def test_analysis_uses_the_sessions_knowledge_base(app_env, monkeypatch, recording_backend):
+    monkeypatch.setattr(Config, "OCR_WORKERS", 0)
+    monkeypatch.setattr(Config, "OCR_BACKEND", recording_backend)
+    monkeypatch.setattr(app_env, "ocr_cache", None)
+    store = FAISS.from_texts(["Title: Metformin dosing in kidney disease\nAbstract: Reduce the dose below 45."],
+                             WordEmbeddings(), metadatas=[{"source": "pubmed", "pmid": "7"}])
+    app_env.session_registry.put("s1", store)
+    client = app_env.app.test_client()
+
+    response = client.post("/api/analyze_prescription", data={
+        "prescription": (io.BytesIO(skewed_page(0, size=(800, 600))), "rx.png"), "session_id": "s1"})
+    assert response.status_code == 200
+    assert response.json["drugs"] == ["Metformin", "Atorvastatin"]
+    assert [citation.get("pmid") for citation in response.json["citations"]] == ["7"]
+
+    monkeypatch.setattr(Config, "OCR_MAX_PIXELS", 1000)
+    response = client.post("/api/analyze_prescription", data={
+        "prescription": (io.BytesIO(skewed_page(0, size=(800, 600))), "rx.png")})
+    assert response.status_code == 413
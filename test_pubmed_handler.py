@@ -0,0 +1,90 @@
+import json
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlparse
+
+import pytest
+
+from sources.pubmed_handler import PubmedHandler
+from sources.rate_limit import TokenBucket
+
+ARTICLE = """<PubmedArticle>
+  <MedlineCitation><PMID>{pmid}</PMID><Article>
+    <Journal><JournalIssue><PubDate><Year>20{year:02d}</Year></PubDate></JournalIssue><Title>Kidney Int</Title></Journal>
+    <ArticleTitle>Metformin <i>trial</i> {pmid}</ArticleTitle>
+    <Abstract><AbstractText Label="METHODS">Cohort.</AbstractText><AbstractText Label="RESULTS">Lower HbA1c.</AbstractText></Abstract>
+    <AuthorList><Author><LastName>Smith</LastName><Initials>J</Initials></Author><Author><CollectiveName>CKD Group</CollectiveName></Author></AuthorList>
+    <PublicationTypeList><PublicationType>Journal Article</PublicationType></PublicationTypeList>
+  </Article></MedlineCitation>
+  <PubmedData><ArticleIdList><ArticleId IdType="doi">10.1/{pmid}</ArticleId></ArticleIdList></PubmedData>
+</PubmedArticle>"""
+
+
+class EutilsStub(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    total = 5
+    requests = []
+
+    def _reply(self, body, content_type):
+        body = body.encode("utf-8")
+        self.send_response(200)
+        self.send_header("Content-Type", content_type)
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def do_GET(self):
+        params = parse_qs(urlparse(self.path).query)
+        self.requests.append(("esearch", params))
+        self._reply(json.dumps({"esearchresult": {"count": str(self.total), "webenv": "ENV", "querykey": "1"}}),
+                    "application/json")
+
+    def do_POST(self):
+        params = parse_qs(self.rfile.read(int(self.headers["Content-Length"])).decode("utf-8"))
+        self.requests.append(("efetch", params))
+        start, size = int(params["retstart"][0]), int(params["retmax"][0])
+        articles = "".join(ARTICLE.format(pmid=1000 + i, year=i) for i in range(start, min(start + size, self.total)))
+        self._reply(f"<?xml version='1.0'?><PubmedArticleSet>{articles}</PubmedArticleSet>", "text/xml")
+
+    def log_message(self, *args):
+        pass
+
+
+@pytest.fixture
+def eutils():
+    EutilsStub.requests = []
+    server = ThreadingHTTPServer(("127.0.0.1", 0), EutilsStub)
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    yield f"http://127.0.0.1:{server.server_address[1]}"
+    server.shutdown()
+    server.server_close()
+
+
+def test_records_are_fetched_in_batches_with_metadata(eutils):
+    handler = PubmedHandler(base_url=eutils, max_results=4, batch_size=3, rate_limiter=TokenBucket(1000))
+    records = handler.fetch_data("metformin")
+
+    assert [record["metadata"]["pmid"] for record in records] == ["1000", "1001", "1002", "1003"]
+    assert records[1] == {
+        "page_content": "Title: Metformin trial 1001\nAbstract: Methods: Cohort. Results: Lower HbA1c.",
+        "metadata": {
+            "pmid": "1001", "title": "Metformin trial 1001", "journal": "Kidney Int", "year": 2001,
+            "authors": ["Smith J", "CKD Group"], "publication_types": ["Journal Article"],
+            "doi": "10.1/1001", "url": "https://pubmed.ncbi.nlm.nih.gov/1001/",
+        },
+    }
+    kinds = [kind for kind, _ in EutilsStub.requests]
+    assert kinds == ["esearch", "efetch", "efetch"]
+    assert EutilsStub.requests[0][1]["usehistory"] == ["y"]
+    assert [(p["retstart"], p["retmax"], p["WebEnv"]) for _, p in EutilsStub.requests[1:]] == [
+        (["0"], ["3"], ["ENV"]), (["3"], ["1"], ["ENV"]),
+    ]
+
+
+def test_token_bucket_spaces_out_requests():
+    now = [0.0]
+    bucket = TokenBucket(rate=2, capacity=2, clock=lambda: now[0], sleep=lambda s: now.__setitem__(0, now[0] + s))
+    waits = [bucket.acquire() for _ in range(5)]
+    assert waits[:2] == [0.0, 0.0]
+    assert waits[2:] == pytest.approx([0.5, 0.5, 0.5])
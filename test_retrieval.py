@@ -0,0 +1,66 @@
+from langchain_community.vectorstores import FAISS
+from langchain_core.embeddings import DeterministicFakeEmbedding
+
+from retrieval import BM25Index, HybridRetriever, reciprocal_rank_fusion, tokenize
+
+TEXTS = {
+    "a": "Title: Metformin 500 mg in type 2 diabetes\nMetformin lowers HbA1c in adults.",
+    "b": "Title: Insulin glargine dosing\nBasal insulin titration in type 2 diabetes.",
+    "c": "Title: BRCA1 mutation carriers\nRisk-reducing surgery in BRCA1 and BRCA2 carriers.",
+    "d": "Title: Tocilizumab in COVID-19\nIL-6 blockade reduced mortality in hospitalized patients.",
+}
+
+
+class StubReranker:
+    model = True
+
+    def __init__(self, order):
+        self.order = order
+
+    def affordable(self, budget):
+        return 1 << 30
+
+    def score(self, query, texts):
+        return [-self.order.index(text) for text in texts]
+
+
+def make_store():
+    ids = list(TEXTS)
+    return FAISS.from_texts([TEXTS[i] for i in ids], DeterministicFakeEmbedding(size=16), ids=ids)
+
+
+def test_tokenize_keeps_compound_terms_and_parts():
+    assert tokenize("IL-6 and COVID-19, 2.5mg") == ["il-6", "il", "6", "and", "covid-19", "covid", "19", "2.5mg", "2.5", "mg"]
+
+
+def test_bm25_ranks_exact_term_matches_first():
+    index = BM25Index()
+    index.add(list(TEXTS), list(TEXTS.values()))
+    assert index.search("brca1", 2)[0][0] == "c"
+    assert index.search("tocilizumab il-6", 4)[0][0] == "d"
+    assert index.search("unrelated", 4) == []
+
+
+def test_reciprocal_rank_fusion_rewards_agreement():
+    assert reciprocal_rank_fusion([["x", "y"], ["y", "z"]], k=60) == ["y", "x", "z"]
+
+
+def test_hybrid_retriever_finds_keyword_match_and_respects_k():
+    retriever = HybridRetriever.from_vector_store(make_store(), k=2, reranker=None)
+    docs = retriever.invoke("metformin")
+    assert len(docs) == 2
+    assert "Metformin" in docs[0].page_content or "Metformin" in docs[1].page_content
+
+
+def test_hybrid_retriever_reranks_candidates():
+    order = [TEXTS["b"], TEXTS["a"], TEXTS["c"], TEXTS["d"]]
+    retriever = HybridRetriever.from_vector_store(make_store(), k=2, reranker=StubReranker(order))
+    assert [doc.page_content for doc in retriever.invoke("diabetes")] == order[:2]
+
+
+def test_rerank_is_skipped_when_budget_is_spent():
+    order = [TEXTS["d"], TEXTS["c"], TEXTS["b"], TEXTS["a"]]
+    reranker = StubReranker(order)
+    reranker.affordable = lambda budget: 0
+    retriever = HybridRetriever.from_vector_store(make_store(), k=1, reranker=reranker, latency_budget=0.001)
+    assert retriever.invoke("brca1")[0].page_content == TEXTS["c"]
@@ -0,0 +1,76 @@
+import os
+import time
+
+import pytest
+from langchain_community.vectorstores import FAISS
+
+from conftest import StubSource, WordEmbeddings
+from index_store import POINTER_FILE
+from sessions import SessionRegistry
+
+TEXT = "Title: Metformin in chronic kidney disease\nAbstract: Dose by eGFR and stop below 30. " * 4
+
+
+def store(count=3):
+    return FAISS.from_texts([f"{TEXT} {i}" for i in range(count)], WordEmbeddings())
+
+
+def registry(tmp_path, **kwargs):
+    return SessionRegistry(root=str(tmp_path), embeddings=WordEmbeddings(), mmap=False, **kwargs)
+
+
+def test_session_is_restored_from_disk_by_another_registry(tmp_path):
+    registry(tmp_path).put("s1", store())
+    restored = registry(tmp_path).get("s1")
+    assert restored is not None
+    assert restored.vector_store.index.ntotal == 3
+    assert restored.retriever.invoke("metformin")
+
+
+def test_invalid_session_ids_are_rejected(tmp_path):
+    sessions = registry(tmp_path)
+    assert sessions.get("../outside") is None
+    assert sessions.get(None) is None
+    with pytest.raises(ValueError):
+        sessions.put("../outside", store())
+    assert not os.path.exists(tmp_path.parent / "outside")
+
+
+def test_sessions_unused_for_the_ttl_are_deleted(tmp_path):
+    registry(tmp_path, ttl=60).put("s1", store())
+    pointer = tmp_path / "s1" / POINTER_FILE
+    old = time.time() - 120
+    os.utime(pointer, (old, old))
+
+    assert registry(tmp_path, ttl=60).get("s1") is None
+    assert not (tmp_path / "s1").exists()
+
+
+def test_idle_sessions_are_spilled_to_disk(tmp_path):
+    sessions = registry(tmp_path, idle_seconds=60)
+    sessions.put("s1", store())
+    sessions.get("s1").last_used -= 120
+    sessions.put("s2", store())
+
+    assert "s1" not in sessions and "s2" in sessions
+    assert sessions.get("s1").vector_store.index.ntotal == 3
+
+
+def test_least_recently_used_sessions_are_spilled_over_the_memory_budget(tmp_path):
+    size = registry(tmp_path).put("probe", store()).size
+    sessions = registry(tmp_path, memory_budget=int(size * 2.5))
+    for session_id in ("s1", "s2", "s3"):
+        sessions.put(session_id, store())
+    sessions.get("s1")
+    sessions.put("s4", store())
+
+    assert [session_id in sessions for session_id in ("s1", "s2", "s3", "s4")] == [True, False, False, True]
+    assert sessions.memory_usage() <= size * 2.5
+    assert sessions.get("s2") is not None  # still on disk
+
+
+def test_build_of_empty_documents_reports_no_documents(app_env):
+    app_env.source_handlers.set("stub", StubSource({"metformin": ["", "  "]}))
+    events = list(app_env.build_knowledge_base_events("metformin", ["stub"], [], "s1"))
+    assert events[-1] == ("result", app_env.no_documents_result([]))
+    assert app_env.session_registry.get("s1") is None
@@ -0,0 +1,131 @@
+import threading
+import time
+
+import pytest
+
+from sources.base_handler import BaseSourceHandler
+from sources.cache import SourceCache, CachedSourceHandler, CachedSourceError
+
+
+class StubHandler(BaseSourceHandler):
+    def __init__(self, results=None, error=None, delay=0):
+        self.results = results or []
+        self.error = error
+        self.delay = delay
+        self.calls = 0
+
+    def fetch_data(self, query: str) -> list:
+        self.calls += 1
+        time.sleep(self.delay)
+        if self.error:
+            raise self.error
+        return list(self.results)
+
+
+class StaleReadCache(SourceCache):
+    """Misses the first lookup, as if it ran just before another caller stored its result."""
+
+    def __init__(self, path):
+        super().__init__(path)
+        self.stale_reads = 1
+
+    def get(self, source, query):
+        if self.stale_reads:
+            self.stale_reads -= 1
+            return None
+        return super().get(source, query)
+
+
+def make_handler(tmp_path, stub, ttl=60, negative_ttl=60):
+    cache = SourceCache(str(tmp_path / "sources.sqlite3"))
+    return CachedSourceHandler(stub, "stub", cache, ttl=ttl, negative_ttl=negative_ttl)
+
+
+def test_results_are_reused_for_normalized_query(tmp_path):
+    stub = StubHandler(["Title: A"])
+    handler = make_handler(tmp_path, stub)
+    assert handler.fetch_data("COVID-19  treatment") == ["Title: A"]
+    assert handler.fetch_data("covid-19 treatment ") == ["Title: A"]
+    assert stub.calls == 1
+
+
+def test_cache_persists_across_instances(tmp_path):
+    stub = StubHandler(["Title: A"])
+    make_handler(tmp_path, stub).fetch_data("q")
+    assert make_handler(tmp_path, stub).fetch_data("q") == ["Title: A"]
+    assert stub.calls == 1
+
+
+def test_expired_entries_are_refetched(tmp_path):
+    stub = StubHandler(["Title: A"])
+    handler = make_handler(tmp_path, stub, ttl=0.05)
+    handler.fetch_data("q")
+    time.sleep(0.1)
+    handler.fetch_data("q")
+    assert stub.calls == 2
+
+
+def test_empty_results_and_errors_are_negatively_cached(tmp_path):
+    empty = StubHandler([])
+    handler = make_handler(tmp_path, empty)
+    assert handler.fetch_data("q") == []
+    assert handler.fetch_data("q") == []
+    assert empty.calls == 1
+
+    failing = StubHandler(error=RuntimeError("rate limited"))
+    handler = CachedSourceHandler(failing, "failing", handler.cache, ttl=60, negative_ttl=60)
+    with pytest.raises(RuntimeError):
+        handler.fetch_data("q")
+    with pytest.raises(CachedSourceError, match="rate limited"):
+        handler.fetch_data("q")
+    assert failing.calls == 1
+
+
+def test_concurrent_identical_queries_share_one_upstream_call(tmp_path):
+    stub = StubHandler(["Title: A"], delay=0.2)
+    handler = make_handler(tmp_path, stub)
+    results = []
+    threads = [threading.Thread(target=lambda: results.append(handler.fetch_data("q"))) for _ in range(5)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert results == [["Title: A"]] * 5
+    assert stub.calls == 1
+    assert (handler.hits, handler.misses) == (0, 1)
+
+
+def test_result_stored_after_the_first_lookup_is_not_fetched_again(tmp_path):
+    path = str(tmp_path / "sources.sqlite3")
+    CachedSourceHandler(StubHandler(["Title: A"]), "stub", SourceCache(path), ttl=60, negative_ttl=60).fetch_data("q")
+    stub = StubHandler(["Title: B"])
+    handler = CachedSourceHandler(stub, "stub", StaleReadCache(path), ttl=60, negative_ttl=60)
+
+    assert handler.fetch_data("q") == ["Title: A"]
+    assert stub.calls == 0
+    assert (handler.hits, handler.misses) == (1, 0)
+
+
+def test_missing_wikipedia_pages_are_negatively_cached(tmp_path, monkeypatch):
+    import wikipedia
+    from sources.wikipedia_handler import WikipediaHandler
+
+    calls = []
+
+    def page(query):
+        calls.append(query)
+        if query == "mab":
+            raise wikipedia.exceptions.DisambiguationError("MAB", ["Monoclonal antibody", "Mab (band)"])
+        raise wikipedia.exceptions.PageError(query)
+
+    monkeypatch.setattr(wikipedia, "page", page)
+    cache = SourceCache(str(tmp_path / "sources.sqlite3"))
+    handler = CachedSourceHandler(WikipediaHandler(), "wikipedia", cache, ttl=3600, negative_ttl=0.05)
+    assert handler.fetch_data("mab") == []
+    assert handler.fetch_data("no such drug") == []
+    assert handler.fetch_data("no such drug") == []
+    assert calls == ["mab", "no such drug"]
+
+    time.sleep(0.1)
+    handler.fetch_data("no such drug")
+    assert len(calls) == 3
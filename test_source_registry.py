@@ -0,0 +1,60 @@
+import sys
+
+import pytest
+
+from sources.registry import SourceRegistry, default_target
+
+HANDLER = '''
+from sources.base_handler import BaseSourceHandler
+
+
+class {name}(BaseSourceHandler):
+    def fetch_data(self, query: str) -> list:
+        return [f"{module}: {{query}}"]
+'''
+
+
+@pytest.fixture
+def handler_modules(tmp_path, monkeypatch):
+    def write(module, name, imports=""):
+        (tmp_path / f"{module}.py").write_text(imports + HANDLER.format(name=name, module=module))
+        monkeypatch.delitem(sys.modules, module, raising=False)
+        return f"{module}:{name}"
+
+    monkeypatch.syspath_prepend(str(tmp_path))
+    return write
+
+
+def test_default_target_names_the_handler_module_and_class():
+    assert default_target("pubmed") == "sources.pubmed_handler:PubmedHandler"
+    assert default_target("google_scholar") == "sources.google_scholar_handler:GoogleScholarHandler"
+
+
+def test_handler_module_is_imported_on_first_use(handler_modules):
+    registry = SourceRegistry(wrap=lambda source, handler: (source, handler))
+    registry.register("lazy", handler_modules("lazy_test_handler", "LazyHandler"))
+    assert "lazy_test_handler" not in sys.modules
+    assert registry.loaded() == {}
+
+    source, handler = registry.get("lazy")
+    assert "lazy_test_handler" in sys.modules
+    assert source == "lazy"
+    assert handler.fetch_data("metformin") == ["lazy_test_handler: metformin"]
+    assert registry.get("lazy") == (source, handler)
+    assert registry.get("unknown") is None
+
+
+def test_import_error_only_disables_its_own_source(handler_modules):
+    registry = SourceRegistry()
+    registry.register("broken", handler_modules("broken_test_handler", "BrokenHandler",
+                                                imports="import missing_dependency_for_tests\n"))
+    registry.register("working", handler_modules("working_test_handler", "WorkingHandler"))
+
+    assert registry.get("broken") is None
+    assert registry.get("working").fetch_data("insulin") == ["working_test_handler: insulin"]
+    assert list(registry.errors()) == ["broken"]
+    assert "missing_dependency_for_tests" in registry.errors()["broken"]
+    assert list(registry.loaded()) == ["working"]
+    assert registry.names() == ["broken", "working"]
+    # The failure is remembered rather than retried on every request
+    assert registry.get("broken") is None
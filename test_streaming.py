@@ -0,0 +1,98 @@
+import json
+
+from langchain_core.language_models.fake_chat_models import FakeListChatModel
+from langchain_core.runnables import RunnableLambda
+
+from conftest import SUMMARY, StubSource
+from formatting import ChatResponseFormatter, format_chat_response, format_chat_section, parse_summary
+
+ANSWER = ("Direct Answer: Metformin is safe above an eGFR of 30.\n\n"
+          "Key Points:\n• Reduce the dose below 45.\n• Stop below 30.\n\n"
+          "Relevant References:\n[1] Smith J. Metformin trial.")
+RECORDS = [{"page_content": "Title: Metformin in kidney disease\nAbstract: Dose by eGFR.", "metadata": {"pmid": "1"}}]
+
+
+def sse_events(response):
+    events = []
+    for block in response.get_data(as_text=True).strip().split("\n\n"):
+        lines = dict(line.split(": ", 1) for line in block.split("\n"))
+        events.append((lines["event"], json.loads(lines["data"])))
+    return events
+
+
+def test_summary_sections_are_parsed():
+    parsed = parse_summary(SUMMARY)
+    assert parsed["Key words"] == "metformin, kidney"
+    assert parsed["Date range"] == "2001-2004"
+    assert parsed["Recommended approach"] == ["Check eGFR"]
+    assert parsed["References"] == ["Smith J. Metformin trial."]
+
+
+def test_chat_sections_are_formatted():
+    assert format_chat_section("Direct Answer: Yes.") == "<p>Yes.</p>"
+    assert format_chat_section("Key Points:\n• A\n• B") == "<h3>Key Points:</h3><ul><li>A</li>\n<li>B</li>\n</ul>"
+    assert format_chat_section("Relevant References:\n[N/A]") == \
+        "<h3>Relevant References:</h3><ol><li>No relevant references available</li></ol>"
+
+
+def test_streamed_sections_match_the_whole_answer_however_tokens_split():
+    # Tokens split inside the blank-line separators and the section markers
+    tokens = ["Direct Answer: Met", "formin is safe above an eGFR of 30.\n", "\nKey Po", "ints:\n• Reduce the dose",
+              " below 45.\n• Stop below 30.\n\nRelevant Ref", "erences:\n[1] Smith J. Metformin trial."]
+    formatter = ChatResponseFormatter()
+    text, sections = "", []
+    for token in tokens:
+        accepted, completed = formatter.feed(token)
+        text += accepted
+        sections.extend(completed)
+    assert len(sections) == 2  # the last section is only complete when the stream ends
+    sections.extend(formatter.finish())
+
+    assert text == ANSWER
+    assert "".join(sections) == format_chat_response(ANSWER)
+    character_formatter = ChatResponseFormatter()
+    by_character = [html for char in ANSWER for html in character_formatter.feed(char)[1]]
+    assert by_character + character_formatter.finish() == sections
+
+
+def test_streamed_answer_is_cut_at_the_word_limit():
+    formatter = ChatResponseFormatter(max_words=3)
+    assert formatter.feed("Direct Answer: Met") == ("Direct Answer: Met", [])
+    assert formatter.feed("formin is safe") == ("formin...", [])
+    assert formatter.truncated
+    assert formatter.feed(" more") == ("", [])
+    assert formatter.finish() == ["<p>Metformin...</p>"]
+
+
+def test_build_and_chat_streams_end_with_their_final_event(app_env):
+    app_env.llm.set(FakeListChatModel(responses=[SUMMARY, ANSWER]))
+    app_env.source_handlers.set("stub", StubSource({"metformin": RECORDS}))
+    client = app_env.app.test_client()
+
+    events = sse_events(client.post("/api/build_kb/stream",
+                                    data={"query": "metformin", "sources": ["stub"], "session_id": "s1"}))
+    kinds = [kind for kind, _ in events]
+    assert [data["stage"] for kind, data in events if kind == "progress"] == ["fetching", "embedding", "indexing",
+                                                                              "summarizing"]
+    assert kinds[-1] == "result" and set(kinds) == {"progress", "token", "result"}
+    assert "".join(data["text"] for kind, data in events if kind == "token") == SUMMARY
+    assert events[-1][1]["session_id"] == "s1"
+    assert "<strong>Key words:</strong> metformin, kidney" in events[-1][1]["summary"]
+
+    events = sse_events(client.post("/api/chat/stream", json={"session_id": "s1", "message": "Is it safe?"}))
+    assert events[-1] == ("done", {})
+    assert "".join(data["text"] for kind, data in events if kind == "token") == ANSWER
+    assert "".join(data["html"] for kind, data in events if kind == "section") == format_chat_response(ANSWER)
+
+
+def test_build_stream_ends_with_an_error_event_when_the_llm_fails(app_env):
+    def fail(_):
+        raise RuntimeError("model unavailable")
+
+    app_env.llm.set(RunnableLambda(fail))
+    app_env.source_handlers.set("stub", StubSource({"metformin": RECORDS}))
+    response = app_env.app.test_client().post("/api/build_kb/stream", data={"query": "metformin", "sources": ["stub"]})
+
+    events = sse_events(response)
+    assert events[-1][0] == "error"
+    assert "model unavailable" in events[-1][1]["error"]
@@ -0,0 +1,5 @@
+# wsgi.py
+# Entry point for WSGI servers: gunicorn -w 4 -k gthread --threads 8 wsgi:app
+from app import create_app
+
+app = create_app()